@@ -15,6 +15,10 @@ const GenerationRequestSchema = z.object({
         duration: z.number().optional(),
         fps: z.number().optional(),
         upscale: z.boolean().optional(),
+        // Speed/quality trade-off: diffuse keyframes and interpolate the rest (Python AI default when omitted)
+        interpolation: z.enum(['off', 'quality', 'balanced', 'fast']).optional(),
+        // Queue class on the Python AI: previews are served first, batch only when nothing else is waiting
+        priority: z.enum(['preview', 'final', 'batch']).optional(),
     }).optional(),
 });
 
@@ -58,7 +62,9 @@ export async function generationRoutes(fastify: FastifyInstance) {
                     id: generation.id,
                     prompt: body.prompt,
                     negative_prompt: body.negativePrompt,
-                    ...body.settings
+                    ...body.settings,
+                    // Per-user cap on active jobs (TENANT_MAX_JOBS)
+                    tenant: String(user.id)
                 };
 
                 if (body.type === 'image-to-video') {
@@ -71,9 +77,8 @@ export async function generationRoutes(fastify: FastifyInstance) {
 
                 logger.info(`Forwarding generation request ${generation.id} to Python AI at ${pythonApiUrl}`);
 
-                // Fire and forget, Python AI will update via webhook
-                axios.post(`${pythonApiUrl}/generate/${body.type === 'text-to-video' ? 'text' : 'image'}`, payload)
-                    .catch(err => fastify.log.error(`AI Service Async Error: ${err.message}`));
+                // Python AI only enqueues here (or answers 429); progress arrives via webhook
+                await axios.post(`${pythonApiUrl}/generate/${body.type === 'text-to-video' ? 'text' : 'image'}`, payload);
 
                 // Update status to processing
                 db.prepare('UPDATE Generation SET status = ? WHERE id = ?').run('processing', generation.id);
@@ -82,6 +87,16 @@ export async function generationRoutes(fastify: FastifyInstance) {
                 return reply.send(updated);
 
             } catch (aiError: any) {
+                if (aiError.response?.status === 429) {
+                    // Admission control: the queue is full or the user has too many active jobs
+                    const detail = aiError.response.data?.detail || {};
+                    const retryAfter = aiError.response.headers?.['retry-after'] || String(detail.retryAfter || 60);
+                    db.prepare('UPDATE Generation SET status = ?, error = ? WHERE id = ?')
+                        .run('failed', `Server busy (${detail.reason || 'overloaded'})`, generation.id);
+                    return reply.status(429).header('Retry-After', retryAfter)
+                        .send({ error: 'Server busy', reason: detail.reason, retryAfter: Number(retryAfter) });
+                }
+
                 fastify.log.error(`AI Service immediate failure: ${aiError.message}`);
 
                 db.prepare('UPDATE Generation SET status = ?, error = ? WHERE id = ?')
@@ -117,7 +132,7 @@ export async function generationRoutes(fastify: FastifyInstance) {
     // Webhook for Python AI to update status
     fastify.post('/webhook/update', async (request, reply) => {
         const body = request.body as any;
-        const { id, status, progress, resultUrl, error } = body;
+        const { id, status, progress, resultUrl, error, stage, stageProgress, step, totalSteps, stepsPerSecond, bytesSent, playlistUrl, segmentsReady, segments } = body;
 
         if (!id) return reply.status(400).send({ error: 'Missing ID' });
 
@@ -143,7 +158,11 @@ export async function generationRoutes(fastify: FastifyInstance) {
                 if (client.readyState === 1) {
                     client.send(JSON.stringify({
                         type: 'generation_update',
-                        data: generation
+                        data: generation,
+                        // Stage/step detail from the Python AI (not persisted)
+                        stage: stage ? { name: stage, progress: stageProgress, step, totalSteps, stepsPerSecond, bytesSent } : undefined,
+                        // Long videos: HLS playlist that grows as segments are uploaded
+                        playlist: playlistUrl ? { url: playlistUrl, segmentsReady, segments } : undefined
                     }));
                 }
             });
@@ -0,0 +1,252 @@
+"""
+End-to-end CPU benchmark of every AIEngine stage with stub models.
+
+Sustituye los modelos del registry por los stubs de benchmarks/stubs.py, el
+cliente S3 por uno local y los webhooks por un contador, y mide latencia y
+throughput de cada etapa (generación t2v/i2v, swap_faces, upscale_frames,
+export_video_nvenc, upload_file y run_pipeline completo) a varios niveles de
+concurrencia. La salida JSON sirve para comparar entre commits.
+
+Uso (desde backend/python-ai):
+    python benchmarks/engine_stages.py --frames 49 --steps 30 --concurrency 1,2,4 --output bench.json
+    python benchmarks/engine_stages.py --stages upscale_frames,export_video_nvenc --repeat 5
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+STAGES = [
+    "generation_t2v",
+    "generation_i2v",
+    "swap_faces",
+    "upscale_frames",
+    "export_video_nvenc",
+    "upload_file",
+    "run_pipeline",
+]
+
+
+def _configure_environment():
+    # Antes de importar la app: los módulos leen su configuración al importarse
+    os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+    os.environ.setdefault("EMBEDDED_WORKERS", "0")
+    os.environ.setdefault("JOB_QUEUE_BACKEND", "local")
+    if not os.getenv("FFMPEG_BIN") and not shutil.which("ffmpeg"):
+        try:
+            import imageio_ffmpeg
+            os.environ["FFMPEG_BIN"] = imageio_ffmpeg.get_ffmpeg_exe()
+        except ImportError:
+            pass
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))] if values else 0.0
+
+
+def measure(fn, frames_per_call: int, repeat: int, concurrency: int):
+    """Ejecuta fn repeat*concurrency veces con `concurrency` hilos."""
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(_):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    calls = repeat * concurrency
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(calls)))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "calls": calls,
+        "wall_seconds": round(wall, 4),
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "calls_per_second": round(calls / wall, 3),
+        "frames_per_second": round(calls * frames_per_call / wall, 2),
+    }
+
+
+def serve_image(image) -> str:
+    """Sirve una imagen por HTTP local (para faceImageUrl en run_pipeline)."""
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    data = buffer.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/face.png"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default="all", help=f"lista separada por comas de: {', '.join(STAGES)}")
+    parser.add_argument("--frames", type=int, default=49, help="frames T2V por trabajo")
+    parser.add_argument("--steps", type=int, default=30, help="pasos de denoising T2V")
+    parser.add_argument("--step-ms", type=float, default=0.0, help="retardo extra por paso (simula la GPU)")
+    parser.add_argument("--detect-ms", type=float, default=15.0)
+    parser.add_argument("--swap-ms", type=float, default=10.0)
+    parser.add_argument("--width", type=int, default=720)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--upscale", action="store_true", help="run_pipeline con upscale")
+    parser.add_argument("--face", action="store_true", help="run_pipeline con face swap")
+    parser.add_argument("--repeat", type=int, default=2, help="llamadas por hilo y nivel de concurrencia")
+    parser.add_argument("--concurrency", default="1,2", help="niveles de concurrencia, p.ej. 1,2,4")
+    parser.add_argument("--cpu-profile", action="store_true",
+                        help="run_pipeline con los pasos del perfil CPU (por defecto, los de GPU)")
+    parser.add_argument("--interpolation", choices=["off", "quality", "balanced", "fast"],
+                        help="modo de interpolación de run_pipeline (por defecto, INTERPOLATION_DEFAULT)")
+    parser.add_argument("--output", help="archivo JSON (por defecto stdout)")
+    args = parser.parse_args()
+
+    _configure_environment()
+    stages = STAGES if args.stages == "all" else [s.strip() for s in args.stages.split(",")]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    import torch
+    import stubs
+    from app.routers import text_to_video
+    from app.services import storage, video_encoder
+    from app.services import cpu_profile
+    from app.services.ai_engine import engine
+    from app.services.notifier import notifier
+
+    step_seconds = args.step_ms / 1000
+    if not args.cpu_profile:
+        # Los stubs corren en CPU, pero simulan el engine de GPU
+        cpu_profile.CPU_STEPS.update(cpu_profile.DEFAULT_STEPS)
+    t2v = stubs.StubVideoPipeline(args.width, args.height, args.frames, step_seconds)
+    i2v = stubs.StubVideoPipeline(1024, 576, 25, step_seconds, latent_channels=4)
+    face_models = (stubs.StubFaceAnalysis(args.detect_ms / 1000), stubs.StubFaceSwapper(args.swap_ms / 1000))
+    upscaler = stubs.StubUpscaler()
+    engine.models.register("t2v", lambda: t2v, replace=True)
+    # El stub también acepta video=/strength= como el pipeline de extensión (vídeos segmentados)
+    engine._extension_pipes[t2v] = t2v
+    engine.models.register("i2v", lambda: i2v, replace=True)
+    engine.models.register("face", lambda: face_models, replace=True)
+    engine.models.register("upscaler", lambda: upscaler, replace=True,
+                           promote=engine._move_upscaler(engine.device), demote=engine._move_upscaler("cpu"))
+
+    s3 = stubs.LocalS3Client()
+    storage._s3_client = s3
+    webhooks = stubs.RecordingNotifier()
+    notifier.notify = webhooks
+
+    frames = stubs.synthetic_frames(args.frames, args.width, args.height)
+    face_image = stubs.synthetic_frames(1, 512, 512, seed=7)[0]
+    encoded_path = None
+    results = {}
+
+    def record(name, fn, frames_per_call):
+        fn()  # calentamiento (carga del stub, caches)
+        results[name] = [measure(fn, frames_per_call, args.repeat, c) for c in levels]
+        best = results[name][-1]
+        print(f"{name:>20}: p50 {best['latency_p50_ms']:>9.1f} ms  {best['frames_per_second']:>8.1f} frames/s "
+              f"(concurrency {best['concurrency']})", file=sys.stderr)
+
+    try:
+        if "generation_t2v" in stages:
+            def generate_t2v():
+                with engine.models.use("t2v") as pipe:
+                    pipe("a fox", num_frames=args.frames, num_inference_steps=args.steps)
+            record("generation_t2v", generate_t2v, args.frames)
+
+        if "generation_i2v" in stages:
+            def generate_i2v():
+                with engine.models.use("i2v") as pipe:
+                    pipe(face_image, num_frames=25, num_inference_steps=25, decode_chunk_size=8)
+            record("generation_i2v", generate_i2v, 25)
+
+        if "swap_faces" in stages:
+            record("swap_faces", lambda: engine.swap_faces(frames, face_image), len(frames))
+
+        if "upscale_frames" in stages:
+            record("upscale_frames", lambda: engine.upscale_frames(frames), len(frames))
+
+        if "export_video_nvenc" in stages or "upload_file" in stages:
+            encoded_path = engine.export_video_nvenc(frames)
+
+        if "export_video_nvenc" in stages:
+            record("export_video_nvenc", lambda: os.remove(engine.export_video_nvenc(frames)), len(frames))
+
+        if "upload_file" in stages:
+            record("upload_file", lambda: storage.upload_file(encoded_path, f"bench/{uuid.uuid4()}.mp4"), len(frames))
+
+        if "run_pipeline" in stages:
+            face_url = serve_image(face_image) if args.face else None
+
+            def run_job():
+                job_id = f"bench-{uuid.uuid4()}"
+                request = text_to_video.GenerateRequest(
+                    id=job_id, prompt="a fox running through snow", duration=args.frames / 24,
+                    upscale=args.upscale, faceImageUrl=face_url, interpolation=args.interpolation,
+                )
+                text_to_video.run_pipeline(job_id, request)
+                status, error = webhooks.statuses.get(job_id, (None, None))
+                if status != "completed":
+                    raise RuntimeError(f"run_pipeline ended with {status}: {error}")
+            record("run_pipeline", run_job, int(args.frames / 24 * 24))
+    finally:
+        if encoded_path and os.path.exists(encoded_path):
+            os.remove(encoded_path)
+        s3.cleanup()
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": engine.device,
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "nvenc": video_encoder.nvenc_available(),
+        },
+        "stages": results,
+        # Cargas, promociones y último tiempo de cambio de cada modelo
+        "models": engine.models.stats()["models"],
+        "webhooks_sent": webhooks.count,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Fake OpenAI-compatible chat completions server (the path the Groq SDK uses),
+for benchmarking Magic Prompt without network, API keys or rate limits.
+
+Uso:
+    python benchmarks/fake_llm_server.py --port 8090 --latency 0.3 --tokens-per-second 200
+    GROQ_BASE_URL=http://127.0.0.1:8090 GROQ_API_KEY=fake uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+app.state.latency = 0.3
+app.state.tokens_per_second = 200.0
+app.state.tokens = 120
+app.state.calls = 0
+
+
+def _tokens(idea: str):
+    words = f"A cinematic, richly detailed shot of {idea}, golden hour light, shallow depth of field,".split()
+    return [(words[i % len(words)] + " ") for i in range(app.state.tokens)]
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.calls += 1
+    idea = body["messages"][-1]["content"]
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "fake")
+    tokens = _tokens(idea)
+    await asyncio.sleep(app.state.latency)
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(tokens) / app.state.tokens_per_second)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(idea.split()), "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        }
+
+    async def chunks():
+        for token in tokens:
+            await asyncio.sleep(1 / app.state.tokens_per_second)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        done = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@app.get("/calls")
+async def calls():
+    return {"calls": app.state.calls}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos hasta el primer token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=120)
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.tokens_per_second = args.tokens_per_second
+    app.state.tokens = args.tokens
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Import-time / cold-boot benchmark for the HTTP service.
+
+Mide en un intérprete limpio cuánto tarda `import app.main`, qué módulos
+pesan más (python -X importtime) y el tiempo hasta la primera respuesta de
+/health/. Falla (exit 1) si se supera el presupuesto o si el proceso HTTP
+importa alguna librería pesada de inferencia.
+
+Uso (desde backend/python-ai):
+    python benchmarks/import_time.py [--budget 1.5] [--top 15] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# No deben cargarse en el proceso HTTP: solo los workers (ai_engine) los necesitan
+HEAVY_MODULES = ["torch", "diffusers", "transformers", "realesrgan", "basicsr", "cv2", "insightface", "boto3", "groq"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    start = time.perf_counter()
+    status = client.get("/health/").status_code
+    first_health = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": imported,
+    "first_health_seconds": first_health,
+    "health_status": status,
+    "heavy_modules_loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr: str):
+    """Devuelve [(cumulative_us, module)] de la salida de -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.replace("import time:", "").split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5")))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="salida JSON")
+    args = parser.parse_args()
+
+    env = {**os.environ, "EMBEDDED_WORKERS": "0", "PYTHONPATH": SRC_DIR}
+    importtime = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True,
+    )
+    if importtime.returncode != 0:
+        sys.stderr.write(importtime.stderr)
+        return 2
+    rows = sorted(parse_importtime(importtime.stderr), reverse=True)
+
+    probe = subprocess.run([sys.executable, "-c", PROBE], cwd=SRC_DIR, env=env, capture_output=True, text=True)
+    if probe.returncode != 0:
+        sys.stderr.write(probe.stderr)
+        return 2
+    result = json.loads(probe.stdout.strip().splitlines()[-1])
+    result["budget_seconds"] = args.budget
+    result["slowest_imports"] = [{"module": name.strip(), "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:args.top]]
+    result["ok"] = result["import_seconds"] <= args.budget and not result["heavy_modules_loaded"]
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import app.main:     {result['import_seconds']:.3f}s (budget {args.budget:.2f}s)")
+        print(f"first GET /health/:  {result['first_health_seconds'] * 1000:.1f}ms -> {result['health_status']}")
+        print(f"heavy modules:       {', '.join(result['heavy_modules_loaded']) or 'none'}")
+        print("slowest imports (cumulative):")
+        for row in result["slowest_imports"]:
+            print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Magic Prompt benchmark against benchmarks/fake_llm_server.py.
+
+Arranca el servidor LLM falso y la API en hilos locales, lanza N peticiones
+con C en paralelo sobre D ideas distintas (las repetidas prueban caché y
+coalescing) y mide latencia, tiempo hasta el primer token (SSE), llamadas
+reales al LLM y la latencia de /health/ durante la carga (event loop libre).
+
+Uso (desde backend/python-ai):
+    python benchmarks/magic_prompt.py --requests 200 --concurrency 32 --distinct 20 [--stream] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+
+def serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run(args, api_url: str):
+    import httpx
+
+    latencies, first_tokens, health = [], [], []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=api_url, timeout=120) as client:
+        async def one(i):
+            body = {"user_idea": f"  A fox running through snow #{i % args.distinct} "}
+            async with semaphore:
+                start = time.perf_counter()
+                if args.stream:
+                    async with client.stream("POST", "/magic-prompt/stream", json=body) as response:
+                        first = None
+                        async for line in response.aiter_lines():
+                            if first is None and line.startswith("data:"):
+                                first = time.perf_counter() - start
+                        first_tokens.append(first or 0.0)
+                else:
+                    response = await client.post("/magic-prompt", json=body)
+                    response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        async def probe_health():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health/")
+                health.append(time.perf_counter() - start)
+                await asyncio.sleep(0.02)
+
+        prober = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+        stats = (await client.get("/health/magic-prompt")).json()
+
+    return {
+        "mode": "stream" if args.stream else "expand",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "distinct_ideas": args.distinct,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(args.requests / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "first_token_p50_ms": round(percentile(first_tokens, 0.5) * 1000, 1) if first_tokens else None,
+        "health_p50_ms": round(percentile(health, 0.5) * 1000, 1),
+        "health_max_ms": round(max(health) * 1000, 1) if health else 0.0,
+        "health_mean_ms": round(statistics.mean(health) * 1000, 1) if health else 0.0,
+        "llm_calls": stats["llm_calls"],
+        "cache_hits": stats["hits"],
+        "coalesced": stats["coalesced"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-port", type=int, default=8090)
+    parser.add_argument("--api-port", type=int, default=8091)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    # Antes de importar la app: prompt_expander lee la configuración al importarse
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    os.environ["EMBEDDED_WORKERS"] = "0"
+
+    import fake_llm_server
+    from app.main import app
+
+    fake_llm_server.app.state.latency = args.llm_latency
+    serve(fake_llm_server.app, args.llm_port)
+    serve(app, args.api_port)
+
+    result = asyncio.run(run(args, f"http://127.0.0.1:{args.api_port}"))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Lightweight stand-ins for the heavy models used by AIEngine, so every stage
+of the service can be benchmarked on a CPU-only box without downloads.
+
+Los stubs respetan las interfaces que usa el engine (pipelines de diffusers,
+RealESRGANer, FaceAnalysis/INSwapper y el cliente S3) y hacen trabajo real
+de CPU de tamaño parecido donde importa (latentes por paso, red de upscale,
+recortes de cara), más un retardo configurable para simular la GPU.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+
+
+def synthetic_frames(num_frames: int, width: int, height: int, seed: int = 0) -> List[Image.Image]:
+    """Frames con movimiento (gradiente desplazándose + ruido) para que el encoder trabaje de verdad."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = []
+    for t in range(num_frames):
+        r = (x + 4 * t) % 256 + 0 * y
+        g = (y + 3 * t) % 256 + 0 * x
+        b = ((x + y) / 2 + 2 * t) % 256
+        frame = np.stack([r, g, b], axis=-1)
+        frame += rng.normal(0, 6, frame.shape).astype(np.float32)
+        frames.append(Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8)))
+    return frames
+
+
+@dataclass
+class _PipelineOutput:
+    frames: List[List[Image.Image]]
+
+
+class StubVideoPipeline:
+    """
+    Mimics CogVideoXPipeline / StableVideoDiffusionPipeline: runs a small conv
+    over a latent of the real shape on every denoising step, calls
+    callback_on_step_end, and returns frames of the model's native size.
+    """
+
+    def __init__(self, width: int, height: int, default_frames: int, step_seconds: float = 0.0,
+                 latent_channels: int = 16):
+        self.width = width
+        self.height = height
+        self.default_frames = default_frames
+        self.step_seconds = step_seconds
+        self.latent_channels = latent_channels
+        self.denoiser = nn.Conv3d(latent_channels, latent_channels, 3, padding=1).eval()
+        # "T5": un MLP sobre tokens de bytes, para que saltarse el encoder se note en el benchmark
+        self.text_encoder = nn.Sequential(nn.Embedding(256, 256), nn.Linear(256, 1024), nn.GELU(), nn.Linear(1024, 256)).eval()
+        self.encode_calls = 0
+        self.components = {}
+        self._execution_device = torch.device("cpu")
+
+    @torch.no_grad()
+    def encode_prompt(self, prompt, negative_prompt=None, do_classifier_free_guidance=True, device=None,
+                      max_sequence_length: int = 226, **kwargs):
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        self.encode_calls += len(prompts)
+        tokens = torch.zeros((len(prompts), max_sequence_length), dtype=torch.long)
+        for i, text in enumerate(prompts):
+            data = list((text or "").encode()[:max_sequence_length])
+            tokens[i, :len(data)] = torch.tensor(data, dtype=torch.long)
+        return self.text_encoder(tokens), None
+
+    @torch.no_grad()
+    def __call__(self, prompt=None, *args, num_frames: Optional[int] = None, num_inference_steps: int = 30,
+                 generator=None, callback_on_step_end=None, **kwargs):
+        # video= (CogVideoXVideoToVideoPipeline): tantos frames como el vídeo, pasos según strength
+        video = kwargs.get("video")
+        if video is not None:
+            num_frames = len(video)
+            num_inference_steps = int(num_inference_steps * kwargs.get("strength", 0.8))
+        num_frames = num_frames or self.default_frames
+        latent_frames = (num_frames - 1) // 4 + 1
+        # Lista de prompts / prompt_embeds (y de generators) = una llamada por lotes, como en diffusers
+        prompt_embeds = kwargs.get("prompt_embeds")
+        if prompt is None and prompt_embeds is not None:
+            batch_size = prompt_embeds.shape[0]
+        else:
+            batch_size = len(prompt) if isinstance(prompt, list) else 1
+            if self.latent_channels == 16:
+                self.encode_prompt(prompt)
+        generators = generator if isinstance(generator, list) else [generator] * batch_size
+        shape = (1, self.latent_channels, latent_frames, self.height // 8, self.width // 8)
+        latents = torch.cat([torch.randn(shape, generator=g) for g in generators])
+        for step in range(num_inference_steps):
+            latents = latents - 0.01 * self.denoiser(latents)
+            if self.step_seconds:
+                time.sleep(self.step_seconds)
+            if callback_on_step_end:
+                callback_on_step_end(self, step, num_inference_steps - step, {})
+        seeds = [int(latent.flatten()[0].abs().item() * 1000) % 1000 for latent in latents]
+        return _PipelineOutput(frames=[synthetic_frames(num_frames, self.width, self.height, seed=s) for s in seeds])
+
+
+class StubUpscaler:
+    """RealESRGANer stand-in (x2): conv + pixel shuffle, run through the real BatchedUpscaler."""
+
+    def __init__(self, scale: int = 2, features: int = 16):
+        self.scale = scale
+        self.half = False
+        self.device = torch.device("cpu")
+        self.model = nn.Sequential(
+            nn.Conv2d(3, features, 3, padding=1),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(features, 3 * scale * scale, 3, padding=1),
+            nn.PixelShuffle(scale),
+        ).eval()
+
+
+class StubFace(dict):
+    """Como insightface.app.common.Face: un dict con acceso por atributo y None para lo que no tiene."""
+
+    def __init__(self, d=None, **kwargs):
+        super().__init__()
+        for key, value in dict(d or {}, **kwargs).items():
+            setattr(self, key, value)
+        if "normed_embedding" not in self:
+            self.normed_embedding = np.ones(512, dtype=np.float32) / np.sqrt(512)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        super().__setitem__(name, value)
+
+    __setitem__ = __setattr__
+
+    def __getattr__(self, name):
+        return None
+
+
+class StubFaceAnalysis:
+    """FaceAnalysis.get(): a fixed face in the middle of the frame after `detect_seconds`."""
+
+    def __init__(self, detect_seconds: float = 0.015):
+        self.detect_seconds = detect_seconds
+        self.calls = 0
+
+    def get(self, img_bgr: np.ndarray):
+        self.calls += 1
+        if self.detect_seconds:
+            time.sleep(self.detect_seconds)
+        height, width = img_bgr.shape[:2]
+        cx, cy, size = width / 2, height / 2, min(width, height) / 4
+        bbox = np.array([cx - size, cy - size, cx + size, cy + size], dtype=np.float32)
+        kps = np.array([
+            [cx - size / 3, cy - size / 4], [cx + size / 3, cy - size / 4], [cx, cy],
+            [cx - size / 4, cy + size / 3], [cx + size / 4, cy + size / 3],
+        ], dtype=np.float32)
+        return [StubFace(bbox=bbox, kps=kps)]
+
+
+class StubFaceSwapper:
+    """INSwapper.get(): 128x128 warp of the face crop and paste back, plus `swap_seconds`."""
+
+    def __init__(self, swap_seconds: float = 0.01):
+        self.swap_seconds = swap_seconds
+
+    def get(self, img_bgr: np.ndarray, target_face, source_face, paste_back: bool = True):
+        import cv2
+
+        if self.swap_seconds:
+            time.sleep(self.swap_seconds)
+        x0, y0, x1, y1 = [int(v) for v in target_face.bbox]
+        x0, y0 = max(x0, 0), max(y0, 0)
+        crop = img_bgr[y0:y1, x0:x1]
+        if crop.size == 0:
+            return img_bgr
+        aligned = cv2.resize(crop, (128, 128), interpolation=cv2.INTER_LINEAR)
+        swapped = cv2.GaussianBlur(aligned, (5, 5), 0)
+        result = img_bgr.copy()
+        result[y0:y1, x0:x1] = cv2.resize(swapped, (crop.shape[1], crop.shape[0]))
+        return result
+
+
+class LocalS3Client:
+    """
+    Subset of the boto3 S3 client used by storage.py, writing objects to a
+    local directory in multipart-sized chunks and reporting bytes through
+    Callback, so upload_file/upload_stream can be timed without S3.
+    """
+
+    def __init__(self, root: Optional[str] = None, chunk_size: int = 8 * 1024 * 1024):
+        self.root = root or tempfile.mkdtemp(prefix="viarteia-s3-")
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+
+    def _path(self, bucket: str, key: str) -> str:
+        path = os.path.join(self.root, bucket, key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def upload_fileobj(self, fileobj, bucket, key, Config=None, Callback=None, ExtraArgs=None):
+        chunk_size = getattr(Config, "multipart_chunksize", self.chunk_size)
+        with open(self._path(bucket, key), "wb") as out:
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    break
+                out.write(chunk)
+                if Callback:
+                    Callback(len(chunk))
+
+    def upload_file(self, filename, bucket, key, Config=None, Callback=None, ExtraArgs=None):
+        with open(filename, "rb") as f:
+            self.upload_fileobj(f, bucket, key, Config=Config, Callback=Callback, ExtraArgs=ExtraArgs)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class RecordingNotifier:
+    """Replaces notifier.notify: counts webhooks instead of posting to the Node API."""
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, job_id, status, progress, result_url=None, error=None, **extra):
+        with self._lock:
+            self.count += 1
+            self.statuses[job_id] = (status, error)
@@ -3,8 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
 
-from app.routers import text_to_video, image_to_video, health, magic_prompt
-from app.services.ai_engine import engine
+from app.routers import text_to_video, image_to_video, health, jobs, magic_prompt, metrics
+from app.services.notifier import notifier
+from app.worker import EMBEDDED_WORKERS, start_embedded_workers
 
 # Configure logging
 logging.basicConfig(
@@ -34,7 +35,9 @@ app.add_middleware(
 app.include_router(health.router, prefix="/health", tags=["health"])
 app.include_router(text_to_video.router, prefix="/generate", tags=["generation"])
 app.include_router(image_to_video.router, prefix="/generate", tags=["generation"])
+app.include_router(jobs.router, prefix="/jobs", tags=["generation"])
 app.include_router(magic_prompt.router, tags=["ai"])
+app.include_router(metrics.router, tags=["metrics"])
 
 @app.on_event("startup")
 async def startup_event():
@@ -50,15 +53,21 @@ async def startup_event():
     # Setup Ngrok if token is provided
     ngrok_token = os.getenv("NGROK_AUTH_TOKEN")
     if ngrok_token:
+        from app.services.ai_engine import engine
         public_url = engine.setup_ngrok(ngrok_token)
         if public_url:
             logger.info(f"✅ Ngrok tunnel active at: {public_url}")
+
+    # Workers dentro del proceso HTTP solo en modo local; en producción corren aparte (python -m app.worker)
+    app.state.worker_stop = start_embedded_workers(EMBEDDED_WORKERS)
     
     logger.info("✅ Startup complete")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("👋 Shutting down ViarteIA Python AI API")
+    app.state.worker_stop.set()
+    notifier.flush(timeout=5)
     # TODO: Cleanup GPU resources
 
 if __name__ == "__main__":
@@ -1,5 +1,21 @@
-from fastapi import APIRouter
-import torch
+from fastapi import APIRouter, Response
+from fastapi.concurrency import run_in_threadpool
+import os
+from typing import Any, Dict
+from ..services.image_fetch import image_fetcher
+from ..services.job_queue import JOB_QUEUE_BACKEND, get_job_queue
+from ..services.model_registry import DEVICE, HOST
+from ..services.notifier import notifier
+from ..services.prompt_expander import prompt_expander
+from ..services.result_cache import get_result_cache
+
+# torch se importa dentro de /gpu: el proceso HTTP arranca sin cargarlo.
+# Encode, upscale, throughput y modelos son de los workers: se leen de su heartbeat (app.worker.worker_stats).
+
+# Modelos que algún worker debe tener cargados para considerar el servicio listo
+READY_MODELS = [
+    name.strip() for name in os.getenv("READY_MODELS", os.getenv("WARMUP_MODELS", "")).split(",") if name.strip()
+]
 
 router = APIRouter()
 
@@ -12,9 +28,33 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@router.get("/ready")
+async def readiness(response: Response):
+    """Readiness: hay workers vivos y los modelos de READY_MODELS están cargados en alguno (503 si no)"""
+    workers = await run_in_threadpool(get_job_queue().workers)
+    warm = {
+        name
+        for info in workers.values()
+        for name, state in info.get("models", {}).items()
+        if state in (DEVICE, HOST)
+    }
+    missing = [name for name in READY_MODELS if name not in warm]
+    ready = bool(workers) and not missing
+    if not ready:
+        response.status_code = 503
+    return {
+        "ready": ready,
+        "workers": len(workers),
+        "warm_models": sorted(warm),
+        "missing_models": missing,
+        "detail": workers,
+    }
+
 @router.get("/gpu")
 async def gpu_status():
     """Check GPU availability and status"""
+    import torch
+
     cuda_available = torch.cuda.is_available()
     
     if cuda_available:
@@ -31,3 +71,77 @@ async def gpu_status():
             "cuda_available": False,
             "message": "CUDA not available, using CPU"
         }
+
+@router.get("/queue")
+async def queue_status():
+    """Job queue depth (queued / processing) and queued jobs per priority class"""
+    depth = await run_in_threadpool(get_job_queue().depth)
+    lanes = await run_in_threadpool(get_job_queue().lanes)
+    return {"backend": JOB_QUEUE_BACKEND, **depth, "lanes": lanes}
+
+async def _worker_stats(section: str) -> Dict[str, Any]:
+    """La sección `section` de las estadísticas que publica cada worker vivo (hasta WORKER_HEARTBEAT_INTERVAL de retraso)."""
+    workers = await run_in_threadpool(get_job_queue().workers)
+    return {
+        worker_id: info["stats"][section]
+        for worker_id, info in workers.items()
+        if (info.get("stats") or {}).get(section) is not None
+    }
+
+def _totals(per_worker: Dict[str, Dict[str, Any]], keys) -> Dict[str, float]:
+    return {key: sum(stats.get(key, 0) for stats in per_worker.values()) for key in keys}
+
+@router.get("/encoder")
+async def encoder_status():
+    """Video encode timings (streaming ffmpeg), summed over live workers"""
+    workers = await _worker_stats("encoder")
+    totals = _totals(workers, ("count", "frames", "total_seconds", "nvenc_failures"))
+    totals["avg_seconds"] = totals["total_seconds"] / totals["count"] if totals["count"] else 0.0
+    return {**totals, "workers": workers}
+
+@router.get("/models")
+async def models_status():
+    """Model residency, memory budget and load/hit/evict counters of each live worker"""
+    return {"workers": await _worker_stats("models")}
+
+@router.get("/upscaler")
+async def upscaler_status():
+    """Batched Real-ESRGAN timings, summed over live workers"""
+    workers = await _worker_stats("upscaler")
+    totals = _totals(workers, ("count", "frames", "total_seconds"))
+    totals["avg_per_frame_seconds"] = totals["total_seconds"] / totals["frames"] if totals["frames"] else 0.0
+    return {**totals, "workers": workers}
+
+@router.get("/cache")
+async def result_cache_status():
+    """Result cache size and hit rate"""
+    return await run_in_threadpool(get_result_cache().stats)
+
+@router.get("/notifier")
+async def notifier_status():
+    """Webhook delivery latency, coalescing and retry counters"""
+    return notifier.snapshot()
+
+@router.get("/throughput")
+async def throughput_status():
+    """Measured denoising throughput (steps/s) per model, over all live workers"""
+    merged: Dict[str, Dict[str, float]] = {}
+    for stats in (await _worker_stats("throughput")).values():
+        for model, entry in stats.items():
+            total = merged.setdefault(model, {"steps": 0, "seconds": 0.0})
+            total["steps"] += entry["steps"]
+            total["seconds"] += entry["seconds"]
+    return {
+        model: {**entry, "steps_per_second": entry["steps"] / entry["seconds"] if entry["seconds"] else 0.0}
+        for model, entry in merged.items()
+    }
+
+@router.get("/inputs")
+async def input_fetch_status():
+    """Input image downloads and decoded-image cache"""
+    return image_fetcher.snapshot()
+
+@router.get("/magic-prompt")
+async def magic_prompt_status():
+    """Magic Prompt: cache hit rate, coalesced requests and LLM latency"""
+    return prompt_expander.snapshot()
@@ -1,20 +1,20 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
-import asyncio
-import httpx
-import os
-import requests
-import requests
-from io import BytesIO
-from PIL import Image
-from ..services.ai_engine import engine
-from ..services.storage import upload_file
+from typing import Literal, Optional
+from ..services.admission import AdmissionRejected, submit
+from ..services.cancellation import CancelToken, JobCancelled, job_deadline
+from ..services.image_fetch import FACE_IMAGE_MAX_SIDE, image_fetcher
+from ..services.interpolation import InterpolationName, interpolation_mode
+from ..services.job_queue import DEFAULT_PRIORITY, Job, get_job_queue
+from ..services.model_registry import I2V_MODEL_ID
+from ..services.notifier import notify_node_api
+from ..services.result_cache import RESULT_CACHE_ENABLED, get_result_cache, result_cache_key
+from ..services.progress import JobProgress
+from .jobs import rejected
 
 router = APIRouter()
 
-NODE_API_URL = os.getenv("NODE_API_URL", "http://localhost:3001")
-
 class GenerateImageRequest(BaseModel):
     id: str
     imageUrl: str
@@ -26,77 +26,105 @@ class GenerateImageRequest(BaseModel):
     seed: Optional[int] = -1
     upscale: Optional[bool] = False
     faceImageUrl: Optional[str] = None
+    # Calidad/velocidad: keyframes por difusión y el resto interpolado (None = INTERPOLATION_DEFAULT, "off" = sin interpolar)
+    interpolation: Optional[InterpolationName] = None
+    # Clase de la cola: preview (sale antes) | final | batch (solo cuando no hay nada más)
+    priority: Optional[Literal["preview", "final", "batch"]] = DEFAULT_PRIORITY
+    # Usuario/cliente que lo pide, para el límite de trabajos activos por tenant (TENANT_MAX_JOBS)
+    tenant: Optional[str] = None
+    # Segundos desde que se encola hasta cancelarse solo (None = JOB_DEFAULT_TIMEOUT)
+    timeout: Optional[float] = None
 
-async def notify_node_api(job_id: str, status: str, progress: int, result_url: Optional[str] = None, error: Optional[str] = None):
-    webhook_url = f"{NODE_API_URL}/api/generations/webhook/update"
-    payload = {
-        "id": job_id,
-        "status": status,
-        "progress": progress
+def image_cache_key(request: GenerateImageRequest, image_hash: str, face_hash: Optional[str] = None) -> Optional[str]:
+    """Clave de la caché de resultados; None si la generación no es determinista."""
+    if not RESULT_CACHE_ENABLED or request.seed is None or request.seed == -1:
+        return None
+    params = {
+        "fps": request.fps or 24,
+        "seed": request.seed,
+        "upscale": bool(request.upscale),
+        "interpolation": interpolation_mode(request.interpolation).name,
     }
-    if result_url:
-        payload["resultUrl"] = result_url
-    if error:
-        payload["error"] = error
+    return result_cache_key("image", I2V_MODEL_ID, params, image_hash, face_hash)
 
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(webhook_url, json=payload)
-    except Exception as e:
-        print(f"Failed to notify Node API: {e}")
+def run_pipeline(job_id: str, request: GenerateImageRequest, is_last_attempt: bool = True, engine=None,
+                 cancel: Optional[CancelToken] = None):
+    if engine is None:
+        from ..services.ai_engine import engine
 
-def run_pipeline(job_id: str, request: GenerateImageRequest):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
+    progress = JobProgress(job_id, kind="image", cancel=cancel)
     try:
-        loop.run_until_complete(notify_node_api(job_id, "processing", 10))
+        progress.update("download", 0.0)
         
         print(f"Downloading source image from {request.imageUrl}")
-        response = requests.get(request.imageUrl)
-        response.raise_for_status()
-        
-        # Prepare Image for SVD (Needs specific resolution, resizing simply for MVP)
-        init_image = Image.open(BytesIO(response.content)).convert("RGB")
-        init_image = init_image.resize((1024, 576))
-        
-        # Download face image if provided
-        face_img = None
-        if request.faceImageUrl:
-            print(f"Downloading face image from {request.faceImageUrl}")
-            face_resp = requests.get(request.faceImageUrl)
-            face_img = Image.open(BytesIO(face_resp.content)).convert("RGB")
+        # Imagen de origen y cara (si la hay) en paralelo, ya decodificadas.
+        # SVD needs a specific resolution, resizing simply for MVP
+        source, face = image_fetcher.fetch(
+            (request.imageUrl, (1024, 576), None),
+            (request.faceImageUrl, None, FACE_IMAGE_MAX_SIDE),
+        )
+        init_image = source.image
+        face_img = face.image if face else None
+        face_hash = face.sha256 if face else None
+
+        progress.update("download", 1.0)
+
+        cache_key = image_cache_key(request, source.sha256, face_hash)
+        if cache_key:
+            cached_url = get_result_cache().get(cache_key)
+            if cached_url:
+                print(f"Result cache hit for job {job_id}")
+                progress.finish("cached")
+                notify_node_api(job_id, "completed", 100, result_url=cached_url)
+                return
 
         print(f"Starting I2V generation for job {job_id}")
-        loop.run_until_complete(notify_node_api(job_id, "processing", 20))
 
-        video_path = engine.generate_image_to_video(
+        s3_url = engine.generate_image_to_video(
             image=init_image,
             seed=request.seed,
             fps=request.fps or 24,
             upscale=request.upscale,
-            face_image=face_img
+            face_image=face_img,
+            upload_object=f"generations/{job_id}.mp4",
+            progress=progress,
+            interpolation=request.interpolation
         )
-        
-        loop.run_until_complete(notify_node_api(job_id, "processing", 90))
-        print(f"Uploading video {video_path} to S3...")
-        s3_url = upload_file(video_path, object_name=f"generations/{job_id}.mp4")
-        
+
         if not s3_url:
             raise Exception("Failed to upload video to S3")
 
-        loop.run_until_complete(notify_node_api(job_id, "completed", 100, result_url=s3_url))
-        
-        if os.path.exists(video_path):
-            os.remove(video_path)
-            
+        if cache_key and engine.shares_results:
+            get_result_cache().put(cache_key, s3_url)
+
+        progress.finish("completed")
+        notify_node_api(job_id, "completed", 100, result_url=s3_url)
+
+    except JobCancelled as e:
+        # Cancelado o fuera de plazo: sin reintentos; el engine ya borró sus archivos temporales
+        print(f"Job {job_id} stopped: {e}")
+        progress.finish("cancelled")
+        notify_node_api(job_id, "cancelled", progress.progress, error=str(e))
+        return "cancelled"
     except Exception as e:
         print(f"Error in I2V pipeline: {e}")
-        loop.run_until_complete(notify_node_api(job_id, "failed", 0, error=str(e)))
-    finally:
-        loop.close()
+        if not is_last_attempt:
+            progress.finish("retried")
+            raise
+        progress.finish("failed")
+        notify_node_api(job_id, "failed", 0, error=str(e))
+        return "failed"
 
 @router.post("/image")
-async def generate_image_to_video(request: GenerateImageRequest, background_tasks: BackgroundTasks):
-    background_tasks.add_task(run_pipeline, request.id, request)
-    return {"status": "queued", "jobId": request.id}
+async def generate_image_to_video(request: GenerateImageRequest):
+    job_queue = get_job_queue()
+    job = Job(id=request.id, kind="image", payload=request.model_dump(), deadline=job_deadline(request.timeout),
+              priority=request.priority or DEFAULT_PRIORITY, tenant=request.tenant)
+    try:
+        estimate = await run_in_threadpool(submit, job, job_queue)
+    except AdmissionRejected as e:
+        raise rejected(request.id, e)
+    if estimate is None:
+        return {"status": "duplicate", "jobId": request.id, "jobStatus": await run_in_threadpool(job_queue.status, request.id)}
+    return {"status": "queued", "jobId": request.id, "queue": await run_in_threadpool(job_queue.depth),
+            "estimatedWaitSeconds": estimate["estimatedWaitSeconds"]}
@@ -0,0 +1,50 @@
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from ..services.admission import AdmissionRejected, estimate_wait
+from ..services.job_queue import DEFAULT_PRIORITY, get_job_queue
+from ..services.notifier import notify_node_api
+
+router = APIRouter()
+
+def rejected(job_id: str, error: AdmissionRejected) -> HTTPException:
+    """429 de una petición de /generate que el control de admisión no encoló."""
+    return HTTPException(
+        status_code=429,
+        detail={"status": "rejected", "jobId": job_id, "reason": error.reason, "message": str(error),
+                "retryAfter": error.retry_after, "estimatedWaitSeconds": error.estimate["estimatedWaitSeconds"]},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+# Antes de /{job_id}: si no, "estimate" se tomaría por un id
+@router.get("/estimate")
+async def wait_estimate(priority: Literal["preview", "final", "batch"] = DEFAULT_PRIORITY):
+    """
+    Espera estimada de un trabajo nuevo de esa clase (trabajos por delante /
+    throughput medido de los workers vivos); null si no hay workers.
+    """
+    return await run_in_threadpool(estimate_wait, priority)
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    """Estado del trabajo en la cola (queued, processing, completed, failed, cancelled)"""
+    status = await run_in_threadpool(get_job_queue().status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"jobId": job_id, "status": status}
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancela un trabajo. Si seguía en la cola se retira y se notifica ya; si
+    está en proceso, el worker lo corta en el siguiente paso de denoising (o
+    antes de la siguiente etapa) y notifica "cancelled" al parar.
+    """
+    status = await run_in_threadpool(get_job_queue().cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status == "cancelled":
+        notify_node_api(job_id, "cancelled", 0, error="cancelled by request")
+    return {"jobId": job_id, "status": status, "cancelled": status in ("cancelled", "cancelling")}
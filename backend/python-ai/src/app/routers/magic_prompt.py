@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import os
+import json
 import logging
-from groq import Groq
+
+from ..services.prompt_expander import MagicPromptConfigError, prompt_expander
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -11,40 +13,48 @@ router = APIRouter()
 
 class MagicPromptRequest(BaseModel):
     user_idea: str
+    fresh: bool = False  # ignorar la caché y pedir una expansión nueva
+
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
 @router.post("/magic-prompt")
 async def generate_magic_prompt(request: MagicPromptRequest):
     try:
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="GROQ_API_KEY not configured")
-            
-        client = Groq(api_key=api_key)
-        
-        # Implementation from user snippet
-        completion = client.chat.completions.create(
-            model="llama3-8b-8192", # User specified model
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a creative assistant. Expand the user's idea into a detailed, vivid prompt for video generation. Reply ONLY with the prompt."
-                },
-                {
-                    "role": "user",
-                    "content": request.user_idea
-                }
-            ],
-            temperature=1,
-            max_completion_tokens=8192,
-            top_p=1,
-            reasoning_effort="medium",
-            stream=False, # Changed to False for API response simplicity
-            stop=None
-        )
-        
-        generated_text = completion.choices[0].message.content.strip()
-        return {"magic_prompt": generated_text}
-        
+        generated_text, cached = await prompt_expander.expand(request.user_idea, fresh=request.fresh)
+        return {"magic_prompt": generated_text, "cached": cached}
+
+    except MagicPromptConfigError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.error(f"Groq API Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/magic-prompt/stream")
+async def stream_magic_prompt(request: MagicPromptRequest):
+    """
+    Server-Sent Events: `data: {"token": ...}` por fragmento y un evento final
+    `done` con el prompt completo (o `error`).
+    """
+    try:
+        prompt_expander.check_configured()
+    except MagicPromptConfigError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        parts = []
+        try:
+            async for delta in prompt_expander.stream(request.user_idea, fresh=request.fresh):
+                parts.append(delta)
+                yield _sse({"token": delta})
+            yield _sse({"magic_prompt": "".join(parts).strip()}, event="done")
+        except Exception as e:
+            logger.error(f"Groq API Error: {str(e)}")
+            yield _sse({"error": str(e)}, event="error")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
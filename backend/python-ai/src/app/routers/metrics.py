@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from ..services.metrics import metrics_payload
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint (sync: el collector consulta Redis, corre en el threadpool)"""
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
-import asyncio
-import httpx
-import os
-import requests
-from ..services.ai_engine import engine
-from ..services.storage import upload_file
+from typing import Literal, Optional
+from ..services.admission import AdmissionRejected, submit
+from ..services.cancellation import CancelToken, JobCancelled, job_deadline
+from ..services.image_fetch import FACE_IMAGE_MAX_SIDE, image_fetcher
+from ..services.interpolation import InterpolationName, interpolation_mode
+from ..services.job_queue import DEFAULT_PRIORITY, Job, get_job_queue
+from ..services.metrics import jobs_total
+from ..services.model_registry import T2V_MODEL_ID
+from ..services.notifier import notify_node_api
+from ..services.result_cache import RESULT_CACHE_ENABLED, get_result_cache, normalize_text, result_cache_key
+from ..services.progress import JobProgress
+from .jobs import rejected
 
 router = APIRouter()
 
-NODE_API_URL = os.getenv("NODE_API_URL", "http://localhost:3001")
-
 class GenerateRequest(BaseModel):
     id: str
     prompt: str
@@ -22,80 +26,133 @@ class GenerateRequest(BaseModel):
     seed: Optional[int] = -1
     upscale: Optional[bool] = False
     faceImageUrl: Optional[str] = None
+    # Calidad/velocidad: keyframes por difusión y el resto interpolado (None = INTERPOLATION_DEFAULT, "off" = sin interpolar)
+    interpolation: Optional[InterpolationName] = None
+    # Clase de la cola: preview (sale antes) | final | batch (solo cuando no hay nada más)
+    priority: Optional[Literal["preview", "final", "batch"]] = DEFAULT_PRIORITY
+    # Usuario/cliente que lo pide, para el límite de trabajos activos por tenant (TENANT_MAX_JOBS)
+    tenant: Optional[str] = None
+    # Segundos desde que se encola hasta cancelarse solo (None = JOB_DEFAULT_TIMEOUT)
+    timeout: Optional[float] = None
 
-async def notify_node_api(job_id: str, status: str, progress: int, result_url: Optional[str] = None, error: Optional[str] = None):
-    webhook_url = f"{NODE_API_URL}/api/generations/webhook/update"
-    payload = {
-        "id": job_id,
-        "status": status,
-        "progress": progress
-    }
-    if result_url:
-        payload["resultUrl"] = result_url
-    if error:
-        payload["error"] = error
+def output_frames(request: GenerateRequest) -> int:
+    """Frames del vídeo final a la fps pedida (el engine genera keyframes e interpola el resto)."""
+    return max(1, int(request.duration * (request.fps or 24)))
 
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(webhook_url, json=payload)
-    except Exception as e:
-        print(f"Failed to notify Node API: {e}")
+def text_cache_key(request: GenerateRequest, face_hash: Optional[str] = None) -> Optional[str]:
+    """Clave de la caché de resultados; None si la generación no es determinista."""
+    if not RESULT_CACHE_ENABLED or request.seed is None or request.seed == -1:
+        return None
+    params = {
+        "prompt": normalize_text(request.prompt),
+        "negative_prompt": normalize_text(request.negative_prompt),
+        "num_frames": output_frames(request),
+        "fps": request.fps or 24,
+        "seed": request.seed,
+        "upscale": bool(request.upscale),
+        "interpolation": interpolation_mode(request.interpolation).name,
+    }
+    return result_cache_key("text", T2V_MODEL_ID, params, face_hash)
 
-def run_pipeline(job_id: str, request: GenerateRequest):
+def run_pipeline(job_id: str, request: GenerateRequest, is_last_attempt: bool = True, engine=None,
+                 cancel: Optional[CancelToken] = None):
     """
     Función síncrona que ejecuta el pipeline pesado.
-    Será ejecutada en un thread pool por BackgroundTasks.
+    Es ejecutada por un worker de la cola de trabajos (ver app.worker).
+    Si falla y quedan reintentos, relanza la excepción para que el worker reencole.
+    `engine`: el del dispositivo asignado por DevicePool; None = engine por defecto.
+    `cancel`: token de cancelación/plazo del trabajo; si salta, devuelve "cancelled".
+    Devuelve "failed" si falla en el último intento (el worker lo confirma con ese estado).
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
+    if engine is None:
+        from ..services.ai_engine import engine
+
+    progress = JobProgress(job_id, kind="text", cancel=cancel)
     try:
         # Notificar inicio
-        loop.run_until_complete(notify_node_api(job_id, "processing", 10))
+        progress.update("download", 0.0)
         
         # Download face image if provided
         face_img = None
+        face_hash = None
         if request.faceImageUrl:
             print(f"Downloading face image from {request.faceImageUrl}")
-            face_resp = requests.get(request.faceImageUrl)
-            from PIL import Image
-            from io import BytesIO
-            face_img = Image.open(BytesIO(face_resp.content)).convert("RGB")
+            face, = image_fetcher.fetch((request.faceImageUrl, None, FACE_IMAGE_MAX_SIDE))
+            face_img, face_hash = face.image, face.sha256
+
+        progress.update("download", 1.0)
+
+        # Seed fija: mismo request => mismo vídeo, reutilizar el ya subido
+        cache_key = text_cache_key(request, face_hash)
+        if cache_key:
+            cached_url = get_result_cache().get(cache_key)
+            if cached_url:
+                print(f"Result cache hit for job {job_id}")
+                progress.finish("cached")
+                notify_node_api(job_id, "completed", 100, result_url=cached_url)
+                return
 
         # Generar (Bloqueante, usa GPU)
         print(f"Starting T2V generation for job {job_id}")
-        video_path = engine.generate_text_to_video(
+        # Post-proceso, encode y subida en el pipeline por etapas del engine (fuera del lock de GPU)
+        s3_url = engine.generate_text_to_video(
             prompt=request.prompt,
             negative_prompt=request.negative_prompt,
-            num_frames=int(request.duration * 24), # Aprox, limitado por modelo
+            num_frames=output_frames(request),
             seed=request.seed,
+            fps=request.fps or 24,
             upscale=request.upscale,
-            face_image=face_img
+            face_image=face_img,
+            upload_object=f"generations/{job_id}.mp4",
+            progress=progress,
+            interpolation=request.interpolation
         )
-        
-        # Subir a S3
-        loop.run_until_complete(notify_node_api(job_id, "processing", 90))
-        print(f"Uploading video {video_path} to S3...")
-        s3_url = upload_file(video_path, object_name=f"generations/{job_id}.mp4")
-        
+
         if not s3_url:
             raise Exception("Failed to upload video to S3")
 
+        if cache_key and engine.shares_results:
+            get_result_cache().put(cache_key, s3_url)
+
         # Notificar éxito
-        loop.run_until_complete(notify_node_api(job_id, "completed", 100, result_url=s3_url))
-        
-        # Cleanup
-        if os.path.exists(video_path):
-            os.remove(video_path)
-            
+        progress.finish("completed")
+        notify_node_api(job_id, "completed", 100, result_url=s3_url)
+
+    except JobCancelled as e:
+        # Cancelado o fuera de plazo: sin reintentos; el engine ya borró sus archivos temporales
+        print(f"Job {job_id} stopped: {e}")
+        progress.finish("cancelled")
+        notify_node_api(job_id, "cancelled", progress.progress, error=str(e))
+        return "cancelled"
     except Exception as e:
         print(f"Error in pipeline: {e}")
-        loop.run_until_complete(notify_node_api(job_id, "failed", 0, error=str(e)))
-    finally:
-        loop.close()
+        if not is_last_attempt:
+            progress.finish("retried")
+            raise
+        progress.finish("failed")
+        notify_node_api(job_id, "failed", 0, error=str(e))
+        return "failed"
 
 @router.post("/text")
-async def generate_text_to_video(request: GenerateRequest, background_tasks: BackgroundTasks):
-    # Encolar la tarea pesada
-    background_tasks.add_task(run_pipeline, request.id, request)
-    return {"status": "queued", "jobId": request.id}
+async def generate_text_to_video(request: GenerateRequest):
+    # Resultado ya generado: responder sin pasar por la cola
+    cache_key = None if request.faceImageUrl else text_cache_key(request)
+    if cache_key:
+        cached_url = await run_in_threadpool(get_result_cache().get, cache_key)
+        if cached_url:
+            jobs_total.labels("text", "cached").inc()
+            notify_node_api(request.id, "completed", 100, result_url=cached_url)
+            return {"status": "completed", "jobId": request.id, "resultUrl": cached_url}
+
+    # Encolar la tarea pesada si se admite (si no, 429 con Retry-After); la ejecuta un worker de GPU
+    job_queue = get_job_queue()
+    job = Job(id=request.id, kind="text", payload=request.model_dump(), deadline=job_deadline(request.timeout),
+              priority=request.priority or DEFAULT_PRIORITY, tenant=request.tenant)
+    try:
+        estimate = await run_in_threadpool(submit, job, job_queue)
+    except AdmissionRejected as e:
+        raise rejected(request.id, e)
+    if estimate is None:
+        return {"status": "duplicate", "jobId": request.id, "jobStatus": await run_in_threadpool(job_queue.status, request.id)}
+    return {"status": "queued", "jobId": request.id, "queue": await run_in_threadpool(job_queue.depth),
+            "estimatedWaitSeconds": estimate["estimatedWaitSeconds"]}
@@ -0,0 +1,175 @@
+"""
+Control de admisión de /generate.
+
+Cada petición se encola en su clase de prioridad (preview, final, batch)
+solo si cabe: la cola de la clase está acotada (JOB_QUEUE_LIMITS), cada
+tenant tiene un máximo de trabajos activos (TENANT_MAX_JOBS) y la espera
+estimada no puede pasar de ADMISSION_MAX_WAIT de su clase ni del plazo del
+propio trabajo. Si no, la API responde 429 con un Retry-After calculado con
+el throughput medido, en lugar de acumular horas de trabajo que nadie verá.
+
+El throughput lo mide cada proceso worker (trabajos completados por segundo
+de tiempo ocupado) y lo publica en su heartbeat; la estimación suma el de
+todos los workers vivos.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from .job_queue import JOB_PRIORITIES, Job, JobQueue, QueueRejected, get_job_queue
+from .metrics import jobs_rejected
+
+# Espera estimada máxima (segundos) para admitir un trabajo de cada clase (0 = sin límite)
+ADMISSION_MAX_WAIT = {
+    "preview": float(os.getenv("ADMISSION_MAX_WAIT_PREVIEW", "120")),
+    "final": float(os.getenv("ADMISSION_MAX_WAIT_FINAL", "1800")),
+    "batch": float(os.getenv("ADMISSION_MAX_WAIT_BATCH", "0")),
+}
+# Segundos por trabajo que se suponen para un worker que aún no ha completado ninguno
+ADMISSION_DEFAULT_JOB_SECONDS = float(os.getenv("ADMISSION_DEFAULT_JOB_SECONDS", "120"))
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "900"))
+# Trabajos completados sobre los que se mide el throughput de cada worker
+THROUGHPUT_WINDOW = int(os.getenv("THROUGHPUT_WINDOW", "20"))
+
+
+class AdmissionRejected(Exception):
+    """`reason`: queue_full, tenant_limit, overloaded (espera > ADMISSION_MAX_WAIT) o deadline."""
+
+    def __init__(self, reason: str, message: str, retry_after: int, estimate: Dict[str, Any]):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.estimate = estimate
+
+
+class ThroughputMeter:
+    """
+    Trabajos completados por segundo de tiempo ocupado de este proceso (con al
+    menos un trabajo en curso). Descontar los ratos sin trabajo da el ritmo al
+    que el worker vacía la cola cuando la hay, que es cuando importa; los
+    trabajos que corren a la vez (hilos, lotes) cuentan todos.
+    """
+
+    def __init__(self, window: int = THROUGHPUT_WINDOW):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._busy = 0.0
+        self._busy_since = 0.0
+        # Reloj de ocupación al completarse cada uno de los últimos trabajos
+        self._completions = deque(maxlen=max(window, 1))
+        self._base = 0.0
+        self.completed = 0
+
+    def _clock(self, now: float) -> float:
+        return self._busy + (now - self._busy_since if self._active else 0.0)
+
+    def started(self):
+        with self._lock:
+            if not self._active:
+                self._busy_since = time.monotonic()
+            self._active += 1
+
+    def finished(self, completed: bool = True):
+        with self._lock:
+            clock = self._clock(time.monotonic())
+            self._active -= 1
+            if not self._active:
+                self._busy = clock
+            if completed:
+                if len(self._completions) == self._completions.maxlen:
+                    self._base = self._completions[0]
+                self._completions.append(clock)
+                self.completed += 1
+
+    def jobs_per_second(self) -> Optional[float]:
+        with self._lock:
+            if not self._completions or self._completions[-1] <= self._base:
+                return None
+            return len(self._completions) / (self._completions[-1] - self._base)
+
+    def snapshot(self) -> Dict[str, Any]:
+        rate = self.jobs_per_second()
+        return {"jobs_per_second": round(rate, 6) if rate else None, "completed": self.completed, "active": self._active}
+
+
+throughput_meter = ThroughputMeter()
+
+
+def cluster_throughput(workers: Dict[str, Dict[str, Any]]) -> Optional[float]:
+    """Trabajos por segundo entre todos los workers vivos; None si no hay ninguno."""
+    if not workers:
+        return None
+    return sum(
+        (info.get("throughput") or {}).get("jobs_per_second") or 1 / ADMISSION_DEFAULT_JOB_SECONDS
+        for info in workers.values()
+    )
+
+
+def estimate_wait(priority: str, job_queue: Optional[JobQueue] = None) -> Dict[str, Any]:
+    """Espera estimada de un trabajo nuevo de la clase `priority`: los que tiene delante / throughput."""
+    if priority not in JOB_PRIORITIES:
+        raise ValueError(f"Unknown job priority {priority!r} (one of: {', '.join(JOB_PRIORITIES)})")
+    job_queue = job_queue or get_job_queue()
+    lanes = job_queue.lanes()
+    workers = job_queue.workers()
+    # Delante: todo lo encolado en su clase y en las de más prioridad
+    ahead = sum(lanes[p] for p in JOB_PRIORITIES[:JOB_PRIORITIES.index(priority) + 1])
+    rate = cluster_throughput(workers)
+    return {
+        "priority": priority,
+        "ahead": ahead,
+        "lanes": lanes,
+        "workers": len(workers),
+        "jobsPerSecond": round(rate, 6) if rate else None,
+        "estimatedWaitSeconds": round(ahead / rate, 1) if rate else None,
+    }
+
+
+def _drain_seconds(jobs: float, estimate: Dict[str, Any]) -> float:
+    """Segundos hasta que salgan `jobs` trabajos de la cola al throughput medido."""
+    return jobs / (estimate["jobsPerSecond"] or 1 / ADMISSION_DEFAULT_JOB_SECONDS)
+
+
+def _retry_after(seconds: float) -> int:
+    return min(ADMISSION_MAX_RETRY_AFTER, max(1, math.ceil(seconds)))
+
+
+def _reject(job: Job, reason: str, message: str, retry_after: int, estimate: Dict[str, Any]) -> AdmissionRejected:
+    jobs_rejected.labels(job.kind, job.priority, reason).inc()
+    return AdmissionRejected(reason, message, retry_after, estimate)
+
+
+def submit(job: Job, job_queue: Optional[JobQueue] = None) -> Optional[Dict[str, Any]]:
+    """
+    Encola el trabajo si se admite y devuelve la estimación de espera; None si
+    el id ya estaba (dedupe). Lanza AdmissionRejected con el Retry-After.
+    """
+    job_queue = job_queue or get_job_queue()
+    estimate = estimate_wait(job.priority, job_queue)
+    wait = estimate["estimatedWaitSeconds"]
+    # Un reenvío del mismo id es "duplicate" aunque ahora no se admitiría
+    if wait is not None and job_queue.status(job.id) is None:
+        max_wait = ADMISSION_MAX_WAIT.get(job.priority, 0)
+        if max_wait and wait > max_wait:
+            # Cuando la cola haya bajado lo que sobra
+            raise _reject(job, "overloaded", f"estimated wait {wait:.0f}s exceeds {max_wait:.0f}s for {job.priority}",
+                          _retry_after(wait - max_wait), estimate)
+        if job.deadline and time.time() + wait > job.deadline:
+            # Se cancelaría por plazo antes de empezar
+            raise _reject(job, "deadline", f"estimated wait {wait:.0f}s exceeds the job timeout",
+                          _retry_after(time.time() + wait - job.deadline), estimate)
+    try:
+        if not job_queue.enqueue(job):
+            return None
+    except QueueRejected as e:
+        if e.reason == "queue_full":
+            # Hay hueco en cuanto salga de la cola el primero de la clase (las de más prioridad salen antes)
+            jobs = estimate["ahead"] - estimate["lanes"][job.priority] + 1
+        else:
+            # tenant_limit: sus trabajos en cola empiezan, como mucho, cuando salga lo que hay delante
+            jobs = estimate["ahead"] + 1
+        raise _reject(job, e.reason, str(e), _retry_after(_drain_seconds(jobs, estimate)), estimate)
+    return estimate
@@ -1,57 +1,129 @@
 import torch
 import os
 import uuid
-import subprocess
 import gc
+import shutil
 import threading
+import weakref
+import time
 import numpy as np
 import cv2
-import shutil
 import logging
+from contextlib import contextmanager
 from typing import List, Optional
 from io import BytesIO
 from PIL import Image
-from diffusers import (
-    CogVideoXPipeline, 
-    StableVideoDiffusionPipeline,
-    DPMSolverMultistepScheduler
+from .batching import BatchCallback, DiffusionBatcher
+from .cancellation import JobCancelled
+from .cpu_profile import apply_cpu_profile, configure_threads, cpu_dtype, inference_steps
+from .embedding_cache import prompt_embedding_cache
+from .metrics import lock_wait_seconds
+from .pipeline import ENCODE_WORKERS, UPLOAD_WORKERS, Stage, StagePipeline
+from .frame_buffer import as_frame_buffer, swap_rgb_bgr
+from .face_tracking import FACE_REDETECT_INTERVAL, FACE_SWAP_MODE, source_face_cache, track_faces
+from .interpolation import (
+    InterpolationMode, interpolate_frames, interpolated_count, interpolation_mode, keyframe_count, load_interpolator,
+)
+from .model_registry import ModelRegistry, model_registry, GB, T2V_MODEL_ID
+from .model_store import load_pipeline, load_upscaler_weights
+from .progress import JobProgress, NullProgress, SegmentProgress
+from .upscaler import BatchedUpscaler, UpscalerModel
+from .segmented import (
+    PLAYLIST_CONTENT_TYPE, SEGMENT_CONTENT_TYPE, SEGMENT_OUTPUT_ARGS, SEGMENT_OVERLAP_FRAMES, SEGMENT_STRENGTH,
+    SEGMENTED_GENERATION, T2V_MAX_FRAMES, HlsPlaylist, conditioning_video, plan_chunks, segment_overlap,
 )
-from diffusers.utils import export_to_video
-from realesrgan import RealESRGANer
-from basicsr.archs.rrdbnet_arch import RRDBNet
+from .storage import S3_UPLOAD_WHILE_ENCODING, upload_file, upload_stream
+from .video_encoder import concat_segments, encode_frames, encode_frames_streaming, frame_size
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Optional FaceSwap imports
-try:
-    import insightface
-    from insightface.app import FaceAnalysis
-except ImportError:
-    insightface = None
+# sequential (T4, mínimo de VRAM) | model | none (todo el pipeline en GPU)
+MODEL_OFFLOAD = os.getenv("MODEL_OFFLOAD", "sequential")
+# Frames de SVD a la fps de salida y fps con la que se condiciona el modelo (valor por defecto de diffusers)
+I2V_FRAMES = 25
+I2V_MODEL_FPS = 7
+
+# diffusers, realesrgan/basicsr e insightface se importan dentro de cada loader:
+# importar el engine no paga su coste hasta que un trabajo (o el warmup) carga el modelo.
 
 class AIEngine:
     _instance = None
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(AIEngine, cls).__new__(cls)
-            cls._instance._init()
-        return cls._instance
-
-    def _init(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.i2v_pipe = None
-        self.t2v_pipe = None
-        self.upscaler = None
-        self.face_app = None
-        self.face_swapper = None
+    def __new__(cls, device: Optional[str] = None, models: Optional[ModelRegistry] = None):
+        # Sin argumentos: el engine por defecto del proceso. Con device: uno por dispositivo (ver device_pool)
+        if device is None and models is None:
+            if cls._instance is None:
+                cls._instance = super(AIEngine, cls).__new__(cls)
+                cls._instance._init()
+            return cls._instance
+        instance = super(AIEngine, cls).__new__(cls)
+        instance._init(device, models)
+        return instance
+
+    def _init(self, device: Optional[str] = None, models: Optional[ModelRegistry] = None):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        # Índice CUDA para onnxruntime / insightface (0 también en CPU, como antes)
+        self.device_index = torch.device(self.device).index or 0
+        # "cuda" también para "cuda:1": las decisiones de precisión/offload van por tipo, no por nombre
+        self.device_type = torch.device(self.device).type
+        # fp16 solo en GPU; en CPU, perfil propio (bf16/fp32, hilos, menos pasos: ver services/cpu_profile)
+        self.dtype = cpu_dtype() if self.device_type == "cpu" else torch.float16
+        if self.device_type == "cpu":
+            configure_threads()
+        # El perfil CPU (menos pasos, scheduler DPM, bf16) no da el mismo vídeo: sus resultados no van
+        # a la caché compartida, aunque sí puede servir los ya generados en GPU
+        self.shares_results = self.device_type != "cpu"
+        self.models = models or model_registry
         self.output_dir = "generated_videos"
         self.lock = threading.Lock()
+        # CogVideoXVideoToVideoPipeline por pipeline T2V cargado (vídeos segmentados)
+        self._extension_pipes = weakref.WeakKeyDictionary()
+        # Trabajos T2V compatibles que coinciden en el tiempo comparten una llamada al pipeline (T2V_MAX_BATCH)
+        self.t2v_batcher = DiffusionBatcher("t2v", self._run_t2v_batch, lambda: self._locked("t2v"))
+        # Todo lo posterior a la difusión corre fuera de self.lock: mientras un trabajo
+        # se codifica y se sube, el siguiente ya está en la GPU
+        self.post_pipeline = StagePipeline(f"post-{self.device}", [
+            Stage("post_process", self._stage_post_process),
+            Stage("encode", self._stage_encode, ENCODE_WORKERS),
+            Stage("upload", self._stage_upload, UPLOAD_WORKERS),
+        ])
         os.makedirs(self.output_dir, exist_ok=True)
+        self._register_models()
         logger.info(f"AI Engine initialized on {self.device}")
 
+    def _register_models(self):
+        on_cpu = self.device_type == "cpu"
+        # Con offload los pesos viven en RAM de CPU aunque el pipeline esté "activo"
+        pipe_offloaded = on_cpu or MODEL_OFFLOAD != "none"
+        pipe_kwargs = {"offloaded": pipe_offloaded}
+        if not pipe_offloaded:
+            pipe_kwargs.update(promote=lambda pipe: pipe.to(self.device), demote=lambda pipe: pipe.to("cpu"))
+
+        self.models.register("t2v", self._load_t2v_pipe, size_hint=int(13 * GB), **pipe_kwargs)
+        self.models.register("i2v", self._load_i2v_pipe, size_hint=int(4.5 * GB), **pipe_kwargs)
+        self.models.register(
+            "upscaler", self._load_upscaler, size_hint=int(0.1 * GB), offloaded=on_cpu,
+            promote=self._move_upscaler(self.device), demote=self._move_upscaler("cpu"),
+        )
+        # onnxruntime no puede mover sesiones entre dispositivos: sin demote, se descarga
+        self.models.register("face", self._load_face_models, size_hint=int(0.9 * GB), offloaded=on_cpu)
+        # Flujo óptico en CPU (sin pesos) o el modelo de INTERPOLATION_MODEL
+        self.models.register("interpolator", self._load_interpolator, size_hint=0, offloaded=on_cpu)
+
+    def _place_pipeline(self, pipe, kind: str):
+        if self.device_type == "cpu":
+            return apply_cpu_profile(pipe, kind)
+        # T4 Optimizations
+        if MODEL_OFFLOAD == "sequential":
+            pipe.enable_sequential_cpu_offload(device=self.device)
+        elif MODEL_OFFLOAD == "model":
+            pipe.enable_model_cpu_offload(device=self.device)
+        else:
+            pipe.to(self.device)
+        return pipe
+
     def _cleanup_memory(self):
         gc.collect()
         if torch.cuda.is_available():
@@ -69,172 +141,486 @@ class AIEngine:
             logger.error(f"Failed to setup Ngrok: {e}")
             return None
 
-    def load_face_models(self):
-        if insightface is None:
+    def _load_face_models(self):
+        # Optional FaceSwap imports
+        try:
+            import insightface
+            from insightface.app import FaceAnalysis
+        except ImportError:
             raise ImportError("insightface not installed")
         
-        if self.face_app is None:
-            logger.info("Loading InsightFace Analysis...")
-            self.face_app = FaceAnalysis(name='buffalo_l', root='models', providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
-            self.face_app.prepare(ctx_id=0, det_size=(640, 640))
+        logger.info("Loading InsightFace Analysis...")
+        face_app = FaceAnalysis(name='buffalo_l', root='models', providers=self._onnx_providers())
+        face_app.prepare(ctx_id=self.device_index, det_size=(640, 640))
             
-        if self.face_swapper is None:
-            logger.info("Loading Face Swapper Model...")
-            model_path = 'models/inswapper_128.onnx'
-            if not os.path.exists(model_path):
-                logger.warning(f"Warning: {model_path} not found.")
-            
-            self.face_swapper = insightface.model_zoo.get_model(model_path, download=False, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+        logger.info("Loading Face Swapper Model...")
+        model_path = 'models/inswapper_128.onnx'
+        if not os.path.exists(model_path):
+            logger.warning(f"Warning: {model_path} not found.")
+        
+        face_swapper = insightface.model_zoo.get_model(model_path, download=False, providers=self._onnx_providers())
+        return face_app, face_swapper
+
+    def _onnx_providers(self):
+        return [('CUDAExecutionProvider', {'device_id': self.device_index}), 'CPUExecutionProvider']
+
+    def load_face_models(self):
+        return self.models.get("face")
 
-    def swap_faces(self, frames, source_face_image: Image.Image):
-        self.load_face_models()
+    def swap_faces(self, frames, source_face_image: Image.Image, mode: str = FACE_SWAP_MODE,
+                   redetect_interval: int = FACE_REDETECT_INTERVAL, on_progress=None):
+        with self.models.use("face") as (face_app, face_swapper):
+            return self._swap_faces(face_app, face_swapper, frames, source_face_image, mode, redetect_interval, on_progress)
+
+    def _swap_faces(self, face_app, face_swapper, frames, source_face_image: Image.Image, mode, redetect_interval, on_progress=None):
         src_img_cv2 = cv2.cvtColor(np.array(source_face_image), cv2.COLOR_RGB2BGR)
-        src_faces = self.face_app.get(src_img_cv2)
-        if not src_faces:
+        # Embedding de la cara origen cacheado por hash de imagen entre trabajos
+        source_face = source_face_cache.get_or_detect(face_app, src_img_cv2)
+        if source_face is None:
             logger.warning("No face detected in source image")
             return frames
         
-        source_face = src_faces[0]
-        swapped_frames = []
-        
-        logger.info(f"Swapping faces in {len(frames)} frames...")
+        # insightface trabaja en BGR: el buffer pasa a BGR en su sitio y cada frame vuelve a RGB tras su swap
+        frames = as_frame_buffer(frames)
         for frame in frames:
-            frame_cv2 = cv2.cvtColor(np.array(frame), cv2.COLOR_RGB2BGR)
-            target_faces = self.face_app.get(frame_cv2)
-            res_img = frame_cv2.copy()
+            swap_rgb_bgr(frame)
+        if mode == "full":
+            target_faces_per_frame = [face_app.get(frame) for frame in frames]
+        else:
+            target_faces_per_frame = track_faces(face_app, frames, redetect_interval=redetect_interval)
+        # Detección/seguimiento: primera mitad de la etapa; swap: segunda mitad
+        if on_progress:
+            on_progress(0.5)
+
+        logger.info(f"Swapping faces in {len(frames)} frames ({mode})...")
+        for index, (frame, target_faces) in enumerate(zip(frames, target_faces_per_frame)):
             for t_face in target_faces:
-                res_img = self.face_swapper.get(res_img, t_face, source_face, paste_back=True)
-            swapped_frames.append(Image.fromarray(cv2.cvtColor(res_img, cv2.COLOR_BGR2RGB)))
-        return swapped_frames
+                frame[...] = face_swapper.get(frame, t_face, source_face, paste_back=True)
+            swap_rgb_bgr(frame)
+            if on_progress:
+                on_progress(0.5 + 0.5 * (index + 1) / len(frames))
+        return frames
+
+    def _load_upscaler(self):
+        from basicsr.archs.rrdbnet_arch import RRDBNet
+
+        logger.info("Loading Real-ESRGAN Upscaler...")
+        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
+        # Pesos del store local (safetensors mapeados); solo BatchedUpscaler usa la red, sin RealESRGANer
+        model.load_state_dict(load_upscaler_weights(), strict=True)
+        model.eval()
+        half = self.device_type == "cuda"
+        if half:
+            model = model.half()
+        device = torch.device(self.device)
+        return UpscalerModel(model.to(device), scale=2, half=half, device=device)
+
+    def _move_upscaler(self, device):
+        def move(upscaler):
+            upscaler.device = torch.device(device)
+            upscaler.model.to(upscaler.device)
+        return move
 
     def load_upscaler(self):
-        if self.upscaler is None:
-            logger.info("Loading Real-ESRGAN Upscaler...")
-            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
-            self.upscaler = RealESRGANer(
-                scale=2,
-                model_path='https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth',
-                model=model,
-                tile=400,
-                tile_pad=10,
-                pre_pad=0,
-                half=True if self.device == "cuda" else False,
-                device=self.device
-            )
+        return self.models.get("upscaler")
 
-    def upscale_frames(self, frames):
-        self.load_upscaler()
-        upscaled_frames = []
-        for frame in frames:
-            img = cv2.cvtColor(np.array(frame), cv2.COLOR_RGB2BGR)
-            output, _ = self.upscaler.enhance(img, outscale=2)
-            upscaled_frames.append(Image.fromarray(cv2.cvtColor(output, cv2.COLOR_BGR2RGB)))
-        return upscaled_frames
+    def upscale_frames(self, frames, on_progress=None):
+        with self.models.use("upscaler") as upscaler:
+            return BatchedUpscaler(upscaler).upscale(as_frame_buffer(frames), on_progress=on_progress)
+
+    def _load_interpolator(self):
+        return load_interpolator(self.device)
+
+    def interpolate_frames(self, frames, mode: InterpolationMode, skip_first: bool = False, limit: Optional[int] = None,
+                           on_progress=None):
+        with self.models.use("interpolator") as interpolator:
+            return interpolate_frames(interpolator, as_frame_buffer(frames), mode, skip_first=skip_first, limit=limit,
+                                      on_progress=on_progress)
+
+    def _load_i2v_pipe(self):
+        logger.info("Loading SVD-XT Pipeline...")
+        return self._place_pipeline(load_pipeline("i2v", torch_dtype=self.dtype), "i2v")
+
+    def _load_t2v_pipe(self):
+        logger.info("Loading CogVideoX-2b Pipeline...")
+        return self._place_pipeline(load_pipeline("t2v", torch_dtype=self.dtype), "t2v")
 
     def load_i2v_model(self):
-        if self.i2v_pipe is None:
-            if self.t2v_pipe:
-                del self.t2v_pipe
-                self.t2v_pipe = None
-                self._cleanup_memory()
-            
-            logger.info("Loading SVD-XT Pipeline...")
-            self.i2v_pipe = StableVideoDiffusionPipeline.from_pretrained(
-                "stabilityai/stable-video-diffusion-img2vid-xt", 
-                torch_dtype=torch.float16, 
-                variant="fp16"
-            )
-            # T4 Optimizations
-            self.i2v_pipe.enable_model_cpu_offload()
-            self.i2v_pipe.enable_sequential_cpu_offload()
+        return self.models.get("i2v")
 
     def load_t2v_model(self):
-        if self.t2v_pipe is None:
-            if self.i2v_pipe:
-                del self.i2v_pipe
-                self.i2v_pipe = None
-                self._cleanup_memory()
-            
-            logger.info("Loading CogVideoX-2b Pipeline...")
-            self.t2v_pipe = CogVideoXPipeline.from_pretrained(
-                "THUDM/CogVideoX-2b", 
-                torch_dtype=torch.float16
-            )
-            # T4 Optimizations
-            self.t2v_pipe.enable_model_cpu_offload()
-            self.t2v_pipe.enable_sequential_cpu_offload()
-
-    def export_video_nvenc(self, frames, fps=24):
-        temp_id = str(uuid.uuid4())
-        frame_dir = os.path.join(self.output_dir, f"temp_{temp_id}")
-        os.makedirs(frame_dir, exist_ok=True)
-        for i, frame in enumerate(frames):
-            frame.save(os.path.join(frame_dir, f"frame_{i:04d}.png"))
-        
-        output_path = os.path.join(self.output_dir, f"{temp_id}.mp4")
-        
-        # NVENC for T4
-        cmd = [
-            "ffmpeg", "-y", "-framerate", str(fps), "-i", os.path.join(frame_dir, "frame_%04d.png"), 
-            "-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq", "-pix_fmt", "yuv420p", output_path
-        ]
+        return self.models.get("t2v")
+
+    def export_video_nvenc(self, frames, fps=24, on_progress=None, output_path: Optional[str] = None, output_args=None):
+        """Stream frames straight into ffmpeg (NVENC, libx264 fallback); no temp PNGs."""
+        output_path = output_path or os.path.join(self.output_dir, f"{uuid.uuid4()}.mp4")
+        return encode_frames(frames, output_path, fps=fps, on_progress=on_progress, output_args=output_args)
+
+    def export_and_upload(self, frames, object_name: str, fps=24, progress_callback=None, on_progress=None):
+        """Encode to fragmented MP4 and upload it to S3 while ffmpeg is still writing. Returns the URL."""
+        width, height = frame_size(frames[0])
+        return encode_frames_streaming(
+            frames,
+            lambda stream: upload_stream(stream, object_name, progress_callback=progress_callback),
+            width, height, fps=fps, total_frames=len(frames), on_progress=on_progress,
+        )
+
+    def _generator(self, seed: int) -> Optional[torch.Generator]:
+        # Generator propio por llamada: varios engines (uno por dispositivo) no comparten el RNG global
+        return torch.Generator().manual_seed(seed) if seed != -1 else None
+
+    @contextmanager
+    def _locked(self, kind: str):
+        """self.lock, midiendo cuánto espera cada trabajo por la GPU."""
+        start = time.perf_counter()
+        with self.lock:
+            lock_wait_seconds.labels(kind).observe(time.perf_counter() - start)
+            yield
+
+    def _post_process(self, frames, face_image, upscale, progress: JobProgress, interpolation=None):
+        if face_image:
+            progress.update("face_swap", 0.0)
+            frames = self.swap_faces(frames, face_image, on_progress=progress.stage("face_swap"))
         
+        if upscale:
+            progress.update("upscale", 0.0)
+            frames = self.upscale_frames(frames, on_progress=progress.stage("upscale"))
+
+        # Al final: face swap y upscale solo pasan por los keyframes
+        if interpolation and interpolation["mode"].factor > 1:
+            progress.update("interpolate", 0.0)
+            frames = self.interpolate_frames(frames, interpolation["mode"], skip_first=interpolation.get("skip_first", False),
+                                             limit=interpolation.get("limit"), on_progress=progress.stage("interpolate"))
+        return frames
+
+    # Cada etapa empieza comprobando la cancelación: un trabajo cancelado no pasa a las siguientes
+    def _stage_post_process(self, job):
+        job["progress"].check_cancelled()
+        job["frames"] = self._post_process(job["frames"], job["face_image"], job["upscale"], job["progress"],
+                                           job.get("interpolation"))
+        return job
+
+    def _stage_encode(self, job):
+        frames, progress, upload_object = job.pop("frames"), job["progress"], job["upload_object"]
+        progress.check_cancelled()
+        progress.update("encode", 0.0)
+        segment = job.get("segment")
+        if segment:
+            # Un trozo de un vídeo segmentado: segmento HLS en MP4 fragmentado
+            job["result"] = self.export_video_nvenc(frames, fps=job["fps"], on_progress=progress.stage("encode"),
+                                                    output_path=segment["path"], output_args=SEGMENT_OUTPUT_ARGS)
+        elif upload_object and S3_UPLOAD_WHILE_ENCODING:
+            # Codificar y subir a la vez (MP4 fragmentado por stdout de ffmpeg); ya no se interrumpe
+            job["result"] = self.export_and_upload(frames, upload_object, fps=job["fps"],
+                                                   progress_callback=progress.upload_callback(),
+                                                   on_progress=progress.stage("encode", cancellable=False))
+            job["uploaded"] = True
+        else:
+            # Ruta conocida antes de codificar: si se cancela a medias, _finish borra el archivo parcial
+            job["video_path"] = os.path.join(self.output_dir, f"{uuid.uuid4()}.mp4")
+            job["result"] = self.export_video_nvenc(frames, fps=job["fps"], on_progress=progress.stage("encode"),
+                                                    output_path=job["video_path"])
+        return job
+
+    def _stage_upload(self, job):
+        segment = job.get("segment")
+        if segment:
+            return self._upload_segment(job, segment)
+        if not job["upload_object"] or job.get("uploaded"):
+            return job
+        video_path, progress = job["result"], job["progress"]
+        progress.check_cancelled()
+        logger.info(f"Uploading video {video_path} to S3...")
+        progress.update("upload", 0.0)
+        job["result"] = upload_file(video_path, object_name=job["upload_object"], progress_callback=progress.upload_callback())
+        if job["result"] and os.path.exists(video_path):
+            os.remove(video_path)
+        return job
+
+    def _upload_segment(self, job, segment):
+        # El archivo local se queda: al final se concatenan todos en el MP4
+        playlist = segment["playlist"]
+        if playlist is None:
+            return job
+        progress = job["progress"]
+        progress.check_cancelled()
+        if not upload_file(segment["path"], object_name=segment["object"], content_type=SEGMENT_CONTENT_TYPE):
+            raise Exception(f"Failed to upload segment {segment['object']}")
+        published = playlist.add(segment["index"], os.path.basename(segment["object"]), segment["path"],
+                                 segment["frames"])
+        progress.update("upload", 1.0, playlistUrl=playlist.url, segmentsReady=published, segments=segment["count"])
+        return job
+
+    def _finish(self, frames, fps, face_image, upscale, progress: JobProgress, upload_object=None, interpolation=None):
+        """Post-proceso, encode y subida en el pipeline por etapas; bloquea hasta el resultado."""
+        job = {"frames": frames, "fps": fps, "face_image": face_image, "upscale": upscale,
+               "progress": progress, "upload_object": upload_object, "interpolation": interpolation}
         try:
-            # Added 5-minute timeout for export safety
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=300)
-        except Exception as e:
-            logger.warning(f"NVENC failed, falling back to libx264: {e}")
-            subprocess.run([
-                "ffmpeg", "-y", "-framerate", str(fps), "-i", os.path.join(frame_dir, "frame_%04d.png"), 
-                "-c:v", "libx264", "-pix_fmt", "yuv420p", output_path
-            ], check=True)
-            
-        shutil.rmtree(frame_dir)
-        return output_path
+            return self.post_pipeline.submit(job).result()["result"]
+        except BaseException:
+            # Cancelado o fallido: no dejar el vídeo (completo o parcial) en generated_videos
+            video_path = job.get("video_path")
+            if video_path and os.path.exists(video_path):
+                os.remove(video_path)
+            raise
 
-    def generate_image_to_video(self, image: Image.Image, seed=-1, fps=24, upscale=False, face_image: Image.Image = None):
-        with self.lock:
-            self.load_i2v_model()
-            generator = torch.manual_seed(seed) if seed != -1 else None
+    def generate_image_to_video(self, image: Image.Image, seed=-1, fps=24, upscale=False, face_image: Image.Image = None,
+                                upload_object: Optional[str] = None, progress: Optional[JobProgress] = None,
+                                interpolation: Optional[str] = None):
+        """
+        Returns the local video path, or the S3 URL when `upload_object` is given.
+        `interpolation`: modo de services/interpolation (None = INTERPOLATION_DEFAULT).
+        """
+        progress = progress or NullProgress()
+        num_inference_steps = inference_steps("i2v", self.device_type)
+        mode = interpolation_mode(interpolation)
+        keyframes = keyframe_count(I2V_FRAMES, mode.factor)
+        with self._locked("i2v"):
+            # Cancelado (o fuera de plazo) mientras esperaba la GPU
+            progress.check_cancelled()
+            generator = self._generator(seed)
             
             logger.info("Starting I2V Generation...")
-            frames = self.i2v_pipe(
-                image, 
-                decode_chunk_size=8, 
-                generator=generator, 
-                num_frames=25
-            ).frames[0]
-            
-            if face_image:
-                frames = self.swap_faces(frames, face_image)
-            
-            if upscale:
-                frames = self.upscale_frames(frames)
-            
-            return self.export_video_nvenc(frames, fps=fps)
+            with self.models.use("i2v") as i2v_pipe:
+                progress.update("diffusion", 0.0)
+                frames = i2v_pipe(
+                    image, 
+                    decode_chunk_size=8, 
+                    generator=generator, 
+                    num_frames=keyframes,
+                    # Los keyframes cubren el mismo movimiento que I2V_FRAMES frames: más separados en el tiempo
+                    fps=max(1, round(I2V_MODEL_FPS / mode.factor)),
+                    num_inference_steps=num_inference_steps,
+                    callback_on_step_end=progress.diffusion_callback("i2v", num_inference_steps)
+                ).frames[0]
 
-    def generate_text_to_video(self, prompt, negative_prompt="", num_frames=24, seed=-1, fps=24, upscale=False, face_image: Image.Image = None):
-        with self.lock:
-            self.load_t2v_model()
-            generator = torch.manual_seed(seed) if seed != -1 else None
-            
-            logger.info(f"Starting T2V Generation: {prompt}")
-            
-            frames = self.t2v_pipe(
-                prompt,
-                negative_prompt=negative_prompt,
-                num_frames=num_frames,
-                num_inference_steps=30,
-                generator=generator
-            ).frames[0]
-            
-            if face_image:
-                frames = self.swap_faces(frames, face_image)
-            
-            if upscale:
-                frames = self.upscale_frames(frames)
-            
-            return self.export_video_nvenc(frames, fps=fps)
+        return self._finish(frames, fps, face_image, upscale, progress, upload_object,
+                            {"mode": mode, "limit": I2V_FRAMES})
+
+    def _run_t2v_batch(self, key, batch):
+        """
+        Una llamada a CogVideoX para todo el lote, con un generator por trabajo.
+        Devuelve los frames de cada uno, o JobCancelled para los cancelados.
+        """
+        num_frames, num_inference_steps = key
+        results = {}
+        # Cancelados mientras esperaban la GPU: fuera del lote antes de empezar
+        for item in batch:
+            try:
+                item.progress.check_cancelled()
+            except JobCancelled as e:
+                results[id(item)] = e
+        items = [item for item in batch if id(item) not in results]
+        if items:
+            for frames, item in zip(self._diffuse_t2v(items, num_frames, num_inference_steps), items):
+                results[id(item)] = frames
+        return [results[id(item)] for item in batch]
+
+    def _t2v_embeddings(self, t2v_pipe, prompts, negative_prompts):
+        """
+        prompt_embeds / negative_prompt_embeds desde la caché de embeddings:
+        T5 (que con offload secuencial va y viene de la GPU capa a capa) solo corre para textos nuevos.
+        """
+        device = t2v_pipe._execution_device
+
+        def encode(text):
+            return t2v_pipe.encode_prompt(text, do_classifier_free_guidance=False, device=device)[0]
+
+        def embed(texts):
+            embeddings = [prompt_embedding_cache.get_or_encode(T2V_MODEL_ID, text, encode) for text in texts]
+            # La caché es compartida: pueden venir de un engine con otra precisión (fp16 en GPU, bf16 en CPU)
+            return torch.cat(embeddings).to(device=device, dtype=self.dtype)
+
+        return embed(prompts), embed([text or "" for text in negative_prompts])
+
+    def _diffuse_t2v(self, items, num_frames, num_inference_steps):
+        for item in items:
+            item.progress.update("diffusion", 0.0, batchSize=len(items))
+        callback = BatchCallback([item.progress.diffusion_callback("t2v", num_inference_steps) for item in items])
+
+        if len(items) == 1:
+            logger.info(f"Starting T2V Generation: {items[0].inputs['prompt']}")
+            generator = self._generator(items[0].inputs["seed"])
+        else:
+            logger.info(f"Starting batched T2V Generation ({len(items)} prompts)")
+            # Con lista de generators cada trabajo conserva su seed (y sin seed, una aleatoria propia)
+            generator = []
+            for item in items:
+                item_generator = self._generator(item.inputs["seed"])
+                if item_generator is None:
+                    item_generator = torch.Generator()
+                    item_generator.seed()
+                generator.append(item_generator)
+
+        with self.models.use("t2v") as t2v_pipe:
+            prompt_embeds, negative_prompt_embeds = self._t2v_embeddings(
+                t2v_pipe, [item.inputs["prompt"] for item in items], [item.inputs["negative_prompt"] for item in items]
+            )
+            try:
+                frames = t2v_pipe(
+                    prompt_embeds=prompt_embeds,
+                    negative_prompt_embeds=negative_prompt_embeds,
+                    num_frames=num_frames,
+                    num_inference_steps=num_inference_steps,
+                    generator=generator,
+                    callback_on_step_end=callback
+                ).frames
+            except JobCancelled:
+                # Solo llega aquí si se cancelaron todos los trabajos del lote
+                frames = [None] * len(items)
+        return [callback.cancelled.get(i, output) for i, output in enumerate(frames)]
+
+    def _extension_pipe(self, t2v_pipe):
+        """CogVideoXVideoToVideoPipeline sobre los mismos módulos (y hooks de offload) que el pipeline T2V."""
+        pipe = self._extension_pipes.get(t2v_pipe)
+        if pipe is None:
+            from diffusers import CogVideoXVideoToVideoPipeline
+
+            pipe = CogVideoXVideoToVideoPipeline(**t2v_pipe.components)
+            self._extension_pipes[t2v_pipe] = pipe
+        return pipe
+
+    def _diffuse_chunk(self, prompt, negative_prompt, generator, conditioning, num_inference_steps, callback,
+                       progress: JobProgress):
+        """Un trozo de un vídeo segmentado: T2V el primero, video-to-video sobre `conditioning` los siguientes."""
+        with self._locked("t2v"):
+            progress.check_cancelled()
+            with self.models.use("t2v") as t2v_pipe:
+                prompt_embeds, negative_prompt_embeds = self._t2v_embeddings(t2v_pipe, [prompt], [negative_prompt])
+                if conditioning is None:
+                    return t2v_pipe(
+                        prompt_embeds=prompt_embeds,
+                        negative_prompt_embeds=negative_prompt_embeds,
+                        num_frames=T2V_MAX_FRAMES,
+                        num_inference_steps=num_inference_steps,
+                        generator=generator,
+                        callback_on_step_end=callback
+                    ).frames[0]
+                return self._extension_pipe(t2v_pipe)(
+                    video=conditioning,
+                    prompt_embeds=prompt_embeds,
+                    negative_prompt_embeds=negative_prompt_embeds,
+                    num_inference_steps=num_inference_steps,
+                    strength=SEGMENT_STRENGTH,
+                    generator=generator,
+                    callback_on_step_end=callback
+                ).frames[0]
+
+    def generate_segmented_text_to_video(self, prompt, negative_prompt="", num_frames=24, seed=-1, fps=24, upscale=False,
+                                         face_image: Image.Image = None, upload_object: Optional[str] = None,
+                                         progress: Optional[JobProgress] = None, interpolation: Optional[str] = None):
+        """
+        Vídeo más largo que una pasada del modelo (ver services/segmented). Con
+        `upload_object`, los segmentos HLS se suben según terminan (la URL de la
+        playlist viaja en los webhooks de progreso) y devuelve la URL del MP4
+        final; sin él, la ruta local del MP4.
+        """
+        progress = progress or NullProgress()
+        num_inference_steps = inference_steps("t2v", self.device_type)
+        mode = interpolation_mode(interpolation)
+        # El mismo solape (ya acotado) planifica los trozos y recorta cada uno
+        overlap = segment_overlap(T2V_MAX_FRAMES, SEGMENT_OVERLAP_FRAMES)
+        # Los trozos se planifican en keyframes; cada uno se interpola en su post-proceso
+        chunks = plan_chunks(keyframe_count(num_frames, mode.factor), T2V_MAX_FRAMES, overlap)
+        extension_steps = int(num_inference_steps * SEGMENT_STRENGTH)
+        total_steps = num_inference_steps + extension_steps * (len(chunks) - 1)
+        logger.info(f"Segmented T2V Generation: {num_frames} frames in {len(chunks)} chunks ({mode.name} interpolation)")
+
+        segment_dir = os.path.join(self.output_dir, str(uuid.uuid4()))
+        os.makedirs(segment_dir)
+        object_prefix = os.path.splitext(upload_object)[0] if upload_object else None
+        playlist = None
+        if upload_object:
+            playlist = HlsPlaylist(fps, lambda text: upload_stream(
+                BytesIO(text.encode()), f"{object_prefix}/index.m3u8", content_type=PLAYLIST_CONTENT_TYPE))
+
+        futures, segment_paths = [], []
+        tail, done_steps, emitted = None, 0, 0
+        try:
+            progress.update("diffusion", 0.0, segments=len(chunks))
+            for index, new_frames in enumerate(chunks):
+                steps = num_inference_steps if index == 0 else extension_steps
+                callback = progress.diffusion_callback("t2v", total_steps, offset=done_steps, steps=steps)
+                # Seed fija => cada trozo con su propia seed derivada, reproducible
+                generator = self._generator(seed + index if seed != -1 else -1)
+                conditioning = conditioning_video(tail, T2V_MAX_FRAMES) if tail is not None else None
+                frames = self._diffuse_chunk(prompt, negative_prompt, generator, conditioning, num_inference_steps,
+                                             callback, progress)
+                done_steps += steps
+                # El primer trozo aporta sus primeros frames; los demás, los que siguen al solape
+                # (el último trozo puede ser más corto: el resto del relleno de conditioning_video sobra)
+                start = 0 if index == 0 else overlap
+                output = frames[start:start + new_frames]
+                # Con interpolación, los trozos siguientes llevan delante el último keyframe del anterior:
+                # los frames entre ambos se sintetizan en este trozo y el ancla no se vuelve a codificar
+                skip_first = index > 0 and mode.factor > 1
+                if skip_first:
+                    output = [tail[-1], *output]
+                tail = frames[max(start + new_frames - overlap, 0):start + new_frames]
+                segment_frames = min(interpolated_count(len(output), mode.factor, skip_first), num_frames - emitted)
+                emitted += segment_frames
+
+                segment_path = os.path.join(segment_dir, f"seg_{index:05d}.mp4")
+                segment_paths.append(segment_path)
+                segment = {"index": index, "count": len(chunks), "path": segment_path, "frames": segment_frames,
+                           "playlist": playlist,
+                           "object": f"{object_prefix}/seg_{index:05d}.mp4" if object_prefix else None}
+                futures.append(self.post_pipeline.submit({
+                    "frames": output, "fps": fps, "face_image": face_image, "upscale": upscale,
+                    "progress": SegmentProgress(progress, index), "upload_object": None, "segment": segment,
+                    "interpolation": {"mode": mode, "skip_first": skip_first, "limit": segment_frames},
+                }))
+
+            for future in futures:
+                future.result()
+            progress.check_cancelled()
+
+            output_path = concat_segments(segment_paths, os.path.join(self.output_dir, f"{uuid.uuid4()}.mp4"))
+            if not upload_object:
+                return output_path
+            try:
+                progress.update("upload", 0.0)
+                url = upload_file(output_path, object_name=upload_object, progress_callback=progress.upload_callback())
+                playlist.finish()
+                return url
+            finally:
+                os.remove(output_path)
+        finally:
+            # Trozos aún en el pipeline (cancelado o fallido): que terminen antes de borrar sus archivos
+            for future in futures:
+                try:
+                    future.result()
+                except BaseException:
+                    pass
+            shutil.rmtree(segment_dir, ignore_errors=True)
+
+    def generate_text_to_video(self, prompt, negative_prompt="", num_frames=24, seed=-1, fps=24, upscale=False, face_image: Image.Image = None,
+                               upload_object: Optional[str] = None, progress: Optional[JobProgress] = None,
+                               interpolation: Optional[str] = None):
+        """
+        Returns the local video path, or the S3 URL when `upload_object` is given.
+        `interpolation`: modo de services/interpolation (None = INTERPOLATION_DEFAULT).
+        """
+        mode = interpolation_mode(interpolation)
+        # La difusión genera keyframes; los frames intermedios se sintetizan en el post-proceso
+        keyframes = keyframe_count(num_frames, mode.factor)
+        if keyframes > T2V_MAX_FRAMES:
+            if SEGMENTED_GENERATION:
+                return self.generate_segmented_text_to_video(prompt, negative_prompt, num_frames, seed, fps, upscale,
+                                                             face_image, upload_object, progress, mode.name)
+            logger.warning(f"{keyframes} keyframes exceed one T2V pass, generating {T2V_MAX_FRAMES}")
+            keyframes = T2V_MAX_FRAMES
+            num_frames = interpolated_count(keyframes, mode.factor)
+        progress = progress or NullProgress()
+        num_inference_steps = inference_steps("t2v", self.device_type)
+        # Difusión (posiblemente por lotes con otros trabajos de la misma forma); el post-proceso es de cada uno
+        frames = self.t2v_batcher.submit(
+            (keyframes, num_inference_steps),
+            {"prompt": prompt, "negative_prompt": negative_prompt, "seed": seed},
+            progress,
+        )
+        return self._finish(frames, fps, face_image, upscale, progress, upload_object,
+                            {"mode": mode, "limit": num_frames})
 
 # Global Instance
 engine = AIEngine()
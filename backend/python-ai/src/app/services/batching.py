@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, Dict, Hashable, List
+
+from .cancellation import JobCancelled
+from .metrics import diffusion_batch_size
+
+logger = logging.getLogger(__name__)
+
+# Máximo de trabajos T2V por llamada al pipeline (1 = sin batching)
+T2V_MAX_BATCH = int(os.getenv("T2V_MAX_BATCH", "1"))
+# Cuánto espera el primer trabajo de un lote a que lleguen otros compatibles
+T2V_BATCH_WINDOW_MS = float(os.getenv("T2V_BATCH_WINDOW_MS", "200"))
+
+
+@dataclass
+class BatchItem:
+    """Un trabajo esperando su parte de una llamada al pipeline."""
+    inputs: Dict[str, Any]
+    progress: Any
+    future: Future = field(default_factory=Future)
+    leader: bool = False
+
+
+class DiffusionBatcher:
+    """
+    Agrupa llamadas compatibles (misma clave: frames, pasos...) que llegan desde
+    varios hilos worker y las ejecuta como una sola llamada por lotes.
+
+    El primer trabajo de cada clave hace de líder: espera hasta `window`
+    segundos (o hasta llenar el lote), toma el lock de la GPU y, ya con el
+    lock, se lleva todo lo compatible que haya llegado mientras tanto (así,
+    con la GPU ocupada, los picos de tráfico forman lotes solos). Si sobran
+    trabajos, el primero de los restantes pasa a ser el líder del siguiente.
+    Cada hilo recibe su resultado y sigue con su post-proceso.
+    """
+
+    def __init__(self, model: str, run_batch: Callable[[Hashable, List[BatchItem]], List[Any]],
+                 lock: Callable[[], ContextManager], max_batch: int = T2V_MAX_BATCH,
+                 window: float = T2V_BATCH_WINDOW_MS / 1000):
+        self.model = model
+        self.run_batch = run_batch
+        self.lock = lock
+        self.max_batch = max(1, max_batch)
+        self.window = window if self.max_batch > 1 else 0.0
+        self._pending: Dict[Hashable, List[BatchItem]] = {}
+        self._changed = threading.Condition()
+        self.stats = {"batches": 0, "items": 0, "largest": 0}
+
+    def submit(self, key: Hashable, inputs: Dict[str, Any], progress) -> Any:
+        """Bloquea hasta que el lote que incluye este trabajo termina; devuelve su resultado."""
+        item = BatchItem(inputs, progress)
+        with self._changed:
+            group = self._pending.setdefault(key, [])
+            group.append(item)
+            item.leader = len(group) == 1
+            self._changed.notify_all()
+            while not item.leader and not item.future.done():
+                self._changed.wait()
+        if not item.future.done():
+            self._lead(key)
+        return item.future.result()
+
+    def _lead(self, key: Hashable):
+        deadline = time.monotonic() + self.window
+        with self._changed:
+            while len(self._pending[key]) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+
+        with self.lock():
+            with self._changed:
+                group = self._pending.pop(key)
+                batch, rest = group[:self.max_batch], group[self.max_batch:]
+                if rest:
+                    rest[0].leader = True
+                    self._pending[key] = rest
+                    self._changed.notify_all()
+            self._run(key, batch)
+
+    def _run(self, key: Hashable, batch: List[BatchItem]):
+        diffusion_batch_size.labels(self.model).observe(len(batch))
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        self.stats["largest"] = max(self.stats["largest"], len(batch))
+        if len(batch) > 1:
+            logger.info(f"Batched {len(batch)} {self.model} jobs {key}")
+        try:
+            results = self.run_batch(key, batch)
+        except BaseException as e:
+            for item in batch:
+                item.future.set_exception(e)
+        else:
+            for item, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    item.future.set_exception(result)
+                else:
+                    item.future.set_result(result)
+        finally:
+            with self._changed:
+                self._changed.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._changed:
+            waiting = sum(len(group) for group in self._pending.values())
+        return {"max_batch": self.max_batch, "window": self.window, "waiting": waiting, **self.stats}
+
+
+class BatchCallback:
+    """
+    callback_on_step_end que avisa al progreso de cada trabajo del lote. Un
+    trabajo cancelado a mitad deja de recibir avisos (su resultado se
+    descarta); si se cancelan todos, JobCancelled corta la llamada.
+    """
+
+    def __init__(self, callbacks: List[Callable]):
+        self.callbacks = callbacks
+        self.cancelled: Dict[int, JobCancelled] = {}
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        for index, callback in enumerate(self.callbacks):
+            if index in self.cancelled:
+                continue
+            try:
+                callback_kwargs = callback(pipe, step, timestep, callback_kwargs)
+            except JobCancelled as e:
+                self.cancelled[index] = e
+                if len(self.cancelled) == len(self.callbacks):
+                    raise
+        return callback_kwargs
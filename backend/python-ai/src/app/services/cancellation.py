@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+# Plazo por defecto de un trabajo (segundos desde que se encola); 0 = sin plazo
+JOB_DEFAULT_TIMEOUT = float(os.getenv("JOB_DEFAULT_TIMEOUT", "0"))
+# Cada cuánto se consulta la marca de cancelación en la cola (con Redis es un GET)
+CANCEL_POLL_INTERVAL = float(os.getenv("CANCEL_POLL_INTERVAL", "1.0"))
+
+
+class JobCancelled(Exception):
+    """El trabajo se canceló por API ("cancelled") o superó su plazo ("deadline")."""
+
+    def __init__(self, job_id: str, reason: str):
+        super().__init__("deadline exceeded" if reason == "deadline" else "cancelled by request")
+        self.job_id = job_id
+        self.reason = reason
+
+
+def job_deadline(timeout: Optional[float], enqueued_at: Optional[float] = None) -> Optional[float]:
+    """Epoch límite a partir del timeout del request (o JOB_DEFAULT_TIMEOUT)."""
+    timeout = timeout if timeout is not None else JOB_DEFAULT_TIMEOUT
+    if not timeout or timeout <= 0:
+        return None
+    return (enqueued_at or time.time()) + timeout
+
+
+class CancelToken:
+    """
+    Se consulta en los puntos seguros del pipeline (cada paso de denoising,
+    cada frame de face swap/upscale/encode, entre etapas) y hace que el
+    trabajo lance JobCancelled en el siguiente de ellos.
+    """
+
+    def __init__(self, job_id: str, deadline: Optional[float] = None,
+                 is_cancelled: Optional[Callable[[str], bool]] = None, poll_interval: float = CANCEL_POLL_INTERVAL):
+        self.job_id = job_id
+        self.deadline = deadline
+        self.is_cancelled = is_cancelled
+        self.poll_interval = poll_interval
+        self._reason: Optional[str] = None
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+
+    def reason(self) -> Optional[str]:
+        """"cancelled", "deadline" o None."""
+        with self._lock:
+            if self._reason:
+                return self._reason
+            now = time.monotonic()
+            if self.deadline and time.time() >= self.deadline:
+                self._reason = "deadline"
+            elif self.is_cancelled and now - self._last_poll >= self.poll_interval:
+                self._last_poll = now
+                if self.is_cancelled(self.job_id):
+                    self._reason = "cancelled"
+            return self._reason
+
+    def check(self):
+        reason = self.reason()
+        if reason:
+            raise JobCancelled(self.job_id, reason)
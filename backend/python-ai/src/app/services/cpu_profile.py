@@ -0,0 +1,112 @@
+"""
+Perfil de ejecución para engines en CPU (nodos sin GPU, capacidad extra
+para previews y trabajos pequeños).
+
+En CPU fp16 no tiene kernels rápidos (muchas ops se emulan o fallan) y el
+offload secuencial solo añade hooks. En su lugar: bf16 si el procesador lo
+soporta (AVX512-BF16/AMX) y si no fp32, pesos conv en channels-last, número
+de hilos fijo, torch.compile opcional del transformer/UNet y del VAE, y
+menos pasos de denoising (CogVideoX con su scheduler DPM).
+"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# auto (bf16 si hay soporte nativo, si no fp32) | bf16 | fp32
+CPU_DTYPE = os.getenv("CPU_DTYPE", "auto")
+# Hilos de torch para los engines en CPU (0 = todos los núcleos)
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+CPU_CHANNELS_LAST = os.getenv("CPU_CHANNELS_LAST", "1") == "1"
+# torch.compile del transformer/UNet y el VAE: la primera llamada tarda minutos, las siguientes van más rápido
+CPU_COMPILE = os.getenv("CPU_COMPILE", "0") == "1"
+# Pasos de denoising en CPU (en GPU: 30 T2V, 25 I2V)
+CPU_T2V_STEPS = int(os.getenv("CPU_T2V_STEPS", "15"))
+CPU_I2V_STEPS = int(os.getenv("CPU_I2V_STEPS", "12"))
+
+DEFAULT_STEPS = {"t2v": 30, "i2v": 25}
+CPU_STEPS = {"t2v": CPU_T2V_STEPS, "i2v": CPU_I2V_STEPS}
+# Módulos del pipeline que se compilan / pasan a channels-last
+DENOISERS = ("transformer", "unet")
+
+_threads_lock = threading.Lock()
+_threads_configured = False
+
+
+def bf16_supported() -> bool:
+    import torch
+
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def cpu_dtype():
+    import torch
+
+    if CPU_DTYPE == "fp32":
+        return torch.float32
+    if CPU_DTYPE == "bf16" or (CPU_DTYPE == "auto" and bf16_supported()):
+        return torch.bfloat16
+    return torch.float32
+
+
+def inference_steps(kind: str, device: str) -> int:
+    return CPU_STEPS[kind] if device == "cpu" else DEFAULT_STEPS[kind]
+
+
+def configure_threads():
+    """torch.set_num_threads es global del proceso: se aplica una vez, con el primer engine en CPU."""
+    global _threads_configured
+    import torch
+
+    with _threads_lock:
+        if _threads_configured:
+            return
+        threads = CPU_THREADS or os.cpu_count() or 1
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(max(1, min(4, threads // 4)))
+        except RuntimeError:
+            # Solo se puede fijar antes de que arranque el primer trabajo paralelo
+            pass
+        _threads_configured = True
+        logger.info(f"CPU profile: {threads} torch threads, dtype {cpu_dtype()}")
+
+
+def _channels_last(module):
+    import torch
+
+    # Formato según el rango de cada peso: el VAE de CogVideoX y el UNet/VAE de SVD mezclan
+    # Conv3d con Conv2d (down/upsample), y module.to(channels_last_3d) falla con los pesos 4D
+    formats = {4: torch.channels_last, 5: torch.channels_last_3d}
+    for param in module.parameters():
+        memory_format = formats.get(param.dim())
+        if memory_format is not None:
+            param.data = param.data.contiguous(memory_format=memory_format)
+
+
+def apply_cpu_profile(pipe, kind: str):
+    """Prepara un pipeline de diffusers (ya cargado en cpu_dtype) para ejecutarse en CPU."""
+    import torch
+
+    if kind == "t2v":
+        # Mismo espacio de sigmas que CogVideoXDDIMScheduler, pero DPM++: calidad parecida con la mitad de pasos
+        from diffusers import CogVideoXDPMScheduler
+
+        pipe.scheduler = CogVideoXDPMScheduler.from_config(pipe.scheduler.config, timestep_spacing="trailing")
+
+    modules = [getattr(pipe, name, None) for name in (*DENOISERS, "vae")]
+    for module in filter(None, modules):
+        if CPU_CHANNELS_LAST:
+            _channels_last(module)
+
+    if CPU_COMPILE:
+        for name in DENOISERS:
+            module = getattr(pipe, name, None)
+            if module is not None:
+                setattr(pipe, name, torch.compile(module, dynamic=False))
+        pipe.vae.decode = torch.compile(pipe.vae.decode, dynamic=False)
+    return pipe
@@ -0,0 +1,196 @@
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from .job_queue import Job, JobQueue
+from .model_registry import DEVICE, HOST, ModelRegistry, host_ram_budget
+
+logger = logging.getLogger(__name__)
+
+# Dispositivos con un engine cada uno: "cuda:0,cuda:1", "cpu,cpu" (pruebas) o "auto" (todas las GPUs)
+ENGINE_DEVICES = [d.strip() for d in os.getenv("ENGINE_DEVICES", "").split(",") if d.strip()]
+# Trabajos asignados por dispositivo a la vez (el que corre + los que esperan en su cola local)
+DEVICE_QUEUE_DEPTH = int(os.getenv("DEVICE_QUEUE_DEPTH", "2"))
+# Coste de cambiar de modelo en un dispositivo, en "trabajos de espera" equivalentes
+DEVICE_SWAP_PENALTY = float(os.getenv("DEVICE_SWAP_PENALTY", "1.0"))
+
+MODEL_FOR_KIND = {"text": "t2v", "image": "i2v"}
+
+
+def models_for_job(job: Job) -> List[str]:
+    """Modelos que va a usar un trabajo: su pipeline y, según la petición, el upscaler y el face swap."""
+    models = [MODEL_FOR_KIND[job.kind]] if job.kind in MODEL_FOR_KIND else []
+    if job.payload.get("upscale"):
+        models.append("upscaler")
+    if job.payload.get("faceImageUrl"):
+        models.append("face")
+    return models
+
+
+def resolve_devices(spec: List[str]) -> List[str]:
+    if spec != ["auto"]:
+        return spec
+    import torch
+
+    if torch.cuda.is_available():
+        return [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    return ["cpu"]
+
+
+class DeviceWorker:
+    """Un engine, su cola local de trabajos asignados y el hilo que los ejecuta."""
+
+    def __init__(self, index: int, engine):
+        self.index = index
+        self.engine = engine
+        self.jobs: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self.pending = 0
+        # Modelos que necesitan los trabajos asignados y aún no terminados
+        self.assigned: Counter = Counter()
+        self.stats = {"jobs": 0, "warm_routes": 0}
+
+    @property
+    def device(self) -> str:
+        return self.engine.device
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "device": self.device,
+            "pending": self.pending,
+            "models": {name: entry["state"] for name, entry in self.engine.models.stats()["models"].items()},
+            **self.stats,
+        }
+
+
+class DevicePool:
+    """
+    Runs one AIEngine per device and routes each job to the device where it
+    will start soonest: devices that already hold the job's model (or will,
+    because a queued job needs it) avoid a model swap, and among those the one
+    with the shortest local queue wins. A swap is weighed as DEVICE_SWAP_PENALTY
+    queued jobs, so an idle device still takes work from a busy warm one.
+    """
+
+    def __init__(self, engines: List[Any], queue_depth: int = DEVICE_QUEUE_DEPTH, swap_penalty: float = DEVICE_SWAP_PENALTY,
+                 threads: int = 1):
+        self.workers = [DeviceWorker(i, engine) for i, engine in enumerate(engines)]
+        # Varios hilos por dispositivo para que los trabajos T2V compatibles se junten en un lote
+        self.threads = max(1, threads)
+        self.queue_depth = max(1, queue_depth, self.threads)
+        self.swap_penalty = swap_penalty
+        self._changed = threading.Condition()
+
+    def _swap_cost(self, worker: DeviceWorker, model: Optional[str]) -> float:
+        if model is None or worker.assigned[model]:
+            return 0.0
+        state = worker.engine.models.state(model)
+        if state == DEVICE:
+            return 0.0
+        if state == HOST:
+            # Promover desde RAM es mucho más barato que from_pretrained
+            return self.swap_penalty / 4
+        return self.swap_penalty
+
+    def route(self, job: Job) -> Optional[DeviceWorker]:
+        """Elige dispositivo (None si todos tienen la cola local llena)."""
+        model = MODEL_FOR_KIND.get(job.kind)
+        with self._changed:
+            candidates = [w for w in self.workers if w.pending < self.queue_depth]
+            if not candidates:
+                return None
+            worker = min(candidates, key=lambda w: (w.pending + self._swap_cost(w, model), w.pending, w.index))
+            if self._swap_cost(worker, model) == 0.0:
+                worker.stats["warm_routes"] += 1
+            worker.pending += 1
+            if model:
+                worker.assigned[model] += 1
+        logger.info(f"Job {job.id} ({job.kind}) -> {worker.device}#{worker.index} (pending {worker.pending})")
+        worker.jobs.put(job)
+        return worker
+
+    def _finished(self, worker: DeviceWorker, job: Job):
+        model = MODEL_FOR_KIND.get(job.kind)
+        with self._changed:
+            worker.pending -= 1
+            worker.stats["jobs"] += 1
+            if model:
+                worker.assigned[model] -= 1
+            self._changed.notify_all()
+
+    def _run_device(self, worker: DeviceWorker, process: Callable[[Job, Any], None]):
+        while True:
+            job = worker.jobs.get()
+            if job is None:
+                return
+            try:
+                process(job, worker.engine)
+            except Exception as e:
+                logger.error(f"Device {worker.device}#{worker.index} failed job {job.id}: {e}")
+            finally:
+                self._finished(worker, job)
+
+    def has_capacity(self) -> bool:
+        return any(w.pending < self.queue_depth for w in self.workers)
+
+    def run(self, job_queue: JobQueue, process: Callable[[Job, Any], None], stop_event: Optional[threading.Event] = None):
+        """
+        Saca trabajos de la cola compartida solo cuando algún dispositivo tiene
+        hueco, así otros hosts pueden llevarse el resto. `process(job, engine)`
+        ejecuta el trabajo y hace ack/retry.
+        """
+        threads = [
+            threading.Thread(target=self._run_device, args=(w, process), name=f"device-{w.index}-{t}", daemon=True)
+            for w in self.workers
+            for t in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f"Device pool: {', '.join(f'{w.device}#{w.index}' for w in self.workers)}")
+
+        while stop_event is None or not stop_event.is_set():
+            with self._changed:
+                if not self.has_capacity():
+                    self._changed.wait(timeout=1.0)
+                    continue
+            job = job_queue.dequeue(timeout=5)
+            if job is not None:
+                self.route(job)
+
+        for worker in self.workers:
+            for _ in range(self.threads):
+                worker.jobs.put(None)
+
+    def warm_up(self, names: List[str]):
+        """Reparte la precarga: cada dispositivo calienta un modelo distinto (afinidad desde el primer trabajo)."""
+        if not names:
+            return
+        for i in range(max(len(self.workers), len(names))):
+            worker = self.workers[i % len(self.workers)]
+            name = names[i % len(names)]
+            logger.info(f"Warming {name} on {worker.device}#{worker.index}")
+            worker.engine.models.get(name)
+
+    def models(self) -> Dict[str, str]:
+        """Mejor estado de cada modelo entre todos los dispositivos (para el heartbeat / readiness)."""
+        rank = {DEVICE: 2, HOST: 1}
+        merged: Dict[str, str] = {}
+        for worker in self.workers:
+            for name, entry in worker.engine.models.stats()["models"].items():
+                if rank.get(entry["state"], 0) >= rank.get(merged.get(name), 0):
+                    merged[name] = entry["state"]
+        return merged
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [worker.snapshot() for worker in self.workers]
+
+
+def create_device_pool(devices: List[str], **kwargs) -> DevicePool:
+    """Un AIEngine con su propio ModelRegistry por dispositivo; la RAM de CPU se reparte entre ellos."""
+    from .ai_engine import AIEngine
+
+    ram_budget = host_ram_budget(share=len(devices))
+    engines = [AIEngine(device, ModelRegistry(ram_budget=ram_budget, device=device)) for device in devices]
+    return DevicePool(engines, **kwargs)
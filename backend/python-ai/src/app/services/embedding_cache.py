@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Embeddings de texto en memoria (cada uno de CogVideoX-2b, 226x4096 en fp16, ocupa ~1.8 MB)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "128"))
+# Segundo nivel en disco (vacío = desactivado); sobrevive a reinicios y se comparte entre procesos
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "")
+
+
+def embedding_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{text}".encode()).hexdigest()
+
+
+class PromptEmbeddingCache:
+    """
+    LRU of text-encoder outputs keyed by (model id, text), shared by every
+    engine in the process. Tensors are kept on CPU and moved to the pipeline's
+    device on use; with EMBEDDING_CACHE_DIR set, misses fall back to a disk
+    tier before running the encoder.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, directory: str = EMBEDDING_CACHE_DIR):
+        self.max_size = max_size
+        self.directory = directory
+        self._embeddings: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pt")
+
+    def _remember(self, key: str, embedding):
+        with self._lock:
+            self._embeddings[key] = embedding
+            self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.max_size:
+                self._embeddings.popitem(last=False)
+
+    def _load(self, key: str):
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        import torch
+
+        try:
+            return torch.load(self._path(key), map_location="cpu", weights_only=True)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable embedding {key}: {e}")
+            return None
+
+    def _store(self, key: str, embedding):
+        import torch
+
+        # Escritura atómica: otro proceso puede estar leyendo la misma clave
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        try:
+            torch.save(embedding, tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write embedding cache entry: {e}")
+
+    def get_or_encode(self, model_id: str, text: str, encode: Callable[[str], Any]):
+        """Embedding de `text` en CPU; `encode(text)` solo se llama si no está en ningún nivel."""
+        key = embedding_key(model_id, text)
+        with self._lock:
+            if key in self._embeddings:
+                self._embeddings.move_to_end(key)
+                self.hits += 1
+                return self._embeddings[key]
+
+        embedding = self._load(key)
+        if embedding is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._remember(key, embedding)
+            return embedding
+
+        with self._lock:
+            self.misses += 1
+        embedding = encode(text).detach().to("cpu")
+        self._remember(key, embedding)
+        if self.directory:
+            self._store(key, embedding)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._embeddings.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._embeddings),
+            "max_size": self.max_size,
+            "directory": self.directory or None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+prompt_embedding_cache = PromptEmbeddingCache()
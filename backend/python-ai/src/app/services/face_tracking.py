@@ -0,0 +1,120 @@
+import copy
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# tracked: detección solo en keyframes + seguimiento por flujo óptico | full: detección en cada frame
+FACE_SWAP_MODE = os.getenv("FACE_SWAP_MODE", "tracked")
+FACE_REDETECT_INTERVAL = int(os.getenv("FACE_REDETECT_INTERVAL", "5"))
+FACE_SOURCE_CACHE_SIZE = int(os.getenv("FACE_SOURCE_CACHE_SIZE", "64"))
+# Error máximo de Lucas-Kanade por landmark antes de forzar una nueva detección
+FACE_TRACK_MAX_ERROR = float(os.getenv("FACE_TRACK_MAX_ERROR", "20"))
+
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+)
+
+
+def image_hash(img: np.ndarray) -> str:
+    h = hashlib.sha1(img.tobytes())
+    h.update(str(img.shape).encode())
+    return h.hexdigest()
+
+
+class SourceFaceCache:
+    """LRU of detected source faces (embedding + landmarks) keyed by image hash, shared across jobs."""
+
+    def __init__(self, max_size: int = FACE_SOURCE_CACHE_SIZE):
+        self.max_size = max_size
+        self._faces: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_detect(self, face_app, img_bgr: np.ndarray):
+        key = image_hash(img_bgr)
+        with self._lock:
+            if key in self._faces:
+                self._faces.move_to_end(key)
+                self.hits += 1
+                return self._faces[key]
+            self.misses += 1
+
+        faces = face_app.get(img_bgr)
+        face = faces[0] if faces else None
+        with self._lock:
+            self._faces[key] = face
+            while len(self._faces) > self.max_size:
+                self._faces.popitem(last=False)
+        return face
+
+    def stats(self):
+        return {"size": len(self._faces), "hits": self.hits, "misses": self.misses}
+
+
+source_face_cache = SourceFaceCache()
+
+
+def _propagate(face, kps: np.ndarray):
+    """Copia la cara detectada moviendo bbox y landmarks a la nueva posición."""
+    # insightface.app.common.Face es un dict cuyo __getattr__ devuelve None: copy.copy falla con él
+    moved = type(face)(face) if isinstance(face, dict) else copy.copy(face)
+    shift = (kps - face.kps).mean(axis=0)
+    moved.kps = kps.astype(np.float32)
+    moved.bbox = (np.asarray(face.bbox, dtype=np.float32) + np.tile(shift, 2)).astype(np.float32)
+    return moved
+
+
+def track_faces(face_app, frames_bgr: List[np.ndarray], redetect_interval: int = FACE_REDETECT_INTERVAL,
+                on_progress: Optional[Callable[[float], None]] = None):
+    """
+    Devuelve, por frame, la lista de caras objetivo. Solo se ejecuta la
+    detección completa en keyframes (cada `redetect_interval` frames o cuando
+    el seguimiento se pierde); en el resto se propagan bbox y landmarks con
+    flujo óptico Lucas-Kanade sobre los 5 puntos clave.
+    """
+    results = []
+    tracked = []
+    prev_gray: Optional[np.ndarray] = None
+    since_detect = 0
+    detections = 0
+
+    for frame in frames_bgr:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        need_detect = prev_gray is None or since_detect >= max(redetect_interval, 1)
+
+        if not need_detect:
+            propagated = []
+            for face in tracked:
+                prev_pts = face.kps.reshape(-1, 1, 2).astype(np.float32)
+                next_pts, status, err = cv2.calcOpticalFlowPyrLK(prev_gray, gray, prev_pts, None, **LK_PARAMS)
+                if next_pts is None or not status.all() or float(err.max()) > FACE_TRACK_MAX_ERROR:
+                    need_detect = True
+                    break
+                propagated.append(_propagate(face, next_pts.reshape(-1, 2)))
+            if not need_detect:
+                tracked = propagated
+                since_detect += 1
+
+        if need_detect:
+            tracked = list(face_app.get(frame))
+            since_detect = 1
+            detections += 1
+
+        results.append(tracked)
+        prev_gray = gray
+        if on_progress:
+            on_progress(len(results) / len(frames_bgr))
+
+    logger.info(f"Face tracking: {detections} detection(s) for {len(frames_bgr)} frames")
+    return results
@@ -0,0 +1,56 @@
+"""
+Buffer de frames del post-proceso.
+
+Entre la difusión y el encoder los frames viajan como un único array uint8
+contiguo (T, H, W, 3) en RGB, no como listas de imágenes PIL: cada etapa
+escribe sobre él (o sobre el de salida del upscaler) en lugar de convertir
+cada frame PIL -> numpy -> BGR -> RGB -> PIL y volver a reservarlo entero.
+Los buffers grandes (clips largos o escalados) van a un archivo temporal
+mapeado en memoria, así que no cuentan como memoria anónima del proceso y
+el sistema puede devolverlos a disco si hace falta.
+"""
+import logging
+import os
+import tempfile
+from typing import Iterable, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# A partir de este tamaño el buffer se mapea sobre un archivo temporal (0 = siempre en memoria)
+FRAME_BUFFER_MMAP_MB = int(os.getenv("FRAME_BUFFER_MMAP_MB", "256"))
+# Dónde se crean esos archivos (vacío = directorio temporal del sistema)
+FRAME_BUFFER_DIR = os.getenv("FRAME_BUFFER_DIR", "")
+
+
+def allocate_frames(count: int, height: int, width: int) -> np.ndarray:
+    """Buffer (count, height, width, 3) uint8 sin inicializar; memmap si supera FRAME_BUFFER_MMAP_MB."""
+    shape = (count, height, width, 3)
+    size = count * height * width * 3
+    if not FRAME_BUFFER_MMAP_MB or size < FRAME_BUFFER_MMAP_MB * 2**20:
+        return np.empty(shape, dtype=np.uint8)
+    # El archivo ya está borrado (o se borra al cerrarse): el mapeo lo mantiene vivo hasta liberar el buffer
+    with tempfile.TemporaryFile(dir=FRAME_BUFFER_DIR or None) as f:
+        return np.memmap(f, dtype=np.uint8, mode="w+", shape=shape)
+
+
+def as_frame_buffer(frames: Iterable) -> np.ndarray:
+    """
+    Frames (lista de PIL o de arrays HxWx3, o un array THWx3) como buffer
+    contiguo uint8. Si ya lo es, se devuelve tal cual, sin copiar.
+    """
+    if isinstance(frames, np.ndarray) and frames.dtype == np.uint8 and frames.flags.c_contiguous:
+        return frames
+    frames = list(frames)
+    first = np.asarray(frames[0])
+    buffer = allocate_frames(len(frames), first.shape[0], first.shape[1])
+    for index, frame in enumerate(frames):
+        buffer[index] = np.asarray(frame)
+    return buffer
+
+
+def swap_rgb_bgr(frame: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """RGB <-> BGR de un frame HxWx3, en su sitio salvo que se indique `out`."""
+    return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frame if out is None else out)
@@ -0,0 +1,202 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+INPUT_MAX_BYTES = int(os.getenv("INPUT_MAX_BYTES", str(20 * 1024 * 1024)))
+INPUT_FETCH_TIMEOUT = float(os.getenv("INPUT_FETCH_TIMEOUT", "30"))
+# Plazo de la descarga completa: INPUT_FETCH_TIMEOUT es por operación (conectar, cada lectura)
+INPUT_FETCH_TOTAL_TIMEOUT = float(os.getenv("INPUT_FETCH_TOTAL_TIMEOUT", "60"))
+INPUT_FETCH_CONCURRENCY = int(os.getenv("INPUT_FETCH_CONCURRENCY", "16"))
+INPUT_CACHE_MAX_ENTRIES = int(os.getenv("INPUT_CACHE_MAX_ENTRIES", "128"))
+# Dentro de esta ventana una entrada cacheada se usa sin revalidar (ni siquiera un 304)
+INPUT_CACHE_FRESH_SECONDS = float(os.getenv("INPUT_CACHE_FRESH_SECONDS", "300"))
+# Las caras de origen no necesitan más resolución que esto para la detección
+FACE_IMAGE_MAX_SIDE = int(os.getenv("FACE_IMAGE_MAX_SIDE", "1280"))
+
+# (width, height) exacto, o None para mantener el tamaño original
+Size = Optional[Tuple[int, int]]
+
+
+class InputFetchError(Exception):
+    pass
+
+
+@dataclass
+class FetchedImage:
+    image: Image.Image
+    sha256: str  # hash de los bytes originales (clave de la caché de resultados)
+    from_cache: bool = False
+
+
+@dataclass
+class _CacheEntry:
+    image: Image.Image
+    sha256: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+
+def decode_image(data: bytes, size: Size = None, max_side: Optional[int] = None) -> Image.Image:
+    """
+    Decodifica a RGB. En JPEGs grandes usa draft() para que libjpeg decodifique
+    directamente a 1/2, 1/4 o 1/8 de resolución cuando el destino es más pequeño.
+    """
+    img = Image.open(BytesIO(data))
+    if size is not None:
+        img.draft("RGB", size)
+        return img.convert("RGB").resize(size)
+    if max_side is not None and max(img.size) > max_side:
+        scale = max_side / max(img.size)
+        target = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img.draft("RGB", target)
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side))
+        return img
+    return img.convert("RGB")
+
+
+class ImageFetcher:
+    """
+    Descarga imágenes de entrada con un httpx.AsyncClient compartido (pool de
+    conexiones) en un event loop propio, varias a la vez, con límite de bytes y
+    plazo total. Las imágenes decodificadas y redimensionadas se cachean por URL +
+    tamaño y se revalidan con ETag / Last-Modified.
+    """
+
+    def __init__(self, max_bytes: int = INPUT_MAX_BYTES, timeout: float = INPUT_FETCH_TIMEOUT,
+                 total_timeout: float = INPUT_FETCH_TOTAL_TIMEOUT, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        # None = red real; los tests pasan un httpx.MockTransport
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, _CacheEntry]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.stats = {"downloads": 0, "bytes": 0, "hits": 0, "revalidated": 0}
+
+    def _ensure_started(self):
+        if self._started.is_set():
+            return
+        with self._start_lock:
+            if self._loop is None:
+                threading.Thread(target=self._run, name="image-fetcher", daemon=True).start()
+        self._started.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            transport=self._transport,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=INPUT_FETCH_CONCURRENCY, max_keepalive_connections=INPUT_FETCH_CONCURRENCY),
+        )
+        self._started.set()
+        self._loop.run_forever()
+
+    def _cache_get(self, key) -> Optional[_CacheEntry]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key, entry: _CacheEntry):
+        with self._cache_lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > INPUT_CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+
+    async def _fetch(self, url: str, size: Size, max_side: Optional[int]) -> FetchedImage:
+        key = (url, size, max_side)
+        cached = self._cache_get(key)
+        if cached and time.monotonic() - cached.validated_at < INPUT_CACHE_FRESH_SECONDS:
+            self.stats["hits"] += 1
+            return FetchedImage(cached.image, cached.sha256, from_cache=True)
+
+        headers = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        async with self._client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                cached.validated_at = time.monotonic()
+                self.stats["revalidated"] += 1
+                return FetchedImage(cached.image, cached.sha256, from_cache=True)
+            response.raise_for_status()
+
+            length = response.headers.get("Content-Length")
+            if length and int(length) > self.max_bytes:
+                raise InputFetchError(f"Input image too large ({length} bytes > {self.max_bytes}): {url}")
+            chunks = []
+            received = 0
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                if received > self.max_bytes:
+                    raise InputFetchError(f"Input image exceeds {self.max_bytes} bytes: {url}")
+                chunks.append(chunk)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+        data = b"".join(chunks)
+        self.stats["downloads"] += 1
+        self.stats["bytes"] += received
+        # Decodificar fuera del event loop para no frenar otras descargas
+        image = await self._loop.run_in_executor(None, decode_image, data, size, max_side)
+        sha256 = hashlib.sha256(data).hexdigest()
+        if etag or last_modified or INPUT_CACHE_FRESH_SECONDS > 0:
+            self._cache_put(key, _CacheEntry(image, sha256, etag, last_modified, time.monotonic()))
+        return FetchedImage(image, sha256)
+
+    def fetch(self, *requests: Tuple[Optional[str], Size, Optional[int]]) -> List[Optional[FetchedImage]]:
+        """
+        Descarga en paralelo. Cada request es (url, size, max_side); url None -> None.
+        Bloquea hasta que terminan todas (se llama desde el hilo del worker).
+        """
+        self._ensure_started()
+
+        async def gather():
+            async def one(url, size, max_side):
+                if not url:
+                    return None
+                try:
+                    return await asyncio.wait_for(self._fetch(url, size, max_side), self.total_timeout)
+                except asyncio.TimeoutError:
+                    raise InputFetchError(f"Input image download exceeded {self.total_timeout}s: {url}")
+            return await asyncio.gather(*(one(*r) for r in requests))
+
+        future = asyncio.run_coroutine_threadsafe(gather(), self._loop)
+        try:
+            # wait_for ya corta cada descarga; el margen cubre la decodificación en el executor
+            return future.result(timeout=self.total_timeout + self.timeout)
+        except concurrent.futures.TimeoutError:
+            # Sin cancelar, las descargas seguirían ocupando conexiones del pool
+            future.cancel()
+            raise InputFetchError(f"Input image download exceeded {self.total_timeout}s")
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "cached": len(self._cache)}
+
+
+image_fetcher = ImageFetcher()
@@ -0,0 +1,495 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuración desde variables de entorno
+REDIS_URL = os.getenv("REDIS_URL")
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "redis" if REDIS_URL else "local")
+JOB_QUEUE_PREFIX = os.getenv("JOB_QUEUE_PREFIX", "viarteia:jobs")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_STATUS_TTL = int(os.getenv("JOB_STATUS_TTL", "86400"))
+# Un worker que no renueva su heartbeat en este tiempo se considera caído
+WORKER_HEARTBEAT_TTL = int(os.getenv("WORKER_HEARTBEAT_TTL", "30"))
+# Identidad estable del worker (nombre del pod/servicio): su lista de trabajos en proceso se llama así.
+# Por defecto el hostname; si cambia al reiniciar, recover() de cualquier worker recoge la lista huérfana
+WORKER_ID = os.getenv("WORKER_ID") or socket.gethostname()
+
+# Clases de prioridad en orden de servicio: un worker solo saca "final" si no queda ningún "preview", etc.
+JOB_PRIORITIES = ["preview", "final", "batch"]
+DEFAULT_PRIORITY = "final"
+# Trabajos en cola como máximo por clase (0 = sin límite); con la clase llena, /generate responde 429
+JOB_QUEUE_LIMITS = {
+    "preview": int(os.getenv("JOB_QUEUE_LIMIT_PREVIEW", "20")),
+    "final": int(os.getenv("JOB_QUEUE_LIMIT_FINAL", "100")),
+    "batch": int(os.getenv("JOB_QUEUE_LIMIT_BATCH", "1000")),
+}
+# Trabajos en cola o en proceso a la vez por tenant (0 = sin límite)
+TENANT_MAX_JOBS = int(os.getenv("TENANT_MAX_JOBS", "4"))
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str  # "text" | "image"
+    payload: Dict[str, Any]
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+    # Epoch a partir del cual el trabajo se cancela solo (ver services/cancellation)
+    deadline: Optional[float] = None
+    priority: str = DEFAULT_PRIORITY
+    # Usuario/cliente que lo pidió, para TENANT_MAX_JOBS (None = sin límite)
+    tenant: Optional[str] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw) -> "Job":
+        return cls(**json.loads(raw))
+
+
+class QueueRejected(RuntimeError):
+    """La cola no admite el trabajo: `reason` es "queue_full" (su clase está llena) o "tenant_limit"."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _check_priority(job: Job):
+    if job.priority not in JOB_PRIORITIES:
+        raise ValueError(f"Unknown job priority {job.priority!r} (one of: {', '.join(JOB_PRIORITIES)})")
+
+
+class JobQueue(ABC):
+    """
+    Cola de trabajos de generación compartida entre la API HTTP y los workers
+    de GPU: una lista acotada por clase de prioridad (JOB_PRIORITIES) y un
+    límite de trabajos activos por tenant.
+    """
+
+    @abstractmethod
+    def enqueue(self, job: Job) -> bool:
+        """
+        Encola el trabajo. Devuelve False si el id ya fue visto (dedupe) y lanza
+        QueueRejected si su clase está llena o su tenant ya tiene TENANT_MAX_JOBS.
+        """
+
+    @abstractmethod
+    def dequeue(self, timeout: float = 5.0) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def ack(self, job: Job, status: str = "completed"):
+        ...
+
+    @abstractmethod
+    def retry(self, job: Job) -> bool:
+        """Reencola el trabajo si le quedan intentos. Devuelve False si se descartó."""
+
+    @abstractmethod
+    def status(self, job_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def depth(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def lanes(self) -> Dict[str, int]:
+        """Trabajos en cola por clase de prioridad."""
+
+    def peek(self, count: int = 1) -> List[Job]:
+        """Los siguientes `count` trabajos que saldrán de la cola, sin sacarlos."""
+        return []
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Marca el trabajo como cancelado. Si aún estaba en la cola se retira y
+        devuelve "cancelled"; si está en proceso devuelve "cancelling" (el
+        worker lo corta en el siguiente paso). Si ya había terminado devuelve
+        su estado final sin cambiarlo, y None si el id no existe.
+        """
+
+    @abstractmethod
+    def is_cancelled(self, job_id: str) -> bool:
+        ...
+
+    def recover(self) -> int:
+        """Devuelve a la cola los trabajos que quedaron en proceso tras un reinicio."""
+        return 0
+
+    @abstractmethod
+    def heartbeat(self, worker_id: str, info: Dict[str, Any]):
+        """Publica el estado de un worker (modelos cargados, trabajo actual); caduca tras WORKER_HEARTBEAT_TTL."""
+
+    @abstractmethod
+    def workers(self) -> Dict[str, Dict[str, Any]]:
+        """Workers vivos (con heartbeat reciente) y su último estado."""
+
+
+class LocalJobQueue(JobQueue):
+    """In-process stand-in for Redis (dev, Colab and tests). Not durable across restarts."""
+
+    def __init__(self):
+        self._lanes: Dict[str, deque] = {priority: deque() for priority in JOB_PRIORITIES}
+        self._status: Dict[str, tuple] = {}
+        self._processing = 0
+        self._workers: Dict[str, tuple] = {}
+        self._cancelled = set()
+        # Trabajos activos (en cola o en proceso) por tenant
+        self._tenants: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    def _set_status(self, job_id: str, status: str):
+        self._status[job_id] = (status, time.time())
+
+    def _prune(self):
+        cutoff = time.time() - JOB_STATUS_TTL
+        for job_id in [k for k, (_, ts) in self._status.items() if ts < cutoff]:
+            del self._status[job_id]
+            self._cancelled.discard(job_id)
+
+    def _admit(self, job: Job):
+        limit = JOB_QUEUE_LIMITS.get(job.priority, 0)
+        if limit and len(self._lanes[job.priority]) >= limit:
+            raise QueueRejected("queue_full", f"{job.priority} queue is full ({limit} jobs)")
+        if job.tenant and TENANT_MAX_JOBS:
+            active = self._tenants.setdefault(job.tenant, set())
+            if len(active) >= TENANT_MAX_JOBS:
+                raise QueueRejected("tenant_limit", f"tenant has {len(active)} active jobs (max {TENANT_MAX_JOBS})")
+            active.add(job.id)
+
+    def _release(self, job: Job):
+        active = self._tenants.get(job.tenant)
+        if active is not None:
+            active.discard(job.id)
+            if not active:
+                del self._tenants[job.tenant]
+
+    def enqueue(self, job: Job) -> bool:
+        _check_priority(job)
+        with self._lock:
+            self._prune()
+            if job.id in self._status:
+                return False
+            self._admit(job)
+            self._set_status(job.id, "queued")
+            self._lanes[job.priority].append(job)
+            self._available.notify()
+        return True
+
+    def _pop(self) -> Optional[Job]:
+        for priority in JOB_PRIORITIES:
+            if self._lanes[priority]:
+                return self._lanes[priority].popleft()
+        return None
+
+    def dequeue(self, timeout: float = 5.0) -> Optional[Job]:
+        deadline = time.monotonic() + timeout
+        with self._available:
+            job = self._pop()
+            while job is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._available.wait(remaining)
+                job = self._pop()
+            self._processing += 1
+            self._set_status(job.id, "processing")
+        return job
+
+    def ack(self, job: Job, status: str = "completed"):
+        with self._lock:
+            self._processing -= 1
+            self._set_status(job.id, status)
+            self._release(job)
+
+    def retry(self, job: Job) -> bool:
+        job.attempts += 1
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            self.ack(job, "failed")
+            return False
+        with self._lock:
+            self._processing -= 1
+            self._set_status(job.id, "queued")
+            self._lanes[job.priority].append(job)
+            self._available.notify()
+        return True
+
+    def status(self, job_id: str) -> Optional[str]:
+        entry = self._status.get(job_id)
+        return entry[0] if entry else None
+
+    def depth(self) -> Dict[str, int]:
+        return {"queued": sum(len(lane) for lane in self._lanes.values()), "processing": self._processing}
+
+    def lanes(self) -> Dict[str, int]:
+        return {priority: len(lane) for priority, lane in self._lanes.items()}
+
+    def peek(self, count: int = 1) -> List[Job]:
+        with self._lock:
+            return [job for priority in JOB_PRIORITIES for job in self._lanes[priority]][:count]
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            status = self.status(job_id)
+            if status not in ("queued", "processing"):
+                return status
+            self._cancelled.add(job_id)
+            if status == "processing":
+                return "cancelling"
+            pending = [job for lane in self._lanes.values() for job in lane if job.id == job_id]
+            for job in pending:
+                self._lanes[job.priority].remove(job)
+                self._release(job)
+            if not pending:
+                # Un worker lo acaba de sacar: lo cortará al empezar
+                return "cancelling"
+            self._set_status(job_id, "cancelled")
+            return "cancelled"
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return job_id in self._cancelled
+
+    def heartbeat(self, worker_id: str, info: Dict[str, Any]):
+        with self._lock:
+            self._workers[worker_id] = (info, time.time())
+
+    def workers(self) -> Dict[str, Dict[str, Any]]:
+        cutoff = time.time() - WORKER_HEARTBEAT_TTL
+        with self._lock:
+            return {k: info for k, (info, ts) in self._workers.items() if ts >= cutoff}
+
+
+# Encolado atómico: dedupe por id, límite de la clase y del tenant, y un token para despertar a un worker.
+# Devuelve 1 (encolado), 0 (id ya visto), -1 (clase llena) o -2 (tenant al límite)
+_ENQUEUE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+local limit = tonumber(ARGV[3])
+if limit > 0 and redis.call('LLEN', KEYS[2]) >= limit then return -1 end
+local tenant_limit = tonumber(ARGV[4])
+if tenant_limit > 0 then
+    if redis.call('SCARD', KEYS[3]) >= tenant_limit then return -2 end
+    redis.call('SADD', KEYS[3], ARGV[5])
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+end
+redis.call('SET', KEYS[1], 'queued', 'EX', ARGV[2])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('LPUSH', KEYS[4], '1')
+redis.call('LTRIM', KEYS[4], 0, 999)
+return 1
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Cola durable sobre Redis. Los trabajos se mueven atómicamente de la lista
+    de su clase a una lista `processing` por WORKER_ID (LMOVE), así que un
+    worker que muere no pierde el trabajo: `recover()` lo devuelve a la cola al
+    arrancar, junto con los de las listas de workers sin heartbeat vivo.
+    Un worker sin trabajo espera (BLPOP) en una lista de tokens que recibe uno
+    por trabajo encolado, en lugar de bloquearse en una sola de las clases.
+    """
+
+    def __init__(self, url: str = None, prefix: str = JOB_QUEUE_PREFIX):
+        import redis
+
+        self.redis = redis.Redis.from_url(url or REDIS_URL or "redis://localhost:6379/0", decode_responses=True)
+        self.prefix = prefix
+        # "final" conserva la lista de antes: los trabajos ya encolados al actualizar siguen saliendo
+        self.lane_keys = {
+            priority: f"{prefix}:queued" if priority == DEFAULT_PRIORITY else f"{prefix}:queued:{priority}"
+            for priority in JOB_PRIORITIES
+        }
+        self.wakeup_key = f"{prefix}:wakeup"
+        self.processing_key = self._processing_key(WORKER_ID)
+        self._inflight: Dict[str, str] = {}
+        self._enqueue_script = self.redis.register_script(_ENQUEUE_SCRIPT)
+
+    def _status_key(self, job_id: str) -> str:
+        return f"{self.prefix}:status:{job_id}"
+
+    def _processing_key(self, owner: str) -> str:
+        return f"{self.prefix}:processing:{owner}"
+
+    def _worker_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:workers:{worker_id}"
+
+    def _cancel_key(self, job_id: str) -> str:
+        return f"{self.prefix}:cancel:{job_id}"
+
+    def _tenant_key(self, tenant: Optional[str]) -> str:
+        return f"{self.prefix}:tenant:{tenant or ''}"
+
+    def enqueue(self, job: Job) -> bool:
+        _check_priority(job)
+        keys = [self._status_key(job.id), self.lane_keys[job.priority], self._tenant_key(job.tenant), self.wakeup_key]
+        tenant_limit = TENANT_MAX_JOBS if job.tenant else 0
+        result = self._enqueue_script(keys=keys, args=[
+            job.to_json(), JOB_STATUS_TTL, JOB_QUEUE_LIMITS.get(job.priority, 0), tenant_limit, job.id,
+        ])
+        if result == -1:
+            raise QueueRejected("queue_full", f"{job.priority} queue is full ({JOB_QUEUE_LIMITS[job.priority]} jobs)")
+        if result == -2:
+            raise QueueRejected("tenant_limit", f"tenant has {TENANT_MAX_JOBS} active jobs (max {TENANT_MAX_JOBS})")
+        return result == 1
+
+    def _move_next(self) -> Optional[str]:
+        # LPUSH al encolar, LMOVE RIGHT al sacar: FIFO dentro de cada clase
+        for priority in JOB_PRIORITIES:
+            raw = self.redis.lmove(self.lane_keys[priority], self.processing_key, "RIGHT", "LEFT")
+            if raw is not None:
+                return raw
+        return None
+
+    def dequeue(self, timeout: float = 5.0) -> Optional[Job]:
+        deadline = time.monotonic() + timeout
+        raw = self._move_next()
+        while raw is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Cualquier encolado (de cualquier clase) deja un token; timeout 0 sería esperar para siempre
+            self.redis.blpop(self.wakeup_key, timeout=max(remaining, 0.01))
+            raw = self._move_next()
+        job = Job.from_json(raw)
+        self._inflight[job.id] = raw
+        self.redis.set(self._status_key(job.id), "processing", ex=JOB_STATUS_TTL)
+        return job
+
+    def ack(self, job: Job, status: str = "completed"):
+        raw = self._inflight.pop(job.id, None)
+        pipe = self.redis.pipeline()
+        if raw is not None:
+            pipe.lrem(self.processing_key, 1, raw)
+        pipe.set(self._status_key(job.id), status, ex=JOB_STATUS_TTL)
+        if job.tenant:
+            pipe.srem(self._tenant_key(job.tenant), job.id)
+        pipe.execute()
+
+    def retry(self, job: Job) -> bool:
+        job.attempts += 1
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            self.ack(job, "failed")
+            return False
+        raw = self._inflight.pop(job.id, None)
+        pipe = self.redis.pipeline()
+        if raw is not None:
+            pipe.lrem(self.processing_key, 1, raw)
+        pipe.lpush(self.lane_keys[job.priority], job.to_json())
+        pipe.lpush(self.wakeup_key, "1")
+        pipe.set(self._status_key(job.id), "queued", ex=JOB_STATUS_TTL)
+        pipe.execute()
+        return True
+
+    def status(self, job_id: str) -> Optional[str]:
+        return self.redis.get(self._status_key(job_id))
+
+    def depth(self) -> Dict[str, int]:
+        processing = sum(self.redis.llen(key) for key in self.redis.scan_iter(f"{self.prefix}:processing:*"))
+        return {"queued": sum(self.lanes().values()), "processing": processing}
+
+    def lanes(self) -> Dict[str, int]:
+        pipe = self.redis.pipeline()
+        for priority in JOB_PRIORITIES:
+            pipe.llen(self.lane_keys[priority])
+        return dict(zip(JOB_PRIORITIES, pipe.execute()))
+
+    def peek(self, count: int = 1) -> List[Job]:
+        # El siguiente de cada clase es el último de su lista
+        jobs = []
+        for priority in JOB_PRIORITIES:
+            if len(jobs) >= count:
+                break
+            raws = self.redis.lrange(self.lane_keys[priority], -(count - len(jobs)), -1)
+            jobs.extend(Job.from_json(raw) for raw in reversed(raws))
+        return jobs
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        status = self.status(job_id)
+        if status not in ("queued", "processing"):
+            return status
+        # La marca primero: si un worker lo saca de la cola ahora mismo, la verá al empezar
+        self.redis.set(self._cancel_key(job_id), "1", ex=JOB_STATUS_TTL)
+        if status == "processing":
+            return "cancelling"
+        for lane_key in self.lane_keys.values():
+            for raw in self.redis.lrange(lane_key, 0, -1):
+                job = Job.from_json(raw)
+                if job.id == job_id and self.redis.lrem(lane_key, 1, raw):
+                    pipe = self.redis.pipeline()
+                    pipe.set(self._status_key(job_id), "cancelled", ex=JOB_STATUS_TTL)
+                    if job.tenant:
+                        pipe.srem(self._tenant_key(job.tenant), job_id)
+                    pipe.execute()
+                    return "cancelled"
+        return "cancelling"
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return bool(self.redis.exists(self._cancel_key(job_id)))
+
+    def heartbeat(self, worker_id: str, info: Dict[str, Any]):
+        self.redis.set(self._worker_key(worker_id), json.dumps(info), ex=WORKER_HEARTBEAT_TTL)
+
+    def workers(self) -> Dict[str, Dict[str, Any]]:
+        keys = list(self.redis.scan_iter(self._worker_key("*")))
+        if not keys:
+            return {}
+        prefix_len = len(self._worker_key(""))
+        return {key[prefix_len:]: json.loads(raw) for key, raw in zip(keys, self.redis.mget(keys)) if raw}
+
+    def _orphaned_processing_keys(self) -> List[str]:
+        """Listas processing de otros WORKER_ID sin ningún proceso con heartbeat vivo (p.ej. hostname que cambió)."""
+        live = {worker_id.rsplit(":", 1)[0] for worker_id in self.workers()}
+        prefix_len = len(self._processing_key(""))
+        return [
+            key for key in self.redis.scan_iter(self._processing_key("*"))
+            if key != self.processing_key and key[prefix_len:] not in live
+        ]
+
+    def recover(self) -> int:
+        # Cada trabajo vuelve al frente de su clase (sale el siguiente), con su token. LREM decide quién
+        # lo mueve si dos workers arrancan a la vez y recogen la misma lista huérfana
+        recovered = 0
+        for key in [self.processing_key] + self._orphaned_processing_keys():
+            for raw in reversed(self.redis.lrange(key, 0, -1)):
+                if not self.redis.lrem(key, 1, raw):
+                    continue
+                job = Job.from_json(raw)
+                pipe = self.redis.pipeline()
+                pipe.rpush(self.lane_keys[job.priority], raw)
+                pipe.lpush(self.wakeup_key, "1")
+                pipe.set(self._status_key(job.id), "queued", ex=JOB_STATUS_TTL)
+                pipe.execute()
+                recovered += 1
+        if recovered:
+            logger.warning(f"Recovered {recovered} interrupted job(s) back into the queue")
+        return recovered
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            if JOB_QUEUE_BACKEND == "redis":
+                _job_queue = RedisJobQueue()
+            else:
+                _job_queue = LocalJobQueue()
+            logger.info(f"Job queue backend: {JOB_QUEUE_BACKEND}")
+        return _job_queue
@@ -0,0 +1,189 @@
+"""
+Métricas Prometheus y spans de traza por trabajo.
+
+Los histogramas se alimentan desde el pipeline (JobProgress, el registry de
+modelos, el lock del engine, el notifier). Los contadores que ya existían
+como dicts de estadísticas (cachés, encoder, webhooks...) se leen en cada
+scrape con un collector, sin duplicar la instrumentación.
+"""
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("viarteia.trace")
+
+# Puerto del endpoint de métricas de cada proceso worker (python -m app.worker); 0 = desactivado
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+# Spans de traza por trabajo como líneas JSON en el logger "viarteia.trace"
+TRACE_SPANS = os.getenv("TRACE_SPANS", "1") == "1"
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+stage_seconds = Histogram(
+    "viarteia_stage_seconds", "Duration of each pipeline stage", ["stage"], buckets=STAGE_BUCKETS,
+)
+job_seconds = Histogram(
+    "viarteia_job_seconds", "End-to-end duration of a generation job", ["kind", "outcome"], buckets=STAGE_BUCKETS,
+)
+jobs_total = Counter("viarteia_jobs", "Generation jobs by outcome", ["kind", "outcome"])
+jobs_rejected = Counter(
+    "viarteia_jobs_rejected", "Generation requests rejected by admission control (429)", ["kind", "priority", "reason"],
+)
+lock_wait_seconds = Histogram(
+    "viarteia_engine_lock_wait_seconds", "Time spent waiting for AIEngine.lock", ["kind"], buckets=STAGE_BUCKETS,
+)
+model_load_seconds = Histogram(
+    "viarteia_model_load_seconds", "Model load (from_pretrained) and promotion (host RAM -> device) time",
+    ["model", "operation"], buckets=STAGE_BUCKETS,
+)
+model_switch_seconds = Histogram(
+    "viarteia_model_switch_seconds",
+    "Time until a model that was not ready on the device can run (evictions + load or promotion)",
+    ["model", "operation"], buckets=STAGE_BUCKETS,
+)
+diffusion_batch_size = Histogram(
+    "viarteia_diffusion_batch_size", "Jobs per batched diffusion call", ["model"], buckets=(1, 2, 3, 4, 6, 8, 12, 16),
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    stage_seconds.labels(stage).observe(seconds)
+
+
+def trace_span(job_id: str, name: str, start: float, seconds: float, **attributes):
+    """Emite un span (inicio en epoch, duración) como una línea JSON."""
+    if not TRACE_SPANS or not job_id:
+        return
+    span = {"trace_id": job_id, "span": name, "start": round(start, 4), "duration": round(seconds, 4), **attributes}
+    trace_logger.info(json.dumps(span))
+
+
+class ServiceCollector:
+    """Expone en cada scrape las estadísticas que ya llevan los servicios."""
+
+    def describe(self):
+        # Sin describe(), el registry llamaría a collect() al registrarse (imports circulares)
+        return []
+
+    def collect(self):
+        from .image_fetch import image_fetcher
+        from .job_queue import get_job_queue
+        from .model_registry import ModelRegistry, model_registry
+        from .notifier import notifier
+        from .prompt_expander import prompt_expander
+        from .video_encoder import encode_stats
+
+        try:
+            depth = get_job_queue().depth()
+            queue = GaugeMetricFamily("viarteia_queue_depth", "Jobs in the queue", labels=["state"])
+            for state, value in depth.items():
+                queue.add_metric([state], value)
+            yield queue
+            lanes = GaugeMetricFamily("viarteia_queue_lane_depth", "Queued jobs per priority class", labels=["priority"])
+            for priority, value in get_job_queue().lanes().items():
+                lanes.add_metric([priority], value)
+            yield lanes
+        except Exception as e:
+            logger.warning(f"Queue depth unavailable: {e}")
+
+        memory = GaugeMetricFamily("viarteia_model_memory_bytes", "Estimated model weights resident", labels=["device", "memory"])
+        states = GaugeMetricFamily("viarteia_model_state", "Model residency (1 for the current state)", labels=["device", "model", "state"])
+        # Un registry por engine: el global y, con DevicePool, uno por dispositivo
+        seen: Dict[str, int] = {}
+        for registry in list(ModelRegistry.instances):
+            stats = registry.stats()
+            if registry is not model_registry and not stats["models"]:
+                continue
+            device = registry.device or "default"
+            # Varios "dispositivos" iguales (p.ej. cpu,cpu en pruebas): cpu, cpu#1...
+            seen[device] = seen.get(device, -1) + 1
+            if seen[device]:
+                device = f"{device}#{seen[device]}"
+            memory.add_metric([device, "vram"], stats["vram_used"])
+            memory.add_metric([device, "ram"], stats["ram_used"])
+            for name, entry in stats["models"].items():
+                states.add_metric([device, name, entry["state"]], 1)
+        yield memory
+        yield states
+
+        pipeline = sys.modules.get("app.services.pipeline")
+        if pipeline is not None:
+            queued = GaugeMetricFamily("viarteia_pipeline_queued", "Jobs waiting for a pipeline stage", labels=["pipeline", "stage"])
+            busy = GaugeMetricFamily("viarteia_pipeline_busy", "Jobs running in a pipeline stage", labels=["pipeline", "stage"])
+            for instance in list(pipeline.StagePipeline.instances):
+                for stage, entry in instance.snapshot().items():
+                    queued.add_metric([instance.name, stage], entry["queued"])
+                    busy.add_metric([instance.name, stage], entry["busy"])
+            yield queued
+            yield busy
+
+        # torch solo si ya está cargado en este proceso (el proceso HTTP no lo importa)
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            gpu = GaugeMetricFamily("viarteia_gpu_memory_bytes", "CUDA memory", labels=["device", "kind"])
+            for index in range(torch.cuda.device_count()):
+                gpu.add_metric([str(index), "allocated"], torch.cuda.memory_allocated(index))
+                gpu.add_metric([str(index), "reserved"], torch.cuda.memory_reserved(index))
+            yield gpu
+
+        hits = CounterMetricFamily("viarteia_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("viarteia_cache_misses", "Cache misses", labels=["cache"])
+        caches: Dict[str, Any] = {}
+        fetch = image_fetcher.snapshot()
+        caches["input_images"] = (fetch["hits"] + fetch["revalidated"], fetch["downloads"])
+        prompts = prompt_expander.snapshot()
+        caches["magic_prompt"] = (prompts["hits"], prompts["requests"] - prompts["hits"])
+        face_tracking = sys.modules.get("app.services.face_tracking")
+        if face_tracking is not None:
+            faces = face_tracking.source_face_cache.stats()
+            caches["source_face"] = (faces["hits"], faces["misses"])
+        embedding_cache = sys.modules.get("app.services.embedding_cache")
+        if embedding_cache is not None:
+            embeddings = embedding_cache.prompt_embedding_cache.stats()
+            caches["prompt_embeddings"] = (embeddings["hits"] + embeddings["disk_hits"], embeddings["misses"])
+        try:
+            from .result_cache import get_result_cache
+            results = get_result_cache().stats()
+            caches["result"] = (results["hits"], results["misses"])
+        except Exception as e:
+            logger.warning(f"Result cache stats unavailable: {e}")
+        for name, (hit, miss) in caches.items():
+            hits.add_metric([name], hit)
+            misses.add_metric([name], miss)
+        yield hits
+        yield misses
+
+        webhooks = notifier.snapshot()
+        sent = CounterMetricFamily("viarteia_webhooks", "Webhook deliveries", labels=["result"])
+        for result in ("sent", "coalesced", "retries", "failed"):
+            sent.add_metric([result], webhooks[result])
+        yield sent
+
+        yield CounterMetricFamily("viarteia_encodes", "Video encodes", value=encode_stats["count"])
+        yield CounterMetricFamily("viarteia_encoded_frames", "Frames encoded", value=encode_stats["frames"])
+        yield CounterMetricFamily("viarteia_nvenc_failures", "NVENC encodes that fell back to libx264",
+                                  value=encode_stats["nvenc_failures"])
+
+
+REGISTRY.register(ServiceCollector())
+
+
+def metrics_payload():
+    """(body, content type) para el endpoint /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> Optional[int]:
+    """Endpoint /metrics propio para un proceso worker (sus contadores no llegan al proceso HTTP)."""
+    if not port:
+        return None
+    start_http_server(port)
+    logger.info(f"Metrics on :{port}/metrics")
+    return port
+
@@ -0,0 +1,321 @@
+import gc
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import model_load_seconds, model_switch_seconds
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Estados de residencia
+UNLOADED = "unloaded"
+HOST = "host"      # pesos en RAM de CPU, listos para promover sin from_pretrained
+DEVICE = "device"  # listo para ejecutar
+LOADING = "loading"  # un hilo lo está cargando o promoviendo (fuera del lock); los demás esperan su evento
+
+
+def _total_host_memory() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def _total_device_memory(device: Optional[str] = None) -> int:
+    try:
+        import torch
+        if torch.cuda.is_available() and (device is None or device.startswith("cuda")):
+            return torch.cuda.get_device_properties(torch.device(device or "cuda").index or 0).total_memory
+    except Exception:
+        pass
+    return 0
+
+
+def host_ram_budget(share: int = 1) -> int:
+    """Presupuesto de RAM de CPU (MODEL_RAM_BUDGET_GB o 75% del total) repartido entre `share` registries."""
+    total = MODEL_RAM_BUDGET if MODEL_RAM_BUDGET is not None else int(_total_host_memory() * 0.75)
+    return total // max(share, 1)
+
+
+def _budget_from_env(name: str) -> Optional[int]:
+    """None = automático; se calcula con la memoria total en el primer uso (evita importar torch al importar el módulo)."""
+    value = os.getenv(name)
+    if value is None:
+        return None
+    return int(float(value) * GB)
+
+
+T2V_MODEL_ID = os.getenv("T2V_MODEL_ID", "THUDM/CogVideoX-2b")
+I2V_MODEL_ID = os.getenv("I2V_MODEL_ID", "stabilityai/stable-video-diffusion-img2vid-xt")
+
+MODEL_VRAM_BUDGET = _budget_from_env("MODEL_VRAM_BUDGET_GB")
+MODEL_RAM_BUDGET = _budget_from_env("MODEL_RAM_BUDGET_GB")
+
+
+def module_bytes(obj) -> int:
+    """Tamaño de los pesos de un nn.Module o de todos los módulos de un pipeline de diffusers."""
+    modules = []
+    if hasattr(obj, "parameters"):
+        modules.append(obj)
+    elif hasattr(obj, "components"):
+        modules.extend(c for c in obj.components.values() if hasattr(c, "parameters"))
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], size_hint: int,
+                 promote: Optional[Callable[[Any], None]] = None,
+                 demote: Optional[Callable[[Any], None]] = None,
+                 offloaded: bool = False):
+        self.name = name
+        self.loader = loader
+        self.promote = promote
+        self.demote = demote
+        # offloaded: los pesos viven en RAM de CPU incluso mientras se ejecuta (cpu offload hooks)
+        self.offloaded = offloaded
+        self.size = size_hint
+        self.model = None
+        self.state = UNLOADED
+        # Se señala al terminar la carga/promoción en curso (con éxito o no)
+        self.ready: Optional[threading.Event] = None
+        self.in_use = 0
+        self.last_used = 0.0
+        self.counters = {"loads": 0, "hits": 0, "promotions": 0, "demotions": 0, "evictions": 0, "load_seconds": 0.0,
+                         "last_switch_seconds": 0.0}
+
+    @property
+    def vram(self) -> int:
+        # Lo que se está cargando ya tiene su hueco reservado
+        return self.size if self.state in (DEVICE, LOADING) and not self.offloaded else 0
+
+    @property
+    def ram(self) -> int:
+        if self.state == HOST or (self.state in (DEVICE, LOADING) and self.offloaded):
+            return self.size
+        return 0
+
+
+class ModelRegistry:
+    """
+    Keeps models resident under a VRAM and host-RAM budget. Least recently used
+    models are demoted to CPU RAM first (when they support it) and only fully
+    unloaded when RAM is also over budget, so switching between pipelines no
+    longer pays a full from_pretrained every time.
+    """
+
+    # Todos los registries del proceso (uno por dispositivo con DevicePool), para las métricas
+    instances: "weakref.WeakSet[ModelRegistry]" = weakref.WeakSet()
+
+    def __init__(self, vram_budget: Optional[int] = MODEL_VRAM_BUDGET, ram_budget: Optional[int] = MODEL_RAM_BUDGET,
+                 device: Optional[str] = None):
+        self.device = device
+        self._vram_budget = vram_budget
+        self._ram_budget = ram_budget
+        self._entries: "OrderedDict[str, ModelEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        ModelRegistry.instances.add(self)
+
+    @property
+    def vram_budget(self) -> int:
+        if self._vram_budget is None:
+            self._vram_budget = int(_total_device_memory(self.device) * 0.9)
+        return self._vram_budget
+
+    @property
+    def ram_budget(self) -> int:
+        if self._ram_budget is None:
+            self._ram_budget = int(_total_host_memory() * 0.75)
+        return self._ram_budget
+
+    def register(self, name: str, loader: Callable[[], Any], size_hint: int = 0, replace: bool = False, **kwargs):
+        """replace=True sustituye un modelo ya registrado (p.ej. stubs en benchmarks), descargándolo antes."""
+        with self._lock:
+            if name in self._entries and replace:
+                self._unload(self._entries.pop(name))
+            if name not in self._entries:
+                self._entries[name] = ModelEntry(name, loader, size_hint, **kwargs)
+
+    def vram_used(self) -> int:
+        return sum(e.vram for e in self._entries.values())
+
+    def ram_used(self) -> int:
+        return sum(e.ram for e in self._entries.values())
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.state in (DEVICE, HOST)
+
+    def state(self, name: str) -> str:
+        entry = self._entries.get(name)
+        return entry.state if entry is not None else UNLOADED
+
+    def get(self, name: str):
+        """Devuelve el modelo listo para ejecutar, cargándolo o promoviéndolo si hace falta."""
+        return self._acquire(name, pin=False)
+
+    def _acquire(self, name: str, pin: bool):
+        """
+        La carga (from_pretrained, minutos) y la promoción corren fuera del
+        lock: stats() (heartbeat del worker) y los modelos ya cargados siguen
+        respondiendo. Quien pide un modelo que otro hilo está cargando espera
+        a que termine. pin=True lo marca en uso antes de soltar el lock.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries[name]
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(name)
+
+                if entry.state == DEVICE:
+                    entry.counters["hits"] += 1
+                    entry.in_use += pin
+                    return entry.model
+                if entry.state != LOADING:
+                    previous = entry.state
+                    # Cambio de modelo: se mide entero, incluido desalojar a los demás
+                    switch_start = time.perf_counter()
+                    if previous == HOST:
+                        self._make_room(entry, vram=not entry.offloaded, ram=False)
+                    else:
+                        self._make_room(entry, vram=not entry.offloaded, ram=entry.offloaded)
+                    entry.state = LOADING
+                    entry.ready = threading.Event()
+                    break
+                ready = entry.ready
+            ready.wait()
+
+        try:
+            start = time.perf_counter()
+            if previous == HOST:
+                logger.info(f"Promoting {name} from host RAM")
+                if entry.promote:
+                    entry.promote(entry.model)
+                model = entry.model
+            else:
+                model = entry.loader()
+            elapsed = time.perf_counter() - start
+        except BaseException:
+            with self._lock:
+                entry.state = previous
+            entry.ready.set()
+            raise
+
+        with self._lock:
+            entry.model = model
+            entry.state = DEVICE
+            entry.in_use += pin
+            if previous == HOST:
+                model_load_seconds.labels(name, "promote").observe(elapsed)
+                entry.counters["promotions"] += 1
+                self._record_switch(entry, "promote", switch_start)
+            else:
+                model_load_seconds.labels(name, "load").observe(elapsed)
+                measured = module_bytes(model)
+                if measured:
+                    entry.size = measured
+                entry.counters["loads"] += 1
+                entry.counters["load_seconds"] += elapsed
+                logger.info(f"Loaded {name} in {elapsed:.1f}s ({entry.size / GB:.2f} GB)")
+                self._record_switch(entry, "load", switch_start)
+        entry.ready.set()
+        return model
+
+    def _record_switch(self, entry: ModelEntry, operation: str, start: float):
+        elapsed = time.perf_counter() - start
+        model_switch_seconds.labels(entry.name, operation).observe(elapsed)
+        entry.counters["last_switch_seconds"] = round(elapsed, 3)
+
+    @contextmanager
+    def use(self, name: str):
+        """Como get(), pero el modelo no puede ser desalojado mientras se usa."""
+        model = self._acquire(name, pin=True)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._entries[name].in_use -= 1
+
+    def _candidates(self, exclude: ModelEntry):
+        # LRU primero
+        return [e for e in self._entries.values()
+                if e is not exclude and e.in_use == 0 and e.state not in (UNLOADED, LOADING)]
+
+    def _make_room(self, incoming: ModelEntry, vram: bool, ram: bool):
+        freed = False
+        if vram and self.vram_budget:
+            for entry in self._candidates(incoming):
+                if self.vram_used() + incoming.size <= self.vram_budget:
+                    break
+                if entry.vram:
+                    self._demote(entry)
+                    freed = True
+        if self.ram_budget:
+            needed = incoming.size if ram else 0
+            for entry in self._candidates(incoming):
+                if self.ram_used() + needed <= self.ram_budget:
+                    break
+                if entry.ram:
+                    self._unload(entry)
+                    freed = True
+        if freed:
+            self._cleanup_memory()
+
+    def _demote(self, entry: ModelEntry):
+        if entry.demote is None:
+            self._unload(entry)
+            return
+        logger.info(f"Demoting {entry.name} to host RAM")
+        entry.demote(entry.model)
+        entry.state = HOST
+        entry.counters["demotions"] += 1
+
+    def _unload(self, entry: ModelEntry):
+        logger.info(f"Evicting {entry.name}")
+        entry.model = None
+        entry.state = UNLOADED
+        entry.counters["evictions"] += 1
+
+    def unload(self, name: str):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and entry.state not in (UNLOADED, LOADING) and entry.in_use == 0:
+                self._unload(entry)
+                self._cleanup_memory()
+
+    def _cleanup_memory(self):
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "device": self.device,
+                # None: automático y todavía sin calcular (ningún modelo cargado en este proceso)
+                "vram_budget": self._vram_budget,
+                "ram_budget": self._ram_budget,
+                "vram_used": self.vram_used(),
+                "ram_used": self.ram_used(),
+                "models": {
+                    name: {"state": e.state, "size": e.size, "in_use": e.in_use, **e.counters}
+                    for name, e in self._entries.items()
+                },
+            }
+
+
+model_registry = ModelRegistry()
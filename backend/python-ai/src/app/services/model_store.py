@@ -0,0 +1,210 @@
+"""
+Store local de modelos pre-convertidos.
+
+`from_pretrained` con ids del hub resuelve (y si falta, descarga) cada
+archivo en cada carga, y el upscaler bajaba sus pesos de GitHub. Aquí cada
+modelo se guarda una vez, ya en fp16 y en safetensors, en MODEL_STORE_DIR:
+
+    python -m app.services.model_store t2v i2v upscaler
+
+Al cargar desde el store los safetensors se mapean en memoria (sin copia
+intermedia en RAM) y no se toca la red. Con MODEL_STORE_OFFLINE=1 el worker
+comprueba al arrancar que todo está en local y no llega a arrancar si falta
+algo. Mientras un trabajo corre, los archivos del modelo que necesita el
+siguiente de la cola se leen en segundo plano (page cache del sistema), así
+que el cambio de modelo no espera al disco.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from .model_registry import GB, I2V_MODEL_ID, T2V_MODEL_ID
+
+logger = logging.getLogger(__name__)
+
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", "models/store")
+# 1 = sin red: los modelos tienen que estar en MODEL_STORE_DIR (se comprueba al arrancar el worker)
+MODEL_STORE_OFFLINE = os.getenv("MODEL_STORE_OFFLINE", "0") == "1"
+# Leer por adelantado el modelo del siguiente trabajo de la cola
+MODEL_PREFETCH = os.getenv("MODEL_PREFETCH", "1") == "1"
+# Un modelo ya leído no se vuelve a leer antes de este tiempo (sigue en la page cache)
+MODEL_PREFETCH_INTERVAL = float(os.getenv("MODEL_PREFETCH_INTERVAL", "600"))
+
+# Pipelines de diffusers: clase, id en el hub y argumentos para descargarlo de allí
+PIPELINES = {
+    "t2v": ("CogVideoXPipeline", T2V_MODEL_ID, {}),
+    "i2v": ("StableVideoDiffusionPipeline", I2V_MODEL_ID, {"variant": "fp16"}),
+}
+UPSCALER_WEIGHTS_URL = "https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth"
+UPSCALER_WEIGHTS = "RealESRGAN_x2plus.safetensors"
+# insightface: buffalo_l (root='models') y el swapper, que no se convierten
+FACE_MODEL_PATHS = ("models/models/buffalo_l", "models/inswapper_128.onnx")
+STORE_MODELS = ["t2v", "i2v", "upscaler", "face"]
+
+_READ_CHUNK = 16 * 1024 * 1024
+
+
+class ModelNotStored(RuntimeError):
+    pass
+
+
+def model_path(name: str) -> str:
+    return os.path.join(MODEL_STORE_DIR, name)
+
+
+def is_stored(name: str) -> bool:
+    if name in PIPELINES:
+        return os.path.exists(os.path.join(model_path(name), "model_index.json"))
+    if name == "upscaler":
+        return os.path.exists(os.path.join(model_path(name), UPSCALER_WEIGHTS))
+    if name == "face":
+        return all(os.path.exists(path) for path in FACE_MODEL_PATHS)
+    return False
+
+
+def model_files(name: str) -> List[str]:
+    """Archivos de pesos de un modelo en el store (lo que se prefetchea)."""
+    root = FACE_MODEL_PATHS[0] if name == "face" else model_path(name)
+    paths = [FACE_MODEL_PATHS[1]] if name == "face" else []
+    for directory, _, files in os.walk(root):
+        paths.extend(os.path.join(directory, f) for f in files if f.endswith((".safetensors", ".onnx")))
+    return paths
+
+
+def _not_stored(name: str) -> ModelNotStored:
+    return ModelNotStored(f"{name} is not in {MODEL_STORE_DIR} and MODEL_STORE_OFFLINE=1 "
+                          f"(run: python -m app.services.model_store {name})")
+
+
+def load_pipeline(name: str, torch_dtype):
+    """Pipeline de diffusers desde el store (safetensors mapeados) o, si no está, desde el hub."""
+    import diffusers
+
+    class_name, model_id, hub_kwargs = PIPELINES[name]
+    pipeline_class = getattr(diffusers, class_name)
+    if is_stored(name):
+        logger.info(f"Loading {name} from {model_path(name)}")
+        return pipeline_class.from_pretrained(model_path(name), torch_dtype=torch_dtype, use_safetensors=True)
+    if MODEL_STORE_OFFLINE:
+        raise _not_stored(name)
+    return pipeline_class.from_pretrained(model_id, torch_dtype=torch_dtype, **hub_kwargs)
+
+
+def load_upscaler_weights() -> Dict:
+    """state_dict de RealESRGAN x2plus: del store (mmap) o descargado una vez a la caché de torch.hub."""
+    path = os.path.join(model_path("upscaler"), UPSCALER_WEIGHTS)
+    if os.path.exists(path):
+        from safetensors.torch import load_file
+
+        return load_file(path)
+    if MODEL_STORE_OFFLINE:
+        raise _not_stored("upscaler")
+    import torch
+
+    state = torch.hub.load_state_dict_from_url(UPSCALER_WEIGHTS_URL, map_location="cpu", weights_only=True)
+    return state.get("params_ema", state.get("params", state))
+
+
+def convert(name: str):
+    """Descarga el modelo y lo guarda en el store en fp16 + safetensors (escritura atómica del directorio)."""
+    import torch
+
+    target = model_path(name)
+    tmp = f"{target}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    start = time.perf_counter()
+    if name in PIPELINES:
+        class_name, model_id, hub_kwargs = PIPELINES[name]
+        import diffusers
+
+        pipe = getattr(diffusers, class_name).from_pretrained(model_id, torch_dtype=torch.float16, **hub_kwargs)
+        pipe.save_pretrained(tmp, safe_serialization=True)
+    elif name == "upscaler":
+        from safetensors.torch import save_file
+
+        os.makedirs(tmp)
+        state = torch.hub.load_state_dict_from_url(UPSCALER_WEIGHTS_URL, map_location="cpu", weights_only=True)
+        state = state.get("params_ema", state.get("params", state))
+        save_file({key: tensor.contiguous() for key, tensor in state.items()}, os.path.join(tmp, UPSCALER_WEIGHTS))
+    else:
+        raise ValueError(f"{name} cannot be converted (face models are used as they are in models/)")
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    logger.info(f"Stored {name} in {target} in {time.perf_counter() - start:.1f}s")
+
+
+def check_model_store(names: Iterable[str] = STORE_MODELS) -> List[str]:
+    """Comprobación de arranque: devuelve los modelos que no están en local."""
+    missing = [name for name in names if not is_stored(name)]
+    if MODEL_STORE_OFFLINE:
+        # huggingface_hub lo lee al importarse: la comprobación corre antes de importar diffusers
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        if missing:
+            logger.error(f"MODEL_STORE_OFFLINE=1 but not in {MODEL_STORE_DIR}: {', '.join(missing)}")
+    elif missing:
+        logger.info(f"Not in the local model store (loaded from the hub): {', '.join(missing)}")
+    return missing
+
+
+def _read_ahead(path: str, buffer: bytearray) -> int:
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                return total
+            total += read
+
+
+class ModelPrefetcher:
+    """Lee en un hilo los archivos de un modelo del store para que su carga no espere al disco."""
+
+    def __init__(self, interval: float = MODEL_PREFETCH_INTERVAL):
+        self.interval = interval
+        self._running = set()
+        self._last: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {"prefetches": 0, "bytes": 0, "seconds": 0.0}
+
+    def prefetch(self, name: str) -> bool:
+        if not MODEL_PREFETCH or not is_stored(name):
+            return False
+        with self._lock:
+            if name in self._running or time.monotonic() - self._last.get(name, -self.interval) < self.interval:
+                return False
+            self._running.add(name)
+        threading.Thread(target=self._run, args=(name,), name=f"prefetch-{name}", daemon=True).start()
+        return True
+
+    def _run(self, name: str):
+        start = time.perf_counter()
+        total = 0
+        buffer = bytearray(_READ_CHUNK)
+        try:
+            for path in model_files(name):
+                total += _read_ahead(path, buffer)
+        except OSError as e:
+            logger.warning(f"Prefetch of {name} failed: {e}")
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._running.discard(name)
+                self._last[name] = time.monotonic()
+                self.stats["prefetches"] += 1
+                self.stats["bytes"] += total
+                self.stats["seconds"] += elapsed
+        logger.info(f"Prefetched {name} ({total / GB:.2f} GB) in {elapsed:.1f}s")
+
+
+model_prefetcher = ModelPrefetcher()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    for model_name in sys.argv[1:] or ["t2v", "i2v", "upscaler"]:
+        convert(model_name)
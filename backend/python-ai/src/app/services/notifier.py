@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+NODE_API_URL = os.getenv("NODE_API_URL", "http://localhost:3001")
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "8"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", "5"))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", "0.5"))
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class WebhookNotifier:
+    """
+    Single long-lived webhook client for job status updates to the Node API.
+
+    notify() never blocks the caller: updates go to a per-job pending slot that
+    a few sender coroutines drain on a background event loop with a pooled
+    httpx.AsyncClient. A newer progress update replaces one that has not been
+    sent yet (coalescing). Terminal statuses are never dropped and are retried
+    with exponential backoff on network errors and 5xx responses. Updates for
+    a job are sent one at a time, in order.
+    """
+
+    def __init__(self, base_url: str = NODE_API_URL, concurrency: int = WEBHOOK_CONCURRENCY,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.webhook_url = f"{base_url}/api/generations/webhook/update"
+        self.concurrency = concurrency
+        # None = red real; los tests pasan un httpx.MockTransport
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._in_flight = set()
+        # Trabajos con estado terminal ya enviado: se descarta progreso tardío
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        # Updates entregados a call_soon_threadsafe que el loop aún no procesó
+        self._submitting = 0
+        self._submitting_lock = threading.Lock()
+        self._ready: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {
+            "sent": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failed": 0,
+            "latency_total_seconds": 0.0,
+            "latency_max_seconds": 0.0,
+            "latency_last_seconds": 0.0,
+        }
+
+    # --- API pública (thread-safe) ---
+
+    def notify(self, job_id: str, status: str, progress: int, result_url: Optional[str] = None, error: Optional[str] = None, **extra):
+        payload = {"id": job_id, "status": status, "progress": progress, **extra}
+        if result_url:
+            payload["resultUrl"] = result_url
+        if error:
+            payload["error"] = error
+        self._ensure_started()
+        with self._submitting_lock:
+            self._submitting += 1
+        self._loop.call_soon_threadsafe(self._submit, payload, time.perf_counter())
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Espera a que no queden updates pendientes (shutdown / benchmarks)."""
+        if self._loop is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self._submitting and not self._pending and not self._in_flight:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["pending"] = len(self._pending)
+        stats["latency_avg_seconds"] = stats["latency_total_seconds"] / stats["sent"] if stats["sent"] else 0.0
+        return stats
+
+    # --- bucle de eventos en segundo plano ---
+
+    def _ensure_started(self):
+        if self._started.is_set():
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="webhook-notifier", daemon=True)
+                self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready = asyncio.Queue()
+        self._client = httpx.AsyncClient(
+            timeout=WEBHOOK_TIMEOUT,
+            transport=self._transport,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        for _ in range(self.concurrency):
+            self._loop.create_task(self._sender())
+        self._started.set()
+        self._loop.run_forever()
+
+    def _submit(self, payload: Dict[str, Any], enqueued_at: float):
+        with self._submitting_lock:
+            self._submitting -= 1
+        job_id = payload["id"]
+        terminal = payload["status"] in TERMINAL_STATUSES
+        if not terminal and job_id in self._finished:
+            return
+        if terminal:
+            # Antes de coalescer: el progreso que llegue después (hilos de post-proceso/subida) se descarta
+            self._finished[job_id] = None
+            while len(self._finished) > 10000:
+                self._finished.popitem(last=False)
+        current = self._pending.get(job_id)
+        if current is not None:
+            # Un estado terminal pendiente nunca se reemplaza por progreso
+            if current["payload"]["status"] in TERMINAL_STATUSES and not terminal:
+                return
+            current["payload"] = payload
+            self.stats["coalesced"] += 1
+            return
+        self._pending[job_id] = {"payload": payload, "enqueued_at": enqueued_at}
+        if job_id not in self._in_flight:
+            self._ready.put_nowait(job_id)
+
+    async def _sender(self):
+        while True:
+            job_id = await self._ready.get()
+            entry = self._pending.pop(job_id, None)
+            if entry is None:
+                continue
+            self._in_flight.add(job_id)
+            try:
+                await self._deliver(entry["payload"], entry["enqueued_at"])
+            finally:
+                self._in_flight.discard(job_id)
+                # Llegó otro update mientras se enviaba este: ahora le toca
+                if job_id in self._pending:
+                    self._ready.put_nowait(job_id)
+
+    async def _deliver(self, payload: Dict[str, Any], enqueued_at: float):
+        terminal = payload["status"] in TERMINAL_STATUSES
+        attempts = WEBHOOK_MAX_RETRIES if terminal else 1
+        for attempt in range(attempts):
+            try:
+                response = await self._client.post(self.webhook_url, json=payload)
+                response.raise_for_status()
+                latency = time.perf_counter() - enqueued_at
+                observe_stage("webhook", latency)
+                self.stats["sent"] += 1
+                self.stats["latency_total_seconds"] += latency
+                self.stats["latency_last_seconds"] = latency
+                self.stats["latency_max_seconds"] = max(self.stats["latency_max_seconds"], latency)
+                return
+            except Exception as e:
+                # Solo fallos de red y 5xx son transitorios: un 4xx se repetiría igual
+                if attempt + 1 < attempts and _retryable(e):
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(WEBHOOK_BACKOFF_BASE * (2 ** attempt))
+                    continue
+                self.stats["failed"] += 1
+                print(f"Failed to notify Node API: {e}")
+                return
+
+
+notifier = WebhookNotifier()
+
+
+def notify_node_api(job_id: str, status: str, progress: int, result_url: Optional[str] = None, error: Optional[str] = None, **extra):
+    """Encola un update de estado para el Node API (no bloqueante). `extra` viaja en el payload (stage, step...)."""
+    notifier.notify(job_id, status, progress, result_url=result_url, error=error, **extra)
@@ -0,0 +1,97 @@
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Trabajos que pueden esperar a la entrada de cada etapa; con la cola llena, la etapa anterior se detiene
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+# Hilos por etapa de CPU (ffmpeg ya usa varios núcleos; la subida espera sobre todo a la red)
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "1"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[Dict[str, Any]], Dict[str, Any]]
+    workers: int = 1
+
+
+class StagePipeline:
+    """
+    Etapas encadenadas por colas acotadas, cada una con sus propios hilos.
+
+    submit() deja el trabajo en la cola de la primera etapa (bloquea si está
+    llena) y devuelve un Future con el contexto final. Mientras un trabajo se
+    codifica o se sube, el siguiente ya puede estar en la etapa anterior, así
+    que el throughput se acerca al de la etapa más lenta y no a la suma de
+    todas. Si una etapa falla, el Future recibe la excepción y el trabajo no
+    pasa a las siguientes.
+    """
+
+    instances: "weakref.WeakSet[StagePipeline]" = weakref.WeakSet()
+
+    def __init__(self, name: str, stages: List[Stage], queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.stats = {stage.name: {"jobs": 0, "busy": 0, "seconds": 0.0} for stage in stages}
+        self._stats_lock = threading.Lock()
+        self._started = False
+        self._start_lock = threading.Lock()
+        StagePipeline.instances.add(self)
+
+    def _start(self):
+        # Hilos al primer trabajo: crear el engine (o un DevicePool) no arranca nada
+        with self._start_lock:
+            if self._started:
+                return
+            for index, stage in enumerate(self.stages):
+                for n in range(max(1, stage.workers)):
+                    threading.Thread(
+                        target=self._work, args=(index,), name=f"{self.name}-{stage.name}-{n}", daemon=True
+                    ).start()
+            self._started = True
+
+    def submit(self, context: Dict[str, Any]) -> Future:
+        self._start()
+        future: Future = Future()
+        self.queues[0].put((context, future))
+        return future
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats[stage.name]
+        while True:
+            context, future = self.queues[index].get()
+            with self._stats_lock:
+                stats["busy"] += 1
+            start = time.perf_counter()
+            try:
+                context = stage.run(context)
+            except BaseException as e:
+                future.set_exception(e)
+                continue
+            finally:
+                with self._stats_lock:
+                    stats["busy"] -= 1
+                    stats["jobs"] += 1
+                    stats["seconds"] += time.perf_counter() - start
+            if index + 1 < len(self.stages):
+                self.queues[index + 1].put((context, future))
+            else:
+                future.set_result(context)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._stats_lock:
+            return {
+                stage.name: {**self.stats[stage.name], "queued": self.queues[i].qsize(), "workers": stage.workers}
+                for i, stage in enumerate(self.stages)
+            }
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .cancellation import CancelToken
+from .metrics import jobs_total, job_seconds, observe_stage, trace_span
+from .notifier import notify_node_api
+
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "0.5"))
+
+# Rango de progreso global (0-100) que ocupa cada etapa del pipeline
+STAGE_RANGES = {
+    "download": (5, 10),
+    "diffusion": (10, 75),
+    "face_swap": (75, 80),
+    "upscale": (80, 85),
+    "interpolate": (85, 88),
+    "encode": (88, 94),
+    "upload": (94, 99),
+}
+
+# Throughput medido de denoising por modelo: base para detectar GPUs atascadas y estimar ETA de cola
+step_stats: Dict[str, Dict[str, float]] = {}
+_step_stats_lock = threading.Lock()
+
+
+def record_steps(model: str, steps: int, seconds: float):
+    with _step_stats_lock:
+        entry = step_stats.setdefault(model, {"steps": 0, "seconds": 0.0, "last_steps_per_second": 0.0})
+        entry["steps"] += steps
+        entry["seconds"] += seconds
+        if seconds > 0:
+            entry["last_steps_per_second"] = steps / seconds
+
+
+def steps_per_second(model: str) -> Optional[float]:
+    entry = step_stats.get(model)
+    if not entry or not entry["seconds"]:
+        return None
+    return entry["steps"] / entry["seconds"]
+
+
+class JobProgress:
+    """
+    Traduce el avance de cada etapa (fracción 0-1) a progreso global y lo
+    publica como webhook "processing" con la etapa y el paso actuales. Las
+    publicaciones se limitan a una cada PROGRESS_MIN_INTERVAL segundos, salvo
+    al cambiar de etapa o al terminarla.
+
+    También mide cada etapa (del primer update a fracción 1.0) para el
+    histograma viarteia_stage_seconds y los spans de traza del trabajo.
+    """
+
+    def __init__(self, job_id: str, publish: Optional[Callable] = None, min_interval: float = PROGRESS_MIN_INTERVAL,
+                 kind: str = "", cancel: Optional[CancelToken] = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.cancel = cancel
+        # Se resuelve al crear el objeto, no al importar: los tests (y benchmarks) sustituyen notify_node_api
+        self.publish = publish or notify_node_api
+        self.min_interval = min_interval
+        self.stage_name: Optional[str] = None
+        self.progress = 0
+        self._last_publish = 0.0
+        self._stage_started = 0.0
+        self._lock = threading.Lock()
+        self._job_started = time.monotonic()
+        self._job_wall_start = time.time()
+        # Etapas abiertas (pueden solaparse, p.ej. encode y upload en streaming): clave -> (monotonic, epoch, atributos)
+        self._open_spans: Dict[object, tuple] = {}
+        self._closed_spans = set()
+        self.finished = False
+
+    def _track_span(self, key, fraction: float, now: float, **attributes):
+        """`key`: nombre de la etapa, o (nombre, trozo) para las de cada trozo de un vídeo segmentado."""
+        if key in self._closed_spans:
+            return
+        if key not in self._open_spans:
+            self._open_spans[key] = (now, time.time(), attributes)
+        if fraction >= 1.0:
+            self._close_span(key, now)
+
+    def _close_span(self, key, now: float, **attributes):
+        started, wall_start, span_attributes = self._open_spans.pop(key)
+        self._closed_spans.add(key)
+        name = key if isinstance(key, str) else key[0]
+        observe_stage(name, now - started)
+        trace_span(self.job_id, name, wall_start, now - started, kind=self.kind, **span_attributes, **attributes)
+
+    def update(self, stage: str, fraction: float, **info):
+        now = time.monotonic()
+        with self._lock:
+            new_stage = stage != self.stage_name
+            if new_stage:
+                self.stage_name = stage
+                self._stage_started = now
+            low, high = STAGE_RANGES.get(stage, (self.progress, self.progress))
+            fraction = min(max(fraction, 0.0), 1.0)
+            self._track_span(stage, fraction, now)
+            progress = max(self.progress, int(low + (high - low) * fraction))
+            if not new_stage and fraction < 1.0 and now - self._last_publish < self.min_interval:
+                self.progress = progress
+                return
+            self.progress = progress
+            self._last_publish = now
+            elapsed = now - self._stage_started
+
+        event = {"stage": stage, "stageProgress": round(fraction, 3), "stageElapsed": round(elapsed, 2), **info}
+        self.publish(self.job_id, "processing", progress, **event)
+
+    def update_segment(self, index: int, stage: str, fraction: float, **info):
+        """
+        Avance de una etapa del post-proceso del trozo `index`. No cambia la
+        etapa del trabajo (la difusión del siguiente trozo sigue en curso) ni
+        su porcentaje; comparte el límite de PROGRESS_MIN_INTERVAL salvo al
+        terminar la etapa, y se mide por trozo (segment_<etapa>).
+        """
+        now = time.monotonic()
+        with self._lock:
+            fraction = min(max(fraction, 0.0), 1.0)
+            self._track_span((f"segment_{stage}", index), fraction, now, segment=index)
+            if fraction < 1.0 and now - self._last_publish < self.min_interval:
+                return
+            self._last_publish = now
+            progress = self.progress
+
+        event = {"stage": "segment", "segment": index, "segmentStage": stage, "stageProgress": round(fraction, 3), **info}
+        self.publish(self.job_id, "processing", progress, **event)
+
+    def finish(self, outcome: str):
+        """Cierra las etapas abiertas y registra el trabajo (completed, cached, failed, retried, cancelled)."""
+        now = time.monotonic()
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            for stage in list(self._open_spans):
+                self._close_span(stage, now, outcome=outcome)
+        elapsed = now - self._job_started
+        jobs_total.labels(self.kind, outcome).inc()
+        job_seconds.labels(self.kind, outcome).observe(elapsed)
+        trace_span(self.job_id, "job", self._job_wall_start, elapsed, kind=self.kind, outcome=outcome)
+
+    def check_cancelled(self):
+        """Lanza JobCancelled si el trabajo se canceló o pasó su plazo."""
+        if self.cancel is not None:
+            self.cancel.check()
+
+    def stage(self, stage: str, cancellable: bool = True) -> Callable[[float], None]:
+        """
+        Callback de fracción para una etapa concreta. Si es `cancellable`, es
+        también un punto de cancelación (no lo es durante una subida en curso:
+        cortarla dejaría un objeto a medias en S3).
+        """
+        def on_progress(fraction, **info):
+            if cancellable:
+                self.check_cancelled()
+            self.update(stage, fraction, **info)
+        return on_progress
+
+    def diffusion_callback(self, model: str, total_steps: int, offset: int = 0, steps: Optional[int] = None):
+        """
+        callback_on_step_end para pipelines de diffusers. Si el trabajo hace
+        varias llamadas (vídeo segmentado), `steps` son los pasos de esta y
+        `offset` los ya hechos, sobre `total_steps` del trabajo.
+        """
+        started = time.monotonic()
+        steps = steps or total_steps
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            # Cancelar aquí corta el denoising en el siguiente paso y libera la GPU
+            self.check_cancelled()
+            done = step + 1
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            self.update("diffusion", (offset + done) / total_steps, step=offset + done, totalSteps=total_steps,
+                        stepsPerSecond=round(rate, 3))
+            if done == steps:
+                record_steps(model, steps, elapsed)
+            return callback_kwargs
+
+        return on_step_end
+
+    def upload_callback(self) -> Callable[[int, Optional[int]], None]:
+        """(bytes enviados, total) de storage; total es None al subir desde un stream."""
+        def on_bytes(sent: int, total: Optional[int]):
+            self.update("upload", sent / total if total else 0.0, bytesSent=sent)
+        return on_bytes
+
+
+class SegmentProgress:
+    """
+    Progreso de un trozo de vídeo segmentado en el pipeline de post-proceso.
+    Sus etapas se publican como "segment" (la real va en segmentStage) y no
+    mueven el porcentaje del trabajo: mientras quedan trozos lo lleva la difusión.
+    """
+
+    stage = JobProgress.stage
+    upload_callback = JobProgress.upload_callback
+
+    def __init__(self, progress: JobProgress, index: int):
+        self.progress = progress
+        self.index = index
+
+    def update(self, stage: str, fraction: float, **info):
+        self.progress.update_segment(self.index, stage, fraction, **info)
+
+    def check_cancelled(self):
+        self.progress.check_cancelled()
+
+
+class NullProgress(JobProgress):
+    """Para llamadas al engine sin trabajo asociado (benchmarks, scripts)."""
+
+    def __init__(self):
+        super().__init__("", publish=lambda *args, **kwargs: None)
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from .result_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# None = api.groq.com; apuntar a benchmarks/fake_llm_server.py para medir sin red ni cuota
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+MAGIC_PROMPT_MODEL = os.getenv("MAGIC_PROMPT_MODEL", "llama3-8b-8192")
+MAGIC_PROMPT_TIMEOUT = float(os.getenv("MAGIC_PROMPT_TIMEOUT", "60"))
+MAGIC_PROMPT_CACHE_SIZE = int(os.getenv("MAGIC_PROMPT_CACHE_SIZE", "512"))
+MAGIC_PROMPT_CACHE_TTL = float(os.getenv("MAGIC_PROMPT_CACHE_TTL", "3600"))
+
+SYSTEM_PROMPT = "You are a creative assistant. Expand the user's idea into a detailed, vivid prompt for video generation. Reply ONLY with the prompt."
+
+
+class MagicPromptConfigError(Exception):
+    pass
+
+
+class PromptExpander:
+    """
+    Expande ideas en prompts con un único AsyncGroq (pool de conexiones
+    reutilizado, sin bloquear el event loop). Las expansiones se cachean
+    (LRU + TTL) por idea normalizada, y las peticiones idénticas que llegan
+    mientras otra está en curso esperan a su resultado en lugar de llamar
+    otra vez al LLM.
+    """
+
+    def __init__(self, cache_size: int = MAGIC_PROMPT_CACHE_SIZE, cache_ttl: float = MAGIC_PROMPT_CACHE_TTL):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._client = None
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "requests": 0,
+            "hits": 0,
+            "coalesced": 0,
+            "llm_calls": 0,
+            "llm_errors": 0,
+            "llm_seconds_total": 0.0,
+            "first_token_seconds_total": 0.0,
+            "streams": 0,
+        }
+
+    def check_configured(self):
+        if not os.getenv("GROQ_API_KEY"):
+            raise MagicPromptConfigError("GROQ_API_KEY not configured")
+
+    def _get_client(self):
+        if self._client is None:
+            self.check_configured()
+            # Import diferido: el SDK tarda ~0.4s en importarse y no hace falta para arrancar
+            from groq import AsyncGroq
+
+            self._client = AsyncGroq(
+                api_key=os.getenv("GROQ_API_KEY"),
+                base_url=GROQ_BASE_URL,
+                timeout=MAGIC_PROMPT_TIMEOUT,
+            )
+        return self._client
+
+    def _completion_kwargs(self, user_idea: str, stream: bool) -> Dict[str, Any]:
+        return dict(
+            model=MAGIC_PROMPT_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_idea},
+            ],
+            temperature=1,
+            max_completion_tokens=8192,
+            top_p=1,
+            reasoning_effort="medium",
+            stream=stream,
+            stop=None,
+        )
+
+    # --- caché ---
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        text, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return text
+
+    def _cache_put(self, key: str, text: str):
+        if not text or self.cache_size <= 0:
+            return
+        self._cache[key] = (text, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # --- coalescing ---
+
+    def _lookup(self, key: str, fresh: bool) -> Tuple[Optional[str], Optional[asyncio.Future]]:
+        """(texto cacheado, petición en curso) para una idea; fresh ignora ambos."""
+        self.stats["requests"] += 1
+        if fresh:
+            return None, None
+        text = self._cache_get(key)
+        if text is not None:
+            self.stats["hits"] += 1
+            return text, None
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+        return None, inflight
+
+    def _begin(self, key: str, fresh: bool) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Nadie más la espera: evita "exception was never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if not fresh:
+            self._inflight[key] = future
+        return future
+
+    def _end(self, key: str, future: asyncio.Future, text: Optional[str] = None, error: Optional[BaseException] = None):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error if isinstance(error, Exception) else RuntimeError("magic prompt request aborted"))
+        else:
+            self._cache_put(key, text)
+            future.set_result(text)
+
+    # --- API pública ---
+
+    async def expand(self, user_idea: str, fresh: bool = False) -> Tuple[str, bool]:
+        """Devuelve (prompt, cached)."""
+        key = normalize_text(user_idea)
+        text, inflight = self._lookup(key, fresh)
+        if text is not None:
+            return text, True
+        if inflight is not None:
+            return await asyncio.shield(inflight), False
+
+        future = self._begin(key, fresh)
+        start = time.perf_counter()
+        try:
+            self.stats["llm_calls"] += 1
+            completion = await self._get_client().chat.completions.create(**self._completion_kwargs(user_idea, stream=False))
+            text = completion.choices[0].message.content.strip()
+        except BaseException as e:
+            self.stats["llm_errors"] += 1
+            self._end(key, future, error=e)
+            raise
+        finally:
+            self.stats["llm_seconds_total"] += time.perf_counter() - start
+        self._end(key, future, text=text)
+        return text, False
+
+    async def stream(self, user_idea: str, fresh: bool = False) -> AsyncIterator[str]:
+        """Fragmentos de texto a medida que los genera el LLM (uno solo si viene de caché o de otra petición)."""
+        key = normalize_text(user_idea)
+        text, inflight = self._lookup(key, fresh)
+        if text is not None:
+            yield text
+            return
+        if inflight is not None:
+            yield await asyncio.shield(inflight)
+            return
+
+        future = self._begin(key, fresh)
+        start = time.perf_counter()
+        parts = []
+        self.stats["llm_calls"] += 1
+        self.stats["streams"] += 1
+        try:
+            chunks = await self._get_client().chat.completions.create(**self._completion_kwargs(user_idea, stream=True))
+            async for chunk in chunks:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not parts:
+                    self.stats["first_token_seconds_total"] += time.perf_counter() - start
+                parts.append(delta)
+                yield delta
+        except BaseException as e:
+            # Incluye la desconexión del cliente (GeneratorExit / CancelledError)
+            self.stats["llm_errors"] += 1
+            self._end(key, future, error=e)
+            raise
+        finally:
+            self.stats["llm_seconds_total"] += time.perf_counter() - start
+        self._end(key, future, text="".join(parts).strip())
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["cached"] = len(self._cache)
+        stats["in_flight"] = len(self._inflight)
+        stats["hit_rate"] = stats["hits"] / stats["requests"] if stats["requests"] else 0.0
+        calls = stats["llm_calls"]
+        stats["llm_avg_seconds"] = stats["llm_seconds_total"] / calls if calls else 0.0
+        return stats
+
+
+prompt_expander = PromptExpander()
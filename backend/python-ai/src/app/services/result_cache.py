@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .job_queue import JOB_QUEUE_BACKEND, REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 86400)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_PREFIX = os.getenv("RESULT_CACHE_PREFIX", "viarteia:results")
+
+
+def result_cache_key(kind: str, model_id: str, params: Dict[str, Any], *input_hashes: Optional[str]) -> str:
+    """
+    Hash del request normalizado + sha256 de los bytes de las imágenes de entrada + id del modelo.
+    Solo tiene sentido para seeds fijas: con seed=-1 la salida no es determinista.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({"kind": kind, "model": model_id, **params}, sort_keys=True).encode())
+    for digest in input_hashes:
+        h.update(b"\0")
+        h.update(digest.encode() if digest else b"-")
+    return h.hexdigest()
+
+
+def normalize_text(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+class LocalResultCache:
+    """LRU + TTL en memoria (un solo proceso)."""
+
+    def __init__(self, ttl: int = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, url: str):
+        with self._lock:
+            self._entries[key] = (url, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+class RedisResultCache:
+    """Compartida entre todos los workers. El índice ordenado por uso acota el número de entradas."""
+
+    def __init__(self, url: str = None, prefix: str = RESULT_CACHE_PREFIX,
+                 ttl: int = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        import redis
+
+        self.redis = redis.Redis.from_url(url or REDIS_URL or "redis://localhost:6379/0", decode_responses=True)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_key = f"{prefix}:index"
+        self.stats_key = f"{prefix}:stats"
+
+    def get(self, key: str) -> Optional[str]:
+        url = self.redis.get(f"{self.prefix}:{key}")
+        pipe = self.redis.pipeline()
+        if url is None:
+            pipe.hincrby(self.stats_key, "misses", 1)
+        else:
+            pipe.hincrby(self.stats_key, "hits", 1)
+            pipe.zadd(self.index_key, {key: time.time()})
+        pipe.execute()
+        return url
+
+    def put(self, key: str, url: str):
+        pipe = self.redis.pipeline()
+        pipe.set(f"{self.prefix}:{key}", url, ex=self.ttl)
+        pipe.zadd(self.index_key, {key: time.time()})
+        pipe.zremrangebyscore(self.index_key, 0, time.time() - self.ttl)
+        pipe.execute()
+        overflow = self.redis.zcard(self.index_key) - self.max_entries
+        if overflow > 0:
+            evicted = [k for k, _ in self.redis.zpopmin(self.index_key, overflow)]
+            self.redis.delete(*[f"{self.prefix}:{k}" for k in evicted])
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self.redis.hgetall(self.stats_key)
+        hits, misses = int(counters.get("hits", 0)), int(counters.get("misses", 0))
+        total = hits + misses
+        return {"entries": self.redis.zcard(self.index_key), "hits": hits, "misses": misses,
+                "hit_rate": hits / total if total else 0.0}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = RedisResultCache() if JOB_QUEUE_BACKEND == "redis" else LocalResultCache()
+        return _result_cache
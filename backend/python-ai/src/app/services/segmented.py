@@ -0,0 +1,129 @@
+"""
+Generación segmentada de vídeos largos.
+
+CogVideoX-2b genera como mucho T2V_MAX_FRAMES frames por pasada. Para
+duraciones mayores el vídeo se genera por trozos: el primero con T2V y cada
+uno de los siguientes con video-to-video sobre los últimos frames del
+anterior (el último repetido hasta completar el trozo), así que arranca
+donde acabó el anterior; los frames de solape se descartan. Cada trozo se
+post-procesa, se codifica como segmento HLS (MP4 fragmentado) y se sube en
+cuanto está listo junto con la playlist actualizada. Al final los segmentos se
+concatenan sin recodificar en el MP4 de siempre. En memoria solo hay un
+trozo (más los que esperan en el pipeline de post-proceso) a la vez.
+"""
+import logging
+import math
+import os
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 0 = recortar a T2V_MAX_FRAMES como antes (con un aviso)
+SEGMENTED_GENERATION = os.getenv("SEGMENTED_GENERATION", "1") == "1"
+# Frames que CogVideoX-2b genera en una pasada
+T2V_MAX_FRAMES = int(os.getenv("T2V_MAX_FRAMES", "49"))
+# Frames del trozo anterior que condicionan el siguiente
+SEGMENT_OVERLAP_FRAMES = int(os.getenv("SEGMENT_OVERLAP_FRAMES", "9"))
+# Fuerza del video-to-video: más baja = más continuidad, menos movimiento nuevo
+SEGMENT_STRENGTH = float(os.getenv("SEGMENT_STRENGTH", "0.8"))
+
+SEGMENT_CONTENT_TYPE = "video/mp4"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+# Cada segmento es un MP4 fragmentado autocontenido: ftyp+moov (init) y después moof+mdat, sin mfra al final
+SEGMENT_OUTPUT_ARGS = ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof+skip_trailer"]
+
+
+def fmp4_init_size(path: str) -> int:
+    """Bytes de la cabecera (ftyp+moov) de un MP4 fragmentado: lo que va antes del primer moof."""
+    offset = 0
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no moof box")
+            size, box = struct.unpack(">I4s", header)
+            if box == b"moof":
+                return offset
+            offset += size
+            f.seek(offset)
+
+
+def segment_overlap(max_frames: int = T2V_MAX_FRAMES, overlap: int = SEGMENT_OVERLAP_FRAMES) -> int:
+    """Solape efectivo: al menos un frame de condicionamiento y al menos uno nuevo por trozo."""
+    return min(max(overlap, 1), max_frames - 1)
+
+
+def plan_chunks(total_frames: int, max_frames: int = T2V_MAX_FRAMES, overlap: int = SEGMENT_OVERLAP_FRAMES) -> List[int]:
+    """Frames nuevos que aporta cada trozo: el primero hasta max_frames, el resto hasta max_frames - overlap."""
+    overlap = segment_overlap(max_frames, overlap)
+    chunks = [min(total_frames, max_frames)]
+    remaining = total_frames - chunks[0]
+    while remaining > 0:
+        chunks.append(min(remaining, max_frames - overlap))
+        remaining -= chunks[-1]
+    return chunks
+
+
+def conditioning_video(tail: Sequence, length: int) -> List:
+    """Los últimos frames del trozo anterior, con el último repetido hasta `length`."""
+    return list(tail) + [tail[-1]] * (length - len(tail))
+
+
+class HlsPlaylist:
+    """
+    Playlist HLS de tipo EVENT que crece a medida que se suben segmentos.
+    Los segmentos pueden terminar de subir desordenados (varios hilos de
+    subida); la playlist solo publica el prefijo contiguo ya subido.
+
+    Cada segmento se codifica por separado, así que trae su propia cabecera:
+    la playlist la declara con EXT-X-MAP (rango de bytes del init) y los
+    fragmentos con EXT-X-BYTERANGE dentro del mismo archivo, con una
+    discontinuidad entre segmentos.
+    """
+
+    def __init__(self, fps: int, publish: Callable[[str], Optional[str]]):
+        self.fps = fps
+        self.publish = publish
+        self.url: Optional[str] = None
+        self._segments: Dict[int, Dict] = {}
+        self._published = 0
+        self._lock = threading.Lock()
+
+    def render(self, ended: bool = False) -> str:
+        segments = [self._segments[i] for i in range(self._published)]
+        target = max([math.ceil(segment["frames"] / self.fps) for segment in segments] or [1])
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-PLAYLIST-TYPE:EVENT",
+                 f"#EXT-X-TARGETDURATION:{target}", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for index, segment in enumerate(segments):
+            name, init_size = segment["name"], segment["init_size"]
+            if index:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines += [
+                f'#EXT-X-MAP:URI="{name}",BYTERANGE="{init_size}@0"',
+                f"#EXTINF:{segment['frames'] / self.fps:.3f},",
+                f"#EXT-X-BYTERANGE:{segment['size'] - init_size}@{init_size}",
+                name,
+            ]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def add(self, index: int, name: str, path: str, frames: int) -> int:
+        """Registra un segmento subido; republica la playlist si avanza. Devuelve los segmentos publicados."""
+        segment = {"name": name, "frames": frames, "size": os.path.getsize(path), "init_size": fmp4_init_size(path)}
+        with self._lock:
+            self._segments[index] = segment
+            published = self._published
+            while published in self._segments:
+                published += 1
+            if published != self._published:
+                self._published = published
+                # Bajo el lock: una playlist vieja nunca pisa a una más nueva
+                self.url = self.publish(self.render())
+            return self._published
+
+    def finish(self):
+        with self._lock:
+            self.url = self.publish(self.render(ended=True))
@@ -1,6 +1,8 @@
-import boto3
 import os
-from botocore.exceptions import NoCredentialsError
+import threading
+from typing import Callable, Optional
+
+# boto3/botocore se importan al crear el cliente: importar este módulo no los carga
 
 # Configuración desde variables de entorno
 S3_ENDPOINT = os.getenv("S3_ENDPOINT", "http://127.0.0.1:9000")
@@ -9,28 +11,113 @@ S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "adminpassword")
 S3_BUCKET = os.getenv("S3_BUCKET", "viarteia-assets")
 S3_REGION = os.getenv("S3_REGION", "us-east-1")
 
-s3_client = boto3.client(
-    's3',
-    endpoint_url=S3_ENDPOINT,
-    aws_access_key_id=S3_ACCESS_KEY,
-    aws_secret_access_key=S3_SECRET_KEY,
-    region_name=S3_REGION
-)
+MB = 1024 * 1024
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * MB
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "8")) * MB
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+# Subir el MP4 mientras ffmpeg lo escribe (fragmented MP4) en lugar de esperar al archivo completo
+S3_UPLOAD_WHILE_ENCODING = os.getenv("S3_UPLOAD_WHILE_ENCODING", "0") == "1"
+
+_s3_client = None
+_transfer_config = None
+_s3_client_lock = threading.Lock()
+
+
+def get_transfer_config():
+    global _transfer_config
+    if _transfer_config is None:
+        from boto3.s3.transfer import TransferConfig
+
+        _transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+            use_threads=True,
+        )
+    return _transfer_config
+
+
+def get_s3_client():
+    """Cliente boto3 compartido (thread-safe) con un pool de conexiones acotado."""
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            import boto3
+            from botocore.config import Config
+
+            _s3_client = boto3.client(
+                's3',
+                endpoint_url=S3_ENDPOINT,
+                aws_access_key_id=S3_ACCESS_KEY,
+                aws_secret_access_key=S3_SECRET_KEY,
+                region_name=S3_REGION,
+                config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={"max_attempts": 5, "mode": "adaptive"}),
+            )
+        return _s3_client
+
+
+def object_url(object_name: str) -> str:
+    # Generar URL (Asumiendo bucket público o estructura simple)
+    # Si es MinIO local:
+    return f"{S3_ENDPOINT}/{S3_BUCKET}/{object_name}"
+
+
+class UploadProgress:
+    """Acumula los bytes que boto3 reporta (desde varios hilos) y llama a callback(sent, total)."""
+
+    def __init__(self, callback: Optional[Callable[[int, Optional[int]], None]], total: Optional[int] = None):
+        self.callback = callback
+        self.total = total
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount: int):
+        with self._lock:
+            self.sent += bytes_amount
+            sent = self.sent
+        if self.callback:
+            self.callback(sent, self.total)
+
+
+def upload_file(file_path, object_name=None, progress_callback=None, content_type=None):
+    """Sube un archivo a S3 (multipart concurrente) y devuelve la URL pública/accesible"""
+    from botocore.exceptions import NoCredentialsError
 
-def upload_file(file_path, object_name=None):
-    """Sube un archivo a S3 y devuelve la URL pública/accesible"""
     if object_name is None:
         object_name = os.path.basename(file_path)
 
     try:
-        s3_client.upload_file(file_path, S3_BUCKET, object_name) #, ExtraArgs={'ACL': 'public-read'})
-        
-        # Generar URL (Asumiendo bucket público o estructura simple)
-        # Si es MinIO local:
-        return f"{S3_ENDPOINT}/{S3_BUCKET}/{object_name}"
+        get_s3_client().upload_file(
+            file_path, S3_BUCKET, object_name,
+            Config=get_transfer_config(),
+            Callback=UploadProgress(progress_callback, os.path.getsize(file_path)),
+            ExtraArgs={"ContentType": content_type} if content_type else None,
+        ) #, ExtraArgs={'ACL': 'public-read'})
+        return object_url(object_name)
     except FileNotFoundError:
         print("The file was not found")
         return None
     except NoCredentialsError:
         print("Credentials not available")
         return None
+
+
+def upload_stream(stream, object_name, progress_callback=None, content_type="video/mp4"):
+    """
+    Sube desde un stream no seekable (p.ej. stdout de ffmpeg) a medida que llegan
+    los datos; boto3 lo parte en partes de S3_MULTIPART_CHUNKSIZE.
+    """
+    from botocore.exceptions import NoCredentialsError
+
+    try:
+        get_s3_client().upload_fileobj(
+            stream, S3_BUCKET, object_name,
+            Config=get_transfer_config(),
+            Callback=UploadProgress(progress_callback),
+            ExtraArgs={"ContentType": content_type},
+        )
+        return object_url(object_name)
+    except NoCredentialsError:
+        print("Credentials not available")
+        return None
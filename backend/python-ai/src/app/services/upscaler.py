@@ -0,0 +1,165 @@
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from .frame_buffer import allocate_frames, as_frame_buffer
+
+logger = logging.getLogger(__name__)
+
+UPSCALE_BATCH_SIZE = int(os.getenv("UPSCALE_BATCH_SIZE", "4"))
+# 0 = tamaño de tile automático según memoria libre (GPU) o número de workers (CPU)
+UPSCALE_TILE = int(os.getenv("UPSCALE_TILE", "0"))
+UPSCALE_TILE_PAD = int(os.getenv("UPSCALE_TILE_PAD", "10"))
+UPSCALE_CPU_WORKERS = int(os.getenv("UPSCALE_CPU_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+# Memoria de activaciones estimada por píxel de entrada (RRDBNet x2, fp16), para el tile automático
+UPSCALE_BYTES_PER_PIXEL = int(os.getenv("UPSCALE_BYTES_PER_PIXEL", "4096"))
+
+upscale_stats = {
+    "count": 0,
+    "frames": 0,
+    "total_seconds": 0.0,
+    "last_seconds": 0.0,
+    "last_per_frame_seconds": 0.0,
+    "last_tile": 0,
+}
+_stats_lock = threading.Lock()
+
+
+@dataclass
+class UpscalerModel:
+    """Lo que BatchedUpscaler usa de un RealESRGANer: la red, su escala, precisión y dispositivo."""
+    model: torch.nn.Module
+    scale: int
+    half: bool
+    device: torch.device
+
+
+class BatchedUpscaler:
+    """
+    Runs a RealESRGAN network (UpscalerModel or RealESRGANer) on batches of frames instead of calling
+    enhance() one frame at a time. Frames stay RGB end to end (the network is
+    trained on RGB; enhance() only converts because it takes BGR input). Large
+    frames are tiled, and each tile position is processed for the whole batch
+    in one forward pass. On CPU-only hosts tiles are spread over a thread pool.
+    """
+
+    def __init__(self, upsampler, batch_size: int = UPSCALE_BATCH_SIZE, tile: int = UPSCALE_TILE,
+                 tile_pad: int = UPSCALE_TILE_PAD, cpu_workers: int = UPSCALE_CPU_WORKERS):
+        self.upsampler = upsampler
+        self.batch_size = max(1, batch_size)
+        self.tile = tile
+        self.tile_pad = tile_pad
+        self.cpu_workers = max(1, cpu_workers)
+
+    @property
+    def device(self) -> torch.device:
+        return torch.device(self.upsampler.device)
+
+    @property
+    def scale(self) -> int:
+        return self.upsampler.scale
+
+    def auto_tile(self, height: int, width: int, batch: int) -> int:
+        """0 significa sin tiles (el frame entero en una pasada)."""
+        if self.tile:
+            return self.tile
+        if self.device.type == "cuda":
+            free, _ = torch.cuda.mem_get_info(self.device)
+            max_pixels = int(free * 0.6) // (UPSCALE_BYTES_PER_PIXEL * batch)
+            if height * width <= max_pixels:
+                return 0
+            return max(128, int(math.sqrt(max_pixels)) // 32 * 32)
+        if self.cpu_workers <= 1:
+            return 0
+        # Suficientes tiles para ocupar todos los workers
+        per_side = math.ceil(math.sqrt(self.cpu_workers))
+        return max(128, math.ceil(max(height, width) / per_side / 32) * 32)
+
+    def _run_model(self, tensor: torch.Tensor) -> torch.Tensor:
+        return self.upsampler.model(tensor)
+
+    def _forward_tiled(self, batch: torch.Tensor, tile: int) -> torch.Tensor:
+        n, c, height, width = batch.shape
+        scale = self.scale
+        output = batch.new_zeros((n, c, height * scale, width * scale))
+        tiles_x = math.ceil(width / tile)
+        tiles_y = math.ceil(height / tile)
+
+        def process(tile_x, tile_y):
+            # El modo de autograd es por hilo: el inference_mode de upscale() no llega a los hilos del pool
+            with torch.inference_mode():
+                process_tile(tile_x, tile_y)
+
+        def process_tile(tile_x, tile_y):
+            x0, y0 = tile_x * tile, tile_y * tile
+            x1, y1 = min(x0 + tile, width), min(y0 + tile, height)
+            px0, py0 = max(x0 - self.tile_pad, 0), max(y0 - self.tile_pad, 0)
+            px1, py1 = min(x1 + self.tile_pad, width), min(y1 + self.tile_pad, height)
+            out_tile = self._run_model(batch[:, :, py0:py1, px0:px1])
+            ox0, oy0 = (x0 - px0) * scale, (y0 - py0) * scale
+            output[:, :, y0 * scale:y1 * scale, x0 * scale:x1 * scale] = \
+                out_tile[:, :, oy0:oy0 + (y1 - y0) * scale, ox0:ox0 + (x1 - x0) * scale]
+
+        positions = [(x, y) for y in range(tiles_y) for x in range(tiles_x)]
+        if self.device.type == "cpu" and self.cpu_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.cpu_workers) as pool:
+                list(pool.map(lambda p: process(*p), positions))
+        else:
+            for position in positions:
+                process(*position)
+        return output
+
+    @torch.inference_mode()
+    def upscale(self, frames, on_progress: Optional[Callable[[float], None]] = None) -> np.ndarray:
+        """
+        frames: buffer RGB uint8 (T, H, W, 3) (o lista de frames H, W, 3).
+        Devuelve un buffer nuevo (T, H*scale, W*scale, 3), escrito lote a lote sin copias intermedias.
+        """
+        frames = as_frame_buffer(frames)
+        start = time.perf_counter()
+        count, height, width = frames.shape[:3]
+        outputs = allocate_frames(count, height * self.scale, width * self.scale)
+        # RRDBNet x2 usa pixel_unshuffle: el tamaño debe ser múltiplo de 2 (x1: de 4)
+        mod = {2: 2, 1: 4}.get(self.scale, 1)
+        pad_h, pad_w = (-height) % mod, (-width) % mod
+        tile = self.auto_tile(height, width, min(self.batch_size, len(frames)))
+
+        for i in range(0, count, self.batch_size):
+            chunk = frames[i:i + self.batch_size]
+            tensor = torch.from_numpy(chunk).to(self.device).permute(0, 3, 1, 2)
+            tensor = tensor.half() if self.upsampler.half else tensor.float()
+            tensor = tensor / 255.0
+            if pad_h or pad_w:
+                tensor = F.pad(tensor, (0, pad_w, 0, pad_h), "reflect")
+
+            if tile and (height > tile or width > tile):
+                output = self._forward_tiled(tensor, tile)
+            else:
+                output = self._run_model(tensor)
+
+            output = output[:, :, :height * self.scale, :width * self.scale]
+            output = (output.float().clamp_(0, 1) * 255.0).round_().to(torch.uint8)
+            # Directo al buffer de salida (desde la GPU, una sola copia)
+            torch.from_numpy(outputs[i:i + len(chunk)]).copy_(output.permute(0, 2, 3, 1))
+            if on_progress:
+                on_progress((i + len(chunk)) / count)
+
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            upscale_stats["count"] += 1
+            upscale_stats["frames"] += count
+            upscale_stats["total_seconds"] += elapsed
+            upscale_stats["last_seconds"] = elapsed
+            upscale_stats["last_per_frame_seconds"] = elapsed / count
+            upscale_stats["last_tile"] = tile
+        logger.info(f"Upscaled {count} frames in {elapsed:.2f}s ({elapsed / count:.3f}s/frame, tile={tile or 'none'})")
+        return outputs
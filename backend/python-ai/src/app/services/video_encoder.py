@@ -0,0 +1,282 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import IO, Callable, Iterable, List, Optional, TypeVar
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+ENCODE_TIMEOUT = int(os.getenv("ENCODE_TIMEOUT", "300"))
+
+CODEC_ARGS = {
+    # NVENC for T4
+    "h264_nvenc": ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq"],
+    "libx264": ["-c:v", "libx264", "-preset", "veryfast"],
+}
+
+# None = todavía no probado; False = falló una vez, no volver a intentarlo en este proceso
+_nvenc_available: Optional[bool] = None
+
+encode_stats = {
+    "count": 0,
+    "frames": 0,
+    "total_seconds": 0.0,
+    "last_seconds": 0.0,
+    "last_codec": None,
+    "nvenc_failures": 0,
+}
+_stats_lock = threading.Lock()
+
+
+PIPE_OUTPUT = "pipe:1"
+# MP4 fragmentado: se puede escribir a un pipe (sin seek) y subir mientras se codifica
+FRAGMENTED_MP4_ARGS = ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+STREAM_DRAIN_CHUNK = 1 << 16
+
+T = TypeVar("T")
+
+
+class EncoderError(RuntimeError):
+    pass
+
+
+class FFmpegStreamEncoder:
+    """
+    Pipes raw RGB24 frames into ffmpeg's stdin (-f rawvideo), so no frame
+    ever touches the disk. Frames can be written one by one as they are produced.
+    """
+
+    def __init__(self, output_path: str, width: int, height: int, fps: int = 24,
+                 codec: str = "h264_nvenc", output_args: Optional[List[str]] = None):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.output_args = output_args or []
+        self.frames_written = 0
+        self._proc: Optional[subprocess.Popen] = None
+        self._stderr = b""
+        self._stderr_thread: Optional[threading.Thread] = None
+
+    @property
+    def stdout(self) -> Optional[IO[bytes]]:
+        """Encoded bytes when output_path is PIPE_OUTPUT."""
+        return self._proc.stdout if self._proc else None
+
+    def command(self) -> List[str]:
+        return [
+            FFMPEG_BIN, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{self.width}x{self.height}", "-framerate", str(self.fps),
+            "-i", "pipe:0",
+            *CODEC_ARGS[self.codec], "-pix_fmt", "yuv420p",
+            *self.output_args, self.output_path,
+        ]
+
+    def _drain_stderr(self):
+        self._stderr = self._proc.stderr.read()
+
+    def start(self):
+        try:
+            self._proc = subprocess.Popen(
+                self.command(), stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                stdout=subprocess.PIPE if self.output_path == PIPE_OUTPUT else subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            raise EncoderError(f"{FFMPEG_BIN} not found")
+        # Leer stderr en segundo plano para que ffmpeg nunca se bloquee al escribirlo
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        return self
+
+    def write(self, frame):
+        """Accepts a PIL image or an (H, W, 3) uint8 array."""
+        if self._proc is None:
+            self.start()
+        arr = np.ascontiguousarray(np.asarray(frame, dtype=np.uint8))
+        if arr.shape != (self.height, self.width, 3):
+            raise EncoderError(f"Frame shape {arr.shape} does not match encoder size {self.width}x{self.height}")
+        try:
+            self._proc.stdin.write(arr.data)
+        except (BrokenPipeError, OSError) as e:
+            self._proc.wait()
+            self._stderr_thread.join()
+            raise EncoderError(f"{self.codec} encoder died: {self._stderr.decode(errors='replace').strip() or e}")
+        self.frames_written += 1
+
+    def close(self) -> str:
+        if self._proc is None:
+            self.start()
+        try:
+            self._proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            returncode = self._proc.wait(timeout=ENCODE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            raise EncoderError(f"{self.codec} encoder timed out after {ENCODE_TIMEOUT}s")
+        self._stderr_thread.join()
+        if returncode != 0:
+            raise EncoderError(f"{self.codec} encoder exited with {returncode}: {self._stderr.decode(errors='replace').strip()}")
+        return self.output_path
+
+    def abort(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+
+def frame_size(frame):
+    if hasattr(frame, "size") and not isinstance(frame, np.ndarray):
+        return frame.size  # PIL: (width, height)
+    return frame.shape[1], frame.shape[0]
+
+
+def nvenc_available() -> bool:
+    """Prueba (una vez por proceso) si ffmpeg puede abrir h264_nvenc."""
+    global _nvenc_available
+    if _nvenc_available is None:
+        probe = [FFMPEG_BIN, "-loglevel", "error", "-f", "lavfi", "-i", "color=s=256x256:d=0.1",
+                 "-frames:v", "1", "-c:v", "h264_nvenc", "-f", "null", "-"]
+        try:
+            _nvenc_available = subprocess.run(probe, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0
+        except (OSError, subprocess.TimeoutExpired):
+            _nvenc_available = False
+    return _nvenc_available
+
+
+def _record(frames: int, elapsed: float, codec: str):
+    with _stats_lock:
+        encode_stats["count"] += 1
+        encode_stats["frames"] += frames
+        encode_stats["total_seconds"] += elapsed
+        encode_stats["last_seconds"] = elapsed
+        encode_stats["last_codec"] = codec
+
+
+def encode_frames_streaming(frames: Iterable, consume: Callable[[IO[bytes]], T], width: int, height: int, fps: int = 24,
+                            total_frames: Optional[int] = None, on_progress: Optional[Callable[[float], None]] = None) -> T:
+    """
+    Encodes to fragmented MP4 on ffmpeg's stdout while `consume(stdout)` reads it
+    in another thread (e.g. an S3 multipart upload), so upload overlaps encoding.
+    Frames can be a generator. Returns whatever `consume` returns.
+    """
+    codec = "h264_nvenc" if nvenc_available() else "libx264"
+    encoder = FFmpegStreamEncoder(PIPE_OUTPUT, width, height, fps=fps, codec=codec, output_args=FRAGMENTED_MP4_ARGS)
+    result = {}
+
+    def run_consumer():
+        try:
+            result["value"] = consume(encoder.stdout)
+            # Lo que el consumidor no haya leído: con la salida llena ffmpeg dejaría de aceptar frames
+            while encoder.stdout.read(STREAM_DRAIN_CHUNK):
+                pass
+        except Exception as e:
+            result["error"] = e
+            # Nadie lee ya la salida: matar ffmpeg hace que el siguiente write falle en vez de bloquearse
+            encoder.abort()
+
+    start = time.perf_counter()
+    count = 0
+    consumer = threading.Thread(target=run_consumer, daemon=True)
+    try:
+        with encoder:
+            consumer.start()
+            for frame in frames:
+                encoder.write(frame)
+                count += 1
+                if on_progress and total_frames:
+                    on_progress(count / total_frames)
+            encoder.close()
+            consumer.join()
+    except EncoderError:
+        # Si el encoder murió porque falló el consumidor, el error útil es el del consumidor
+        consumer.join()
+        if "error" in result:
+            raise result["error"]
+        raise
+
+    if "error" in result:
+        raise result["error"]
+    elapsed = time.perf_counter() - start
+    _record(count, elapsed, codec)
+    logger.info(f"Encoded and streamed {count} frames ({width}x{height}) with {codec} in {elapsed:.2f}s")
+    return result["value"]
+
+
+def encode_frames(frames: Iterable, output_path: str, fps: int = 24, on_progress: Optional[Callable[[float], None]] = None,
+                  output_args: Optional[List[str]] = None) -> str:
+    """
+    Encodes in-memory frames to MP4 (or the container given in `output_args`).
+    Tries NVENC first and falls back to libx264 (re-streaming the same frames)
+    if NVENC is unavailable.
+    """
+    global _nvenc_available
+
+    # Un buffer (T, H, W, 3) se recorre por vistas, sin copiarlo
+    if not isinstance(frames, np.ndarray):
+        frames = list(frames)
+    if len(frames) == 0:
+        raise EncoderError("No frames to encode")
+    width, height = frame_size(frames[0])
+
+    codecs = ["libx264"] if _nvenc_available is False else ["h264_nvenc", "libx264"]
+    start = time.perf_counter()
+    for codec in codecs:
+        encoder = FFmpegStreamEncoder(output_path, width, height, fps=fps, codec=codec, output_args=output_args)
+        try:
+            with encoder:
+                for i, frame in enumerate(frames):
+                    encoder.write(frame)
+                    if on_progress:
+                        on_progress((i + 1) / len(frames))
+                encoder.close()
+        except EncoderError as e:
+            if codec != "h264_nvenc":
+                raise
+            logger.warning(f"NVENC failed, falling back to libx264: {e}")
+            _nvenc_available = False
+            with _stats_lock:
+                encode_stats["nvenc_failures"] += 1
+            continue
+
+        if codec == "h264_nvenc":
+            _nvenc_available = True
+        elapsed = time.perf_counter() - start
+        _record(len(frames), elapsed, codec)
+        logger.info(f"Encoded {len(frames)} frames ({width}x{height}) with {codec} in {elapsed:.2f}s")
+        return output_path
+
+
+def concat_segments(segment_paths: List[str], output_path: str) -> str:
+    """Joins already-encoded segments into one MP4 without re-encoding (ffmpeg concat demuxer, -c copy)."""
+    list_path = f"{output_path}.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    command = [FFMPEG_BIN, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+               "-c", "copy", "-movflags", "+faststart", output_path]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=ENCODE_TIMEOUT)
+    except FileNotFoundError:
+        raise EncoderError(f"{FFMPEG_BIN} not found")
+    except subprocess.TimeoutExpired:
+        raise EncoderError(f"concat timed out after {ENCODE_TIMEOUT}s")
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise EncoderError(f"concat exited with {result.returncode}: {result.stderr.decode(errors='replace').strip()}")
+    return output_path
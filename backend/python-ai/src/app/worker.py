@@ -0,0 +1,302 @@
+"""
+GPU worker: consume la cola de trabajos y ejecuta los pipelines pesados.
+
+Uso (con Redis):
+    REDIS_URL=redis://localhost:6379/0 python -m app.worker
+
+Cada proceso worker es dueño de su propia instancia de AIEngine, así que el
+proceso HTTP nunca carga modelos ni bloquea su event loop con trabajo de GPU.
+Con ENGINE_DEVICES=cuda:0,cuda:1 un único proceso ejecuta un engine por
+dispositivo y reparte los trabajos entre ellos (ver services/device_pool).
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services.admission import throughput_meter
+from app.services.batching import T2V_MAX_BATCH
+from app.services.cancellation import CancelToken
+from app.services.device_pool import ENGINE_DEVICES, models_for_job
+from app.services.job_queue import (
+    Job,
+    JobQueue,
+    JOB_MAX_ATTEMPTS,
+    JOB_QUEUE_BACKEND,
+    WORKER_ID,
+    get_job_queue,
+)
+from app.services.metrics import WORKER_METRICS_PORT, start_metrics_server
+from app.services.model_registry import UNLOADED, model_registry
+from app.services.model_store import MODEL_STORE_OFFLINE, check_model_store, model_prefetcher
+from app.services.notifier import notify_node_api
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+# Modelos a cargar en segundo plano al arrancar (t2v, i2v, upscaler, face), p.ej. "t2v,upscaler"
+WARMUP_MODELS = [name.strip() for name in os.getenv("WARMUP_MODELS", "").split(",") if name.strip()]
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "10"))
+# Hilos que sacan trabajos en cada proceso (o dispositivo). Con 2, un trabajo difunde mientras el
+# anterior está en post-proceso/encode/subida; con T2V_MAX_BATCH > 1 hacen falta tantos para formar lotes
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", str(max(2, T2V_MAX_BATCH))))
+EMBEDDED_WORKERS = int(os.getenv("EMBEDDED_WORKERS", str(WORKER_THREADS) if JOB_QUEUE_BACKEND == "local" else "0"))
+
+# Trabajo en curso por hilo worker de este proceso (para el heartbeat)
+_active_jobs: Dict[str, str] = {}
+_device_pool = None
+_device_pool_lock = threading.Lock()
+_warmup: Dict[str, Any] = {"status": "disabled" if not WARMUP_MODELS else "pending", "models": WARMUP_MODELS}
+
+
+def handle_job(job: Job, is_last_attempt: bool = True, engine=None, cancel: Optional[CancelToken] = None):
+    """
+    engine=None usa el engine por defecto del proceso; DevicePool pasa el de su dispositivo.
+    Devuelve el estado final si no es "completed" ("cancelled", o "failed" en el último intento).
+    """
+    from app.routers import text_to_video, image_to_video
+
+    if job.kind == "text":
+        request = text_to_video.GenerateRequest(**job.payload)
+        return text_to_video.run_pipeline(job.id, request, is_last_attempt=is_last_attempt, engine=engine, cancel=cancel)
+    elif job.kind == "image":
+        request = image_to_video.GenerateImageRequest(**job.payload)
+        return image_to_video.run_pipeline(job.id, request, is_last_attempt=is_last_attempt, engine=engine, cancel=cancel)
+    else:
+        raise ValueError(f"Unknown job kind: {job.kind}")
+
+
+def prefetch_next(job_queue: JobQueue, engine=None):
+    """Lee por adelantado del disco los modelos del siguiente trabajo de la cola que no estén cargados."""
+    models = engine.models if engine is not None else model_registry
+    try:
+        upcoming = job_queue.peek(1)
+    except Exception as e:
+        logger.warning(f"Could not peek the job queue: {e}")
+        return
+    for job in upcoming:
+        for name in models_for_job(job):
+            if models.state(name) == UNLOADED:
+                model_prefetcher.prefetch(name)
+
+
+def process_job(job_queue: JobQueue, job: Job, engine=None):
+    """Ejecuta un trabajo y lo confirma, o lo reencola si falla y le quedan intentos."""
+    is_last_attempt = job.attempts + 1 >= JOB_MAX_ATTEMPTS
+    cancel = CancelToken(job.id, job.deadline, job_queue.is_cancelled)
+    reason = cancel.reason()
+    if reason:
+        # Cancelado o caducado mientras esperaba en la cola: no ocupa el engine
+        logger.info(f"Job {job.id} dropped before start ({reason})")
+        job_queue.ack(job, "cancelled")
+        notify_node_api(job.id, "cancelled", 0, error="deadline exceeded" if reason == "deadline" else "cancelled by request")
+        return
+    _active_jobs[threading.current_thread().name] = job.id
+    prefetch_next(job_queue, engine)
+    # Throughput publicado en el heartbeat: base del Retry-After y de la espera estimada (services/admission)
+    throughput_meter.started()
+    status = None
+    try:
+        status = handle_job(job, is_last_attempt=is_last_attempt, engine=engine, cancel=cancel) or "completed"
+        job_queue.ack(job, status)
+    except Exception as e:
+        logger.error(f"Job {job.id} failed (attempt {job.attempts + 1}/{JOB_MAX_ATTEMPTS}): {e}")
+        if job_queue.retry(job):
+            logger.info(f"Job {job.id} re-queued")
+    finally:
+        # Solo los trabajos con resultado: contar fallos inflaría el throughput justo cuando el engine falla
+        throughput_meter.finished(completed=status == "completed")
+        _active_jobs.pop(threading.current_thread().name, None)
+
+
+def run_worker(job_queue: JobQueue, stop_event: Optional[threading.Event] = None):
+    """Bucle principal: saca trabajos de la cola hasta que se pida parar."""
+    if ENGINE_DEVICES:
+        run_device_pool(job_queue, stop_event)
+        return
+    logger.info(f"Worker {os.getpid()} waiting for jobs...")
+    while stop_event is None or not stop_event.is_set():
+        job = job_queue.dequeue(timeout=5)
+        if job is None:
+            continue
+        process_job(job_queue, job)
+
+
+def get_device_pool():
+    """DevicePool de este proceso (ENGINE_DEVICES), creado al primer uso."""
+    global _device_pool
+    with _device_pool_lock:
+        if _device_pool is None:
+            from app.services.device_pool import create_device_pool, resolve_devices
+
+            _device_pool = create_device_pool(resolve_devices(ENGINE_DEVICES), threads=WORKER_THREADS)
+        return _device_pool
+
+
+def run_device_pool(job_queue: JobQueue, stop_event: Optional[threading.Event] = None):
+    """Un engine por dispositivo; los trabajos se reparten por afinidad de modelo y profundidad de cola."""
+    get_device_pool().run(job_queue, lambda job, engine: process_job(job_queue, job, engine), stop_event)
+
+
+def worker_info() -> Dict[str, Any]:
+    """Estado que este proceso publica en su heartbeat (lo lee /health/ready)."""
+    info = {
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "jobs": list(_active_jobs.values()),
+        "models": {name: entry["state"] for name, entry in model_registry.stats()["models"].items()},
+        "warmup": dict(_warmup),
+        "prefetch": dict(model_prefetcher.stats),
+        "throughput": throughput_meter.snapshot(),
+        "stats": worker_stats(),
+    }
+    if _device_pool is not None:
+        info["models"] = _device_pool.models()
+        info["devices"] = _device_pool.snapshot()
+    return info
+
+
+def worker_stats() -> Dict[str, Any]:
+    """
+    Contadores de las etapas de este proceso (encode, upscale, pasos de
+    denoising, modelos). Los endpoints /health/* de la API los leen del
+    heartbeat: con Redis la API no ejecuta trabajos y sus contadores están a cero.
+    """
+    from app.services.progress import step_stats
+    from app.services.video_encoder import encode_stats
+
+    # Solo si el engine ya los importó: el heartbeat no debe cargar torch ni cv2
+    upscaler = sys.modules.get("app.services.upscaler")
+    face_tracking = sys.modules.get("app.services.face_tracking")
+    registries = [worker.engine.models for worker in _device_pool.workers] if _device_pool is not None else [model_registry]
+    return {
+        "encoder": dict(encode_stats),
+        "upscaler": dict(upscaler.upscale_stats) if upscaler else None,
+        "throughput": {model: dict(entry) for model, entry in dict(step_stats).items()},
+        "models": {
+            "registries": [registry.stats() for registry in registries],
+            "face_source_cache": face_tracking.source_face_cache.stats() if face_tracking else None,
+        },
+    }
+
+
+def warm_up(names: List[str] = WARMUP_MODELS):
+    """Carga los modelos indicados; el engine (torch, diffusers...) se importa aquí, no al arrancar."""
+    _warmup["status"] = "running"
+    start = time.perf_counter()
+    try:
+        if ENGINE_DEVICES:
+            get_device_pool().warm_up(names)
+        else:
+            from app.services.ai_engine import engine
+
+            for name in names:
+                engine.models.get(name)
+        _warmup["status"] = "done"
+    except Exception as e:
+        logger.error(f"Model warmup failed: {e}")
+        _warmup.update(status="failed", error=str(e))
+    _warmup["seconds"] = round(time.perf_counter() - start, 2)
+    logger.info(f"Warmup {_warmup['status']} in {_warmup['seconds']}s ({', '.join(names)})")
+
+
+def _heartbeat_loop(job_queue: JobQueue, worker_id: str, stop_event: threading.Event):
+    while not stop_event.is_set():
+        try:
+            job_queue.heartbeat(worker_id, worker_info())
+        except Exception as e:
+            logger.warning(f"Worker heartbeat failed: {e}")
+        stop_event.wait(WORKER_HEARTBEAT_INTERVAL)
+
+
+def start_background_tasks(job_queue: JobQueue, stop_event: threading.Event):
+    """Heartbeat del proceso y, si WARMUP_MODELS está definido, precarga de modelos en segundo plano."""
+    worker_id = f"{WORKER_ID}:{os.getpid()}"
+    # El primero antes de sacar trabajos: recover() de otro worker no debe tomar su lista processing por huérfana
+    job_queue.heartbeat(worker_id, worker_info())
+    threading.Thread(
+        target=_heartbeat_loop, args=(job_queue, worker_id, stop_event), name="worker-heartbeat", daemon=True
+    ).start()
+    if WARMUP_MODELS:
+        def warm():
+            warm_up(WARMUP_MODELS)
+            job_queue.heartbeat(worker_id, worker_info())
+
+        threading.Thread(target=warm, name="model-warmup", daemon=True).start()
+
+
+def start_embedded_workers(count: int = EMBEDDED_WORKERS) -> threading.Event:
+    """Arranca workers como hilos dentro del proceso HTTP (modo local / Colab)."""
+    stop_event = threading.Event()
+    job_queue = get_job_queue()
+    if count and ENGINE_DEVICES:
+        # El pool ya ejecuta un trabajo por dispositivo a la vez
+        count = 1
+    for i in range(count):
+        threading.Thread(
+            target=run_worker,
+            args=(job_queue, stop_event),
+            name=f"embedded-worker-{i}",
+            daemon=True,
+        ).start()
+    if count:
+        check_model_store()
+        start_background_tasks(job_queue, stop_event)
+        logger.info(f"Started {count} embedded worker thread(s)")
+    return stop_event
+
+
+def _worker_process(index: int = 0):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Un puerto por proceso: WORKER_METRICS_PORT, +1, +2...
+    start_metrics_server(WORKER_METRICS_PORT and WORKER_METRICS_PORT + index)
+    missing = check_model_store()
+    if missing and MODEL_STORE_OFFLINE:
+        raise SystemExit(f"Missing models for offline start: {', '.join(missing)} (python -m app.services.model_store)")
+    job_queue = get_job_queue()
+    stop_event = threading.Event()
+    start_background_tasks(job_queue, stop_event)
+    # El DevicePool ya arranca WORKER_THREADS hilos por dispositivo
+    threads = 1 if ENGINE_DEVICES else WORKER_THREADS
+    for i in range(1, threads):
+        threading.Thread(target=run_worker, args=(job_queue, stop_event), name=f"job-thread-{i}", daemon=True).start()
+    run_worker(job_queue, stop_event)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if JOB_QUEUE_BACKEND != "redis":
+        raise SystemExit("app.worker needs a shared queue: set REDIS_URL (or JOB_QUEUE_BACKEND=redis)")
+
+    get_job_queue().recover()
+
+    if ENGINE_DEVICES:
+        if WORKER_CONCURRENCY > 1:
+            logger.warning("ENGINE_DEVICES is set: running one process with a device pool, ignoring WORKER_CONCURRENCY")
+        _worker_process()
+        return
+
+    if WORKER_CONCURRENCY <= 1:
+        _worker_process()
+        return
+
+    # spawn (no fork): CUDA no sobrevive a un fork
+    ctx = multiprocessing.get_context("spawn")
+    processes: List[multiprocessing.Process] = []
+    for i in range(WORKER_CONCURRENCY):
+        p = ctx.Process(target=_worker_process, args=(i,), name=f"gpu-worker-{i}")
+        p.start()
+        processes.append(p)
+    logger.info(f"Started {len(processes)} worker process(es)")
+
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
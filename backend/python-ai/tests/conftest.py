@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos del servicio se importan como `app.*` desde src/ (igual que uvicorn y app.worker)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
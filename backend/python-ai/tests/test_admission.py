@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from app.services import admission, job_queue
+from app.services.admission import AdmissionRejected, ThroughputMeter, estimate_wait, submit
+from app.services.job_queue import Job, LocalJobQueue
+
+
+def make_job(job_id, **kwargs):
+    return Job(id=job_id, kind="text", payload={}, **kwargs)
+
+
+def queue_with(workers, **lanes):
+    queue = LocalJobQueue()
+    for priority, count in lanes.items():
+        for index in range(count):
+            queue.enqueue(make_job(f"{priority}-{index}", priority=priority))
+    for worker_id, rate in workers.items():
+        queue.heartbeat(worker_id, {"throughput": {"jobs_per_second": rate}})
+    return queue
+
+
+def test_estimate_counts_the_jobs_ahead_over_the_cluster_throughput():
+    queue = queue_with({"w1": 0.1, "w2": 0.15}, preview=2, final=3, batch=5)
+    assert estimate_wait("preview", queue)["estimatedWaitSeconds"] == 8.0
+    estimate = estimate_wait("final", queue)
+    assert estimate["ahead"] == 5
+    assert estimate["workers"] == 2
+    assert estimate["jobsPerSecond"] == 0.25
+    assert estimate["estimatedWaitSeconds"] == 20.0
+    assert estimate_wait("batch", queue)["estimatedWaitSeconds"] == 40.0
+
+
+def test_workers_without_measurements_use_the_default_job_time(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_DEFAULT_JOB_SECONDS", 100)
+    queue = queue_with({"w1": None}, final=2)
+    assert estimate_wait("final", queue)["estimatedWaitSeconds"] == 200.0
+
+
+def test_no_live_workers_means_no_estimate():
+    estimate = estimate_wait("final", queue_with({}, final=2))
+    assert estimate["jobsPerSecond"] is None
+    assert estimate["estimatedWaitSeconds"] is None
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError, match="Unknown job priority"):
+        estimate_wait("urgent", LocalJobQueue())
+
+
+def test_submit_accepts_and_dedupes():
+    queue = queue_with({"w1": 1.0})
+    assert submit(make_job("a"), queue)["estimatedWaitSeconds"] == 0.0
+    assert submit(make_job("a"), queue) is None
+
+
+def test_overloaded_class_gets_retry_after_for_the_excess(monkeypatch):
+    monkeypatch.setitem(admission.ADMISSION_MAX_WAIT, "preview", 10)
+    queue = queue_with({"w1": 0.5}, preview=8)
+    with pytest.raises(AdmissionRejected) as e:
+        submit(make_job("new", priority="preview"), queue)
+    assert e.value.reason == "overloaded"
+    # 16 s de espera, 10 s permitidos
+    assert e.value.retry_after == 6
+    assert queue.status("new") is None
+
+
+def test_resubmitted_id_is_a_duplicate_even_when_overloaded(monkeypatch):
+    monkeypatch.setitem(admission.ADMISSION_MAX_WAIT, "final", 10)
+    queue = queue_with({"w1": 0.5}, final=8)
+    assert submit(make_job("final-0"), queue) is None
+
+
+def test_job_that_would_expire_in_the_queue_is_rejected():
+    queue = queue_with({"w1": 0.1}, final=3)
+    with pytest.raises(AdmissionRejected) as e:
+        submit(make_job("new", deadline=time.time() + 10), queue)
+    assert e.value.reason == "deadline"
+    assert 19 <= e.value.retry_after <= 21
+
+
+def test_full_class_retries_after_its_first_job_leaves(monkeypatch):
+    monkeypatch.setitem(job_queue.JOB_QUEUE_LIMITS, "final", 3)
+    monkeypatch.setitem(admission.ADMISSION_MAX_WAIT, "final", 0)
+    queue = queue_with({"w1": 0.5}, preview=1, final=3)
+    with pytest.raises(AdmissionRejected) as e:
+        submit(make_job("new"), queue)
+    assert e.value.reason == "queue_full"
+    # El preview y el primer final: 2 trabajos a 0.5/s
+    assert e.value.retry_after == 4
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_RETRY_AFTER", 60)
+    monkeypatch.setitem(admission.ADMISSION_MAX_WAIT, "final", 1)
+    queue = queue_with({"w1": 0.001}, final=5)
+    with pytest.raises(AdmissionRejected) as e:
+        submit(make_job("new"), queue)
+    assert e.value.retry_after == 60
+
+
+def test_throughput_meter_counts_completions_per_busy_second(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: clock[0])
+    meter = ThroughputMeter(window=10)
+    assert meter.jobs_per_second() is None
+    for _ in range(2):
+        meter.started()
+        clock[0] += 5
+        meter.finished()
+        # El tiempo sin trabajo no cuenta
+        clock[0] += 100
+    assert meter.jobs_per_second() == pytest.approx(0.2)
+    assert meter.snapshot()["completed"] == 2
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from app.services import cancellation
+from app.services.cancellation import CancelToken, JobCancelled, job_deadline
+
+
+def test_job_deadline(monkeypatch):
+    assert job_deadline(30, enqueued_at=1000.0) == 1030.0
+    assert job_deadline(0, enqueued_at=1000.0) is None
+    monkeypatch.setattr(cancellation, "JOB_DEFAULT_TIMEOUT", 60)
+    assert job_deadline(None, enqueued_at=1000.0) == 1060.0
+    monkeypatch.setattr(cancellation, "JOB_DEFAULT_TIMEOUT", 0)
+    assert job_deadline(None, enqueued_at=1000.0) is None
+
+
+def test_expired_deadline_raises():
+    token = CancelToken("a", deadline=time.time() - 1)
+    with pytest.raises(JobCancelled) as e:
+        token.check()
+    assert e.value.reason == "deadline"
+    assert str(e.value) == "deadline exceeded"
+
+
+def test_cancel_flag_is_polled_at_most_once_per_interval():
+    polls = []
+    cancelled = set()
+
+    def is_cancelled(job_id):
+        polls.append(job_id)
+        return job_id in cancelled
+
+    token = CancelToken("a", is_cancelled=is_cancelled, poll_interval=3600)
+    token.check()
+    cancelled.add("a")
+    # Dentro del intervalo no se vuelve a consultar la cola
+    token.check()
+    assert polls == ["a"]
+
+    token = CancelToken("a", is_cancelled=is_cancelled, poll_interval=0)
+    with pytest.raises(JobCancelled) as e:
+        token.check()
+    assert e.value.reason == "cancelled"
+    # El motivo se queda fijado
+    assert token.reason() == "cancelled"
@@ -0,0 +1,37 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services.cpu_profile import _channels_last
+
+
+class MixedConvs(torch.nn.Module):
+    """Como CogVideoXDownsample3D / el VAE de SVD: Conv3d y Conv2d en el mismo módulo."""
+
+    def __init__(self):
+        super().__init__()
+        self.temporal = torch.nn.Conv3d(4, 8, 3, padding=1)
+        self.spatial = torch.nn.Conv2d(8, 4, 3, padding=1)
+        self.norm = torch.nn.GroupNorm(2, 8)
+
+    def forward(self, x):
+        x = self.norm(self.temporal(x))
+        batch, channels, frames, height, width = x.shape
+        x = x.permute(0, 2, 1, 3, 4).reshape(batch * frames, channels, height, width)
+        return self.spatial(x)
+
+
+def test_mixed_conv_module_gets_a_format_per_weight_rank():
+    torch.manual_seed(0)
+    module = MixedConvs().eval()
+    x = torch.randn(1, 4, 3, 16, 16)
+    with torch.inference_mode():
+        expected = module(x)
+
+    _channels_last(module)
+
+    assert module.temporal.weight.is_contiguous(memory_format=torch.channels_last_3d)
+    assert module.spatial.weight.is_contiguous(memory_format=torch.channels_last)
+    assert isinstance(module.spatial.weight, torch.nn.Parameter)
+    with torch.inference_mode():
+        torch.testing.assert_close(module(x), expected, rtol=1e-4, atol=1e-5)
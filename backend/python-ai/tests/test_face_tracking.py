@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from app.services.face_tracking import track_faces
+
+
+class Face(dict):
+    """Réplica de insightface.app.common.Face: dict con atributos y __getattr__ que devuelve None."""
+
+    def __init__(self, d=None, **kwargs):
+        super().__init__()
+        for key, value in dict(d or {}, **kwargs).items():
+            setattr(self, key, value)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        super().__setitem__(name, value)
+
+    __setitem__ = __setattr__
+
+    def __getattr__(self, name):
+        return None
+
+
+def frame_with_face(x: int) -> np.ndarray:
+    frame = np.zeros((96, 96, 3), dtype=np.uint8)
+    cv2.circle(frame, (x, 48), 14, (200, 180, 160), -1)
+    for dx, dy in [(-5, -4), (5, -4), (0, 2), (-4, 7), (4, 7)]:
+        cv2.circle(frame, (x + dx, 48 + dy), 2, (20, 20, 20), -1)
+    return cv2.GaussianBlur(frame, (3, 3), 0)
+
+
+class FaceApp:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, frame):
+        self.calls += 1
+        x = 30
+        kps = np.array([[x - 5, 44], [x + 5, 44], [x, 50], [x - 4, 55], [x + 4, 55]], dtype=np.float32)
+        return [Face(bbox=np.array([x - 14, 34, x + 14, 62], dtype=np.float32), kps=kps, embedding=np.ones(4))]
+
+
+def test_tracked_frames_propagate_insightface_faces():
+    face_app = FaceApp()
+    frames = [frame_with_face(30 + step) for step in range(4)]
+    results = track_faces(face_app, frames, redetect_interval=10)
+
+    assert face_app.calls == 1
+    assert [len(faces) for faces in results] == [1, 1, 1, 1]
+    detected, moved = results[0][0], results[-1][0]
+    assert type(moved) is Face
+    assert moved is not detected
+    # Los landmarks y la bbox se mueven con la cara; el resto (embedding) se conserva
+    assert moved.kps[:, 0].mean() == pytest.approx(detected.kps[:, 0].mean() + 3, abs=1)
+    assert moved.bbox[0] == pytest.approx(detected.bbox[0] + 3, abs=1)
+    assert moved["kps"] is moved.kps
+    assert moved.embedding is detected.embedding
+    np.testing.assert_array_equal(detected.kps[:, 0], [25, 35, 30, 26, 34])
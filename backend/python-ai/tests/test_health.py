@@ -0,0 +1,54 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import health
+from app.services.job_queue import LocalJobQueue
+
+
+@pytest.fixture
+def client(monkeypatch):
+    queue = LocalJobQueue()
+    monkeypatch.setattr(health, "get_job_queue", lambda: queue)
+    app = FastAPI()
+    app.include_router(health.router, prefix="/health")
+    return TestClient(app), queue
+
+
+def stats(encodes, upscaled_frames, steps):
+    return {
+        "encoder": {"count": encodes, "frames": encodes * 49, "total_seconds": encodes * 2.0, "nvenc_failures": 0},
+        "upscaler": {"count": 1, "frames": upscaled_frames, "total_seconds": upscaled_frames * 0.1} if upscaled_frames else None,
+        "throughput": {"t2v": {"steps": steps, "seconds": steps / 2, "last_steps_per_second": 2.0}},
+        "models": {"registries": [{"device": "cuda:0", "models": {}}], "face_source_cache": None},
+    }
+
+
+def test_stage_stats_come_from_worker_heartbeats(client):
+    client, queue = client
+    queue.heartbeat("gpu-a:1", {"stats": stats(encodes=2, upscaled_frames=10, steps=50)})
+    queue.heartbeat("gpu-b:1", {"stats": stats(encodes=1, upscaled_frames=0, steps=100)})
+    # Un worker de una versión anterior, sin estadísticas
+    queue.heartbeat("old:1", {})
+
+    encoder = client.get("/health/encoder").json()
+    assert encoder["count"] == 3
+    assert encoder["frames"] == 147
+    assert encoder["avg_seconds"] == 2.0
+    assert set(encoder["workers"]) == {"gpu-a:1", "gpu-b:1"}
+
+    upscaler = client.get("/health/upscaler").json()
+    assert upscaler["frames"] == 10
+    assert upscaler["avg_per_frame_seconds"] == pytest.approx(0.1)
+    assert list(upscaler["workers"]) == ["gpu-a:1"]
+
+    assert client.get("/health/throughput").json() == {"t2v": {"steps": 150, "seconds": 75.0, "steps_per_second": 2.0}}
+    assert client.get("/health/models").json()["workers"]["gpu-b:1"]["registries"][0]["device"] == "cuda:0"
+
+
+def test_no_workers_means_empty_stats(client):
+    client, _ = client
+    assert client.get("/health/encoder").json() == {
+        "count": 0, "frames": 0, "total_seconds": 0, "nvenc_failures": 0, "avg_seconds": 0.0, "workers": {},
+    }
+    assert client.get("/health/throughput").json() == {}
@@ -0,0 +1,49 @@
+import asyncio
+from io import BytesIO
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.services.image_fetch import ImageFetcher, InputFetchError
+
+
+def png_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class SlowBody(httpx.AsyncByteStream):
+    """Cuerpo que envía un byte cada `interval`: cada lectura cumple el timeout por operación."""
+
+    def __init__(self, interval: float, state: dict):
+        self.interval = interval
+        self.state = state
+
+    async def __aiter__(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                yield b"x"
+        finally:
+            self.state["closed"] = True
+
+
+def test_total_deadline_stops_a_trickling_download():
+    state = {}
+
+    def handler(request):
+        return httpx.Response(200, stream=SlowBody(0.05, state))
+
+    fetcher = ImageFetcher(timeout=1.0, total_timeout=0.3, transport=httpx.MockTransport(handler))
+    with pytest.raises(InputFetchError, match="exceeded"):
+        fetcher.fetch(("http://images/slow.png", None, None))
+    assert state.get("closed")
+
+
+def test_fetch_decodes_and_skips_missing_urls():
+    fetcher = ImageFetcher(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=png_bytes())))
+    image, missing = fetcher.fetch(("http://images/a.png", (2, 2), None), (None, None, None))
+    assert image.image.size == (2, 2)
+    assert missing is None
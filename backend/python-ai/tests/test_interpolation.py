@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from app.services.interpolation import (
+    INTERPOLATION_MODES,
+    interpolate_frames,
+    interpolated_count,
+    interpolation_mode,
+    keyframe_count,
+)
+
+
+class LinearInterpolator:
+    """Mezcla lineal de los dos keyframes: basta para comprobar posiciones y recuentos."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def interpolate(self, frame_a, frame_b, times, mode):
+        self.calls += 1
+        return [(frame_a * (1 - t) + frame_b * t).astype(np.uint8) for t in times]
+
+
+def keyframes(count, size=4):
+    # El valor de cada keyframe es su índice * 30, así se ve de dónde sale cada frame
+    return np.stack([np.full((size, size, 3), index * 30, dtype=np.uint8) for index in range(count)])
+
+
+@pytest.mark.parametrize("frames, factor, expected", [
+    (96, 1, 96),
+    (96, 2, 49),
+    (96, 3, 33),
+    (25, 2, 13),
+    (49, 2, 25),
+    (1, 3, 1),
+    (0, 2, 0),
+])
+def test_keyframe_count(frames, factor, expected):
+    assert keyframe_count(frames, factor) == expected
+
+
+@pytest.mark.parametrize("frames", [1, 2, 13, 25, 48, 49, 96, 240])
+@pytest.mark.parametrize("factor", [1, 2, 3])
+def test_keyframes_always_cover_the_requested_frames(frames, factor):
+    keys = keyframe_count(frames, factor)
+    assert interpolated_count(keys, factor) >= frames
+    # Un keyframe menos ya no llegaría
+    if keys > 1:
+        assert interpolated_count(keys - 1, factor) < frames
+
+
+def test_interpolated_count():
+    assert interpolated_count(0, 2) == 0
+    assert interpolated_count(1, 2) == 1
+    assert interpolated_count(13, 2) == 25
+    assert interpolated_count(13, 2, skip_first=True) == 24
+    assert interpolated_count(33, 3) == 97
+
+
+def test_interpolate_frames_places_keyframes_and_intermediates():
+    mode = INTERPOLATION_MODES["fast"]
+    output = interpolate_frames(LinearInterpolator(), keyframes(3), mode)
+    assert output.shape == (7, 4, 4, 3)
+    assert [int(frame[0, 0, 0]) for frame in output] == [0, 10, 20, 30, 40, 50, 60]
+
+
+def test_interpolate_frames_skip_first_and_limit():
+    mode = INTERPOLATION_MODES["balanced"]
+    interpolator = LinearInterpolator()
+    progress = []
+    output = interpolate_frames(interpolator, keyframes(4), mode, skip_first=True, limit=4, on_progress=progress.append)
+    # Sin el ancla: 15, 30, 45, 60 (y no se interpola más de lo que se va a usar)
+    assert [int(frame[0, 0, 0]) for frame in output] == [15, 30, 45, 60]
+    assert interpolator.calls == 2
+    assert progress[-1] == 1.0
+
+
+def test_interpolate_frames_with_a_single_keyframe():
+    output = interpolate_frames(LinearInterpolator(), keyframes(1), INTERPOLATION_MODES["balanced"])
+    assert output.shape[0] == 1
+
+
+def test_flow_interpolator_tracks_a_moving_square():
+    cv2 = pytest.importorskip("cv2")
+    from app.services.interpolation import FlowInterpolator
+
+    def frame(x):
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        cv2.rectangle(image, (x, 24), (x + 15, 39), (255, 255, 255), -1)
+        return cv2.GaussianBlur(image, (5, 5), 0)
+
+    middle, = FlowInterpolator().interpolate(frame(16), frame(24), [0.5], INTERPOLATION_MODES["quality"])
+    error = np.abs(middle.astype(np.float32) - frame(20)).mean()
+    repeat = np.abs(frame(16).astype(np.float32) - frame(20)).mean()
+    assert error < repeat / 2
+
+
+def test_unknown_mode_is_rejected():
+    assert interpolation_mode("off").factor == 1
+    with pytest.raises(ValueError, match="Unknown interpolation mode"):
+        interpolation_mode("turbo")
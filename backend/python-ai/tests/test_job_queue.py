@@ -0,0 +1,153 @@
+import pytest
+
+from app.services import job_queue
+from app.services.job_queue import Job, LocalJobQueue, QueueRejected
+
+
+def make_job(job_id, **kwargs):
+    return Job(id=job_id, kind="text", payload={"prompt": job_id}, **kwargs)
+
+
+def test_dequeue_serves_priority_classes_in_order_and_fifo_within_each():
+    queue = LocalJobQueue()
+    for job in [make_job("b1", priority="batch"), make_job("f1"), make_job("p1", priority="preview"), make_job("f2")]:
+        assert queue.enqueue(job)
+    assert queue.lanes() == {"preview": 1, "final": 2, "batch": 1}
+    assert [job.id for job in queue.peek(4)] == ["p1", "f1", "f2", "b1"]
+    assert [queue.dequeue(timeout=0).id for _ in range(4)] == ["p1", "f1", "f2", "b1"]
+    assert queue.dequeue(timeout=0) is None
+
+
+def test_duplicate_id_is_not_enqueued_twice():
+    queue = LocalJobQueue()
+    assert queue.enqueue(make_job("a"))
+    assert not queue.enqueue(make_job("a"))
+    assert queue.depth() == {"queued": 1, "processing": 0}
+
+
+def test_ack_records_the_final_status():
+    queue = LocalJobQueue()
+    queue.enqueue(make_job("a"))
+    job = queue.dequeue(timeout=0)
+    assert queue.status("a") == "processing"
+    assert queue.depth() == {"queued": 0, "processing": 1}
+    queue.ack(job, "failed")
+    assert queue.status("a") == "failed"
+    assert queue.depth() == {"queued": 0, "processing": 0}
+
+
+def test_retry_requeues_until_max_attempts(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 2)
+    queue = LocalJobQueue()
+    queue.enqueue(make_job("a"))
+    job = queue.dequeue(timeout=0)
+    assert queue.retry(job)
+    assert queue.status("a") == "queued"
+    job = queue.dequeue(timeout=0)
+    assert job.attempts == 1
+    assert not queue.retry(job)
+    assert queue.status("a") == "failed"
+    assert queue.depth() == {"queued": 0, "processing": 0}
+
+
+def test_full_class_is_rejected(monkeypatch):
+    monkeypatch.setitem(job_queue.JOB_QUEUE_LIMITS, "preview", 1)
+    queue = LocalJobQueue()
+    queue.enqueue(make_job("a", priority="preview"))
+    with pytest.raises(QueueRejected) as e:
+        queue.enqueue(make_job("b", priority="preview"))
+    assert e.value.reason == "queue_full"
+    # Las demás clases no se ven afectadas
+    assert queue.enqueue(make_job("c"))
+
+
+def test_tenant_slot_is_released_on_ack_and_cancel(monkeypatch):
+    monkeypatch.setattr(job_queue, "TENANT_MAX_JOBS", 2)
+    queue = LocalJobQueue()
+    queue.enqueue(make_job("a", tenant="t"))
+    queue.enqueue(make_job("b", tenant="t"))
+    with pytest.raises(QueueRejected) as e:
+        queue.enqueue(make_job("c", tenant="t"))
+    assert e.value.reason == "tenant_limit"
+    assert queue.enqueue(make_job("d", tenant="other"))
+
+    queue.ack(queue.dequeue(timeout=0))
+    assert queue.enqueue(make_job("c", tenant="t"))
+    assert queue.cancel("b") == "cancelled"
+    assert queue.enqueue(make_job("e", tenant="t"))
+
+
+def test_cancel_of_a_running_job_is_deferred_to_the_worker():
+    queue = LocalJobQueue()
+    queue.enqueue(make_job("a"))
+    job = queue.dequeue(timeout=0)
+    assert queue.cancel("a") == "cancelling"
+    assert queue.is_cancelled("a")
+    queue.ack(job, "cancelled")
+    assert queue.cancel("a") == "cancelled"
+    assert queue.cancel("missing") is None
+
+
+def test_local_queue_has_nothing_to_recover():
+    queue = LocalJobQueue()
+    queue.enqueue(make_job("a"))
+    queue.dequeue(timeout=0)
+    assert queue.recover() == 0
+
+
+@pytest.fixture
+def redis_queue(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(
+        lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)))
+
+    def factory(worker_id="worker-a"):
+        monkeypatch.setattr(job_queue, "WORKER_ID", worker_id)
+        return job_queue.RedisJobQueue(prefix="test:jobs")
+
+    return factory
+
+
+def test_redis_enqueue_applies_limits_atomically(redis_queue, monkeypatch):
+    pytest.importorskip("lupa")
+    monkeypatch.setitem(job_queue.JOB_QUEUE_LIMITS, "preview", 1)
+    monkeypatch.setattr(job_queue, "TENANT_MAX_JOBS", 1)
+    queue = redis_queue()
+    assert queue.enqueue(make_job("a", priority="preview"))
+    assert not queue.enqueue(make_job("a", priority="preview"))
+    with pytest.raises(QueueRejected, match="full"):
+        queue.enqueue(make_job("b", priority="preview"))
+    assert queue.enqueue(make_job("c", tenant="t"))
+    with pytest.raises(QueueRejected, match="tenant"):
+        queue.enqueue(make_job("d", tenant="t"))
+    assert [queue.dequeue(timeout=0).id for _ in range(2)] == ["a", "c"]
+
+
+def test_redis_recover_requeues_own_and_orphaned_jobs_only(redis_queue):
+    queue = redis_queue("new-host")
+    orphan = make_job("orphan", priority="preview")
+    live = make_job("live")
+    mine = make_job("mine")
+    queue.redis.lpush(queue._processing_key("old-host"), orphan.to_json())
+    queue.redis.lpush(queue._processing_key("busy-host"), live.to_json())
+    queue.redis.lpush(queue.processing_key, mine.to_json())
+    queue.heartbeat("busy-host:42", {})
+
+    assert queue.recover() == 2
+    assert queue.lanes() == {"preview": 1, "final": 1, "batch": 0}
+    assert queue.status("orphan") == "queued"
+    assert queue.redis.llen(queue._processing_key("busy-host")) == 1
+    assert queue.redis.llen(queue._processing_key("old-host")) == 0
+    assert [queue.dequeue(timeout=0).id for _ in range(2)] == ["orphan", "mine"]
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class NoCancel(job_queue.JobQueue):
+        def enqueue(self, job):
+            return True
+
+    with pytest.raises(TypeError, match="abstract"):
+        NoCancel()
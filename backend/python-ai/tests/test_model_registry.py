@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from app.services.model_registry import DEVICE, LOADING, UNLOADED, ModelRegistry
+
+
+class SlowLoader:
+    def __init__(self, value):
+        self.value = value
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return self.value
+
+
+def registry():
+    return ModelRegistry(vram_budget=0, ram_budget=0, device="cpu")
+
+
+def test_cold_load_does_not_block_stats_or_loaded_models():
+    models = registry()
+    slow = SlowLoader("big")
+    models.register("big", slow)
+    models.register("small", lambda: "small")
+    models.get("small")
+
+    loader = threading.Thread(target=models.get, args=("big",))
+    loader.start()
+    assert slow.started.wait(5)
+    start = time.perf_counter()
+    assert models.stats()["models"]["big"]["state"] == LOADING
+    with models.use("small") as small:
+        assert small == "small"
+    assert time.perf_counter() - start < 1
+    assert not models.is_loaded("big")
+
+    slow.release.set()
+    loader.join(5)
+    assert models.state("big") == DEVICE
+
+
+def test_concurrent_callers_wait_for_a_single_load():
+    models = registry()
+    slow = SlowLoader("big")
+    models.register("big", slow)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(models.get("big"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert slow.started.wait(5)
+    slow.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["big"] * 3
+    assert slow.calls == 1
+    assert models.stats()["models"]["big"]["loads"] == 1
+
+
+def test_failed_load_can_be_retried():
+    models = registry()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("download failed")
+        return "model"
+
+    models.register("flaky", flaky)
+    with pytest.raises(RuntimeError):
+        models.get("flaky")
+    assert models.state("flaky") == UNLOADED
+    assert models.get("flaky") == "model"
+
+
+def test_use_pins_the_model_until_released():
+    models = registry()
+    models.register("a", lambda: "a")
+    with models.use("a"):
+        assert models.stats()["models"]["a"]["in_use"] == 1
+        models.unload("a")
+        assert models.state("a") == DEVICE
+    assert models.stats()["models"]["a"]["in_use"] == 0
+    models.unload("a")
+    assert models.state("a") == UNLOADED
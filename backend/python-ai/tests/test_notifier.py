@@ -0,0 +1,82 @@
+import json
+import threading
+
+import httpx
+import pytest
+
+from app.services import notifier as notifier_module
+from app.services.notifier import WebhookNotifier
+
+
+class Recorder:
+    """Transporte falso: guarda los payloads y responde con los códigos de `statuses` (luego 200)."""
+
+    def __init__(self, statuses=(), gate=None):
+        self.statuses = list(statuses)
+        self.gate = gate
+        self.entered = threading.Event()
+        self.payloads = []
+
+    def __call__(self, request):
+        self.entered.set()
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        self.payloads.append(request.read())
+        return httpx.Response(self.statuses.pop(0) if self.statuses else 200)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(notifier_module, "WEBHOOK_BACKOFF_BASE", 0)
+
+
+def make(recorder):
+    return WebhookNotifier("http://node", concurrency=1, transport=httpx.MockTransport(recorder))
+
+
+def statuses(recorder):
+    return [json.loads(payload)["status"] for payload in recorder.payloads]
+
+
+def test_progress_after_a_coalesced_terminal_status_is_dropped():
+    gate = threading.Event()
+    recorder = Recorder(gate=gate)
+    notifier = make(recorder)
+    # El primer progreso queda en vuelo; el segundo pendiente y el terminal se funde con él
+    notifier.notify("job", "processing", 10)
+    assert recorder.entered.wait(5)
+    notifier.notify("job", "processing", 20)
+    notifier.notify("job", "completed", 100)
+    notifier.notify("job", "processing", 90)
+    gate.set()
+    assert notifier.flush(5)
+    notifier.notify("job", "processing", 95)
+    assert notifier.flush(5)
+    assert statuses(recorder) == ["processing", "completed"]
+
+
+def test_terminal_status_is_retried_on_5xx_and_network_errors():
+    calls = []
+
+    def flaky(request):
+        calls.append(1)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused")
+        return httpx.Response(503 if len(calls) == 2 else 200)
+
+    notifier = make(flaky)
+    notifier.notify("job", "failed", 0)
+    assert notifier.flush(5)
+    assert len(calls) == 3
+    assert notifier.stats["retries"] == 2
+    assert notifier.stats["sent"] == 1
+
+
+def test_terminal_status_is_not_retried_on_4xx():
+    recorder = Recorder(statuses=[422])
+    notifier = make(recorder)
+    notifier.notify("job", "completed", 100)
+    assert notifier.flush(5)
+    assert len(recorder.payloads) == 1
+    assert notifier.stats["retries"] == 0
+    assert notifier.stats["failed"] == 1
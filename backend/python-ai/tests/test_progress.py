@@ -0,0 +1,58 @@
+from app.services import progress as progress_module
+from app.services.progress import JobProgress, SegmentProgress
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(monkeypatch, min_interval=0.5):
+    clock = Clock()
+    monkeypatch.setattr(progress_module.time, "monotonic", clock)
+    spans = []
+    monkeypatch.setattr(progress_module, "observe_stage", lambda stage, seconds: spans.append((stage, seconds)))
+    monkeypatch.setattr(progress_module, "trace_span", lambda *args, **kwargs: None)
+    sent = []
+    job = JobProgress("job", publish=lambda job_id, status, percent, **event: sent.append(event), min_interval=min_interval)
+    return job, clock, sent, spans
+
+
+def test_segment_updates_do_not_defeat_the_diffusion_throttle(monkeypatch):
+    job, clock, sent, _ = make(monkeypatch)
+    segment = SegmentProgress(job, 0)
+    for step in range(1, 41):
+        # Difusión del trozo siguiente y post-proceso del anterior a la vez, un paso cada 0.1 s
+        clock.now += 0.1
+        job.update("diffusion", step / 50, step=step)
+        segment.update("upscale", step / 40)
+    # ~4 s: una publicación por intervalo más el inicio y el final del upscale, no una por paso
+    assert len(sent) <= 12
+    assert sent[0]["stage"] == "diffusion"
+    finished = [event for event in sent if event.get("segmentStage") == "upscale" and event["stageProgress"] == 1.0]
+    assert len(finished) == 1
+    assert finished[0]["stage"] == "segment"
+    assert finished[0]["segment"] == 0
+
+
+def test_segment_does_not_move_the_job_percentage(monkeypatch):
+    job, clock, sent, _ = make(monkeypatch, min_interval=0)
+    job.update("diffusion", 0.5)
+    before = job.progress
+    SegmentProgress(job, 0).update("encode", 1.0)
+    assert job.progress == before
+    assert sent[-1]["stage"] == "segment"
+    assert job.stage_name == "diffusion"
+
+
+def test_every_segment_stage_is_timed(monkeypatch):
+    job, clock, _, spans = make(monkeypatch)
+    for index in range(3):
+        segment = SegmentProgress(job, index)
+        segment.update("encode", 0.0)
+        clock.now += 2 + index
+        segment.update("encode", 1.0)
+    assert spans == [("segment_encode", 2.0), ("segment_encode", 3.0), ("segment_encode", 4.0)]
@@ -0,0 +1,122 @@
+import struct
+from concurrent.futures import Future
+
+import pytest
+
+from app.services.segmented import HlsPlaylist, conditioning_video, fmp4_init_size, plan_chunks
+
+
+def box(kind: bytes, payload_size: int = 0) -> bytes:
+    return struct.pack(">I4s", 8 + payload_size, kind) + b"\0" * payload_size
+
+
+@pytest.mark.parametrize("total, expected", [
+    (1, [1]),
+    (49, [49]),
+    (50, [49, 1]),
+    (89, [49, 40]),
+    (96, [49, 40, 7]),
+    (240, [49, 40, 40, 40, 40, 31]),
+])
+def test_plan_chunks(total, expected):
+    chunks = plan_chunks(total, max_frames=49, overlap=9)
+    assert chunks == expected
+    assert sum(chunks) == total
+
+
+def test_plan_chunks_keeps_at_least_one_new_frame_per_chunk():
+    # Un solape >= max_frames no puede dejar trozos vacíos (bucle infinito)
+    assert plan_chunks(5, max_frames=2, overlap=10) == [2, 1, 1, 1]
+    assert plan_chunks(5, max_frames=3, overlap=0) == [3, 2]
+
+
+def test_conditioning_video_repeats_the_last_frame():
+    assert conditioning_video([1, 2, 3], 5) == [1, 2, 3, 3, 3]
+
+
+def test_fmp4_init_size_is_the_offset_of_the_first_moof(tmp_path):
+    path = tmp_path / "segment.mp4"
+    path.write_bytes(box(b"ftyp", 16) + box(b"moov", 100) + box(b"moof", 20) + box(b"mdat", 50) + box(b"moof", 4))
+    assert fmp4_init_size(str(path)) == 24 + 108
+
+
+def test_fmp4_init_size_without_fragments(tmp_path):
+    path = tmp_path / "plain.mp4"
+    path.write_bytes(box(b"ftyp", 16) + box(b"moov", 100) + box(b"mdat", 50))
+    with pytest.raises(ValueError, match="no moof"):
+        fmp4_init_size(str(path))
+
+
+def test_playlist_publishes_only_the_contiguous_prefix(tmp_path):
+    published = []
+    playlist = HlsPlaylist(fps=8, publish=lambda text: published.append(text) or f"url{len(published)}")
+    segments = []
+    for index in range(3):
+        path = tmp_path / f"seg{index}.mp4"
+        path.write_bytes(box(b"ftyp", 16) + box(b"moov", 40) + box(b"moof", 8) + box(b"mdat", 100 + index))
+        segments.append(str(path))
+
+    # El segundo termina antes que el primero: aún no se publica nada
+    assert playlist.add(1, "seg1.mp4", segments[1], frames=20) == 0
+    assert published == []
+    assert playlist.add(0, "seg0.mp4", segments[0], frames=16) == 2
+    assert playlist.add(2, "seg2.mp4", segments[2], frames=8) == 3
+    playlist.finish()
+
+    text = published[-1]
+    assert playlist.url == "url3"
+    assert "#EXT-X-TARGETDURATION:3" in text
+    assert text.count("#EXT-X-DISCONTINUITY") == 2
+    assert '#EXT-X-MAP:URI="seg0.mp4",BYTERANGE="72@0"' in text
+    assert "#EXTINF:2.000," in text and "#EXTINF:2.500," in text
+    assert "#EXT-X-BYTERANGE:124@72" in text
+    assert text.endswith("#EXT-X-ENDLIST\n")
+    assert "#EXT-X-ENDLIST" not in published[0]
+
+
+class RecordingPipeline:
+    """post_pipeline del engine: anota cada trozo en vez de post-procesarlo."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, job):
+        self.jobs.append(job)
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+@pytest.mark.parametrize("overlap, expected_overlap", [(3, 3), (0, 1), (20, 7)])
+def test_segmented_engine_keeps_the_frames_after_the_overlap(monkeypatch, tmp_path, overlap, expected_overlap):
+    pytest.importorskip("torch")
+    from app.services import ai_engine
+
+    max_frames = 8
+    monkeypatch.setattr(ai_engine, "T2V_MAX_FRAMES", max_frames)
+    monkeypatch.setattr(ai_engine, "SEGMENT_OVERLAP_FRAMES", overlap)
+    monkeypatch.setattr(ai_engine, "concat_segments", lambda paths, output: output)
+    conditionings = []
+
+    def diffuse_chunk(prompt, negative_prompt, generator, conditioning, steps, callback, progress):
+        # Cada frame es (trozo, posición); video-to-video devuelve tantos frames como su vídeo de entrada
+        conditionings.append(conditioning)
+        return [(len(conditionings) - 1, position) for position in range(max_frames)]
+
+    engine = object.__new__(ai_engine.AIEngine)
+    engine.output_dir = str(tmp_path)
+    engine.device_type = "cpu"
+    engine.post_pipeline = RecordingPipeline()
+    engine._diffuse_chunk = diffuse_chunk
+    engine.generate_segmented_text_to_video("a fox", num_frames=20, interpolation="off")
+
+    chunks = plan_chunks(20, max_frames, overlap)
+    outputs = [job["frames"] for job in engine.post_pipeline.jobs]
+    assert [len(output) for output in outputs] == chunks
+    assert outputs[0] == [(0, position) for position in range(chunks[0])]
+    for index, output in enumerate(outputs[1:], start=1):
+        assert output == [(index, expected_overlap + i) for i in range(chunks[index])]
+        # Se condiciona con los frames que preceden a lo que se quedó el trozo anterior, no con su relleno
+        end = (0 if index == 1 else expected_overlap) + chunks[index - 1]
+        tail = [(index - 1, position) for position in range(end - expected_overlap, end)]
+        assert conditionings[index] == conditioning_video(tail, max_frames)
@@ -0,0 +1,83 @@
+import pytest
+
+from app.routers import text_to_video
+from app.routers.text_to_video import GenerateRequest, run_pipeline, text_cache_key
+from app.services import progress
+
+
+class FakeEngine:
+    def __init__(self, error=None, shares_results=True):
+        self.error = error
+        self.shares_results = shares_results
+        self.calls = []
+
+    def generate_text_to_video(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        return "https://bucket/video.mp4"
+
+
+@pytest.fixture
+def notifications(monkeypatch):
+    sent = []
+    notify = lambda job_id, status, percent, **kwargs: sent.append((job_id, status))
+    monkeypatch.setattr(text_to_video, "notify_node_api", notify)
+    monkeypatch.setattr(progress, "notify_node_api", notify)
+    return sent
+
+
+def request(**kwargs):
+    return GenerateRequest(id="job-1", prompt="a cat surfing", **kwargs)
+
+
+@pytest.mark.parametrize("duration, fps, frames", [(4.0, 24, 96), (4.0, 8, 32), (2.5, 30, 75), (4.0, None, 96)])
+def test_requested_fps_reaches_the_engine(notifications, duration, fps, frames):
+    engine = FakeEngine()
+    assert run_pipeline("job-1", request(duration=duration, fps=fps), engine=engine) is None
+    call, = engine.calls
+    assert call["num_frames"] == frames
+    assert call["fps"] == (fps or 24)
+    # El progreso también pasa por el fixture: ningún webhook sale a la red
+    assert ("job-1", "processing") in notifications
+    assert notifications[-1] == ("job-1", "completed")
+
+
+def test_fps_changes_the_result_cache_key(monkeypatch):
+    monkeypatch.setattr(text_to_video, "RESULT_CACHE_ENABLED", True)
+    assert text_cache_key(request(seed=7, fps=24)) != text_cache_key(request(seed=7, fps=12))
+    assert text_cache_key(request(seed=7, fps=None)) == text_cache_key(request(seed=7, fps=24))
+
+
+def test_last_attempt_failure_is_reported_as_failed(notifications):
+    engine = FakeEngine(error=RuntimeError("CUDA out of memory"))
+    assert run_pipeline("job-1", request(), is_last_attempt=True, engine=engine) == "failed"
+    assert notifications[-1] == ("job-1", "failed")
+    with pytest.raises(RuntimeError):
+        run_pipeline("job-1", request(), is_last_attempt=False, engine=engine)
+
+
+class RecordingCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, url):
+        self.entries[key] = url
+
+
+@pytest.mark.parametrize("shares_results", [True, False])
+def test_cpu_profile_results_stay_out_of_the_shared_cache(notifications, monkeypatch, shares_results):
+    cache = RecordingCache()
+    monkeypatch.setattr(text_to_video, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(text_to_video, "get_result_cache", lambda: cache)
+    run_pipeline("job-1", request(seed=7), engine=FakeEngine(shares_results=shares_results))
+    assert bool(cache.entries) == shares_results
+
+    # Un engine CPU sí sirve lo que ya generó una GPU
+    cache.entries = {text_cache_key(request(seed=7)): "https://bucket/gpu.mp4"}
+    engine = FakeEngine(shares_results=False)
+    run_pipeline("job-2", request(seed=7), engine=engine)
+    assert engine.calls == []
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services.upscaler import BatchedUpscaler, UpscalerModel
+
+
+class RecordingUpscale(torch.nn.Module):
+    """x2 por vecino más cercano con una conv 1x1; anota el modo de autograd de cada llamada."""
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 3, 1)
+        torch.nn.init.dirac_(self.conv.weight)
+        torch.nn.init.zeros_(self.conv.bias)
+        self.grad_enabled = []
+
+    def forward(self, x):
+        self.grad_enabled.append(torch.is_grad_enabled())
+        return torch.nn.functional.interpolate(self.conv(x), scale_factor=2, mode="nearest")
+
+
+def upscaler(tile, cpu_workers):
+    model = RecordingUpscale()
+    return BatchedUpscaler(UpscalerModel(model, 2, False, torch.device("cpu")), batch_size=2, tile=tile,
+                           tile_pad=4, cpu_workers=cpu_workers), model
+
+
+def frames():
+    return np.random.default_rng(0).integers(0, 256, (3, 40, 56, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("cpu_workers", [1, 4])
+def test_tiles_run_without_autograd_and_match_the_whole_frame(cpu_workers):
+    whole, _ = upscaler(tile=0, cpu_workers=1)
+    tiled, model = upscaler(tile=16, cpu_workers=cpu_workers)
+    expected = whole.upscale(frames())
+    output = tiled.upscale(frames())
+
+    assert output.shape == (3, 80, 112, 3)
+    np.testing.assert_array_equal(output, expected)
+    np.testing.assert_array_equal(output[:, ::2, ::2], frames())
+    # 2 lotes x 4x3 tiles, ninguno con autograd (tampoco en los hilos del pool)
+    assert len(model.grad_enabled) == 24
+    assert not any(model.grad_enabled)
@@ -0,0 +1,63 @@
+import stat
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from app.services import video_encoder
+from app.services.video_encoder import encode_frames_streaming
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """"ffmpeg" que copia stdin a stdout: basta para ejercitar los pipes sin el binario real."""
+    script = tmp_path / "ffmpeg"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import shutil, sys\n"
+        "shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer, 1 << 16)\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(video_encoder, "FFMPEG_BIN", str(script))
+    monkeypatch.setattr(video_encoder, "_nvenc_available", False)
+
+
+def frames(count=64):
+    # 64 frames de 192 KB: mucho más que lo que cabe en el pipe de stdout
+    return (np.full((256, 256, 3), index, dtype=np.uint8) for index in range(count))
+
+
+def run_with_timeout(target, timeout=20):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = target()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "encode_frames_streaming hung"
+    return outcome
+
+
+def test_streams_everything_to_the_consumer(fake_ffmpeg):
+    outcome = run_with_timeout(lambda: encode_frames_streaming(frames(), lambda out: len(out.read()), 256, 256))
+    assert outcome["value"] == 64 * 256 * 256 * 3
+
+
+def test_failing_consumer_aborts_the_encoder(fake_ffmpeg):
+    def consume(out):
+        out.read(1024)
+        raise ConnectionError("upload failed")
+
+    outcome = run_with_timeout(lambda: encode_frames_streaming(frames(), consume, 256, 256))
+    assert isinstance(outcome["error"], ConnectionError)
+
+
+def test_consumer_that_stops_reading_early_does_not_block_the_encoder(fake_ffmpeg):
+    outcome = run_with_timeout(lambda: encode_frames_streaming(frames(), lambda out: out.read(10), 256, 256))
+    assert len(outcome["value"]) == 10
@@ -0,0 +1,49 @@
+import pytest
+
+from app import worker
+from app.services import job_queue
+from app.services.admission import ThroughputMeter
+from app.services.job_queue import Job, LocalJobQueue
+
+
+@pytest.fixture
+def meter(monkeypatch):
+    meter = ThroughputMeter()
+    monkeypatch.setattr(worker, "throughput_meter", meter)
+    monkeypatch.setattr(worker, "prefetch_next", lambda queue, engine=None: None)
+    monkeypatch.setattr(worker, "notify_node_api", lambda *args, **kwargs: None)
+    return meter
+
+
+def run(monkeypatch, outcome, attempts=0):
+    def handle_job(job, **kwargs):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(worker, "handle_job", handle_job)
+    queue = LocalJobQueue()
+    queue.enqueue(Job(id="a", kind="text", payload={}, attempts=attempts))
+    worker.process_job(queue, queue.dequeue(timeout=0))
+    return queue
+
+
+def test_completed_job_counts_towards_throughput(monkeypatch, meter):
+    queue = run(monkeypatch, None)
+    assert queue.status("a") == "completed"
+    assert meter.completed == 1
+
+
+def test_failed_job_is_acked_as_failed_and_not_counted(monkeypatch, meter):
+    # run_pipeline devuelve "failed" en el último intento (ya notificado)
+    queue = run(monkeypatch, "failed", attempts=job_queue.JOB_MAX_ATTEMPTS - 1)
+    assert queue.status("a") == "failed"
+    assert meter.completed == 0
+    assert meter.jobs_per_second() is None
+
+
+def test_retried_and_cancelled_jobs_are_not_counted(monkeypatch, meter):
+    assert run(monkeypatch, RuntimeError("boom")).status("a") == "queued"
+    assert run(monkeypatch, "cancelled").status("a") == "cancelled"
+    assert meter.completed == 0
+    assert meter.snapshot()["active"] == 0